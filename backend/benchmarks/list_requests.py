@@ -0,0 +1,81 @@
+"""Benchmark: latency of listing one service's requests vs. table size.
+
+Fills a throwaway database with captured requests spread over many services
+and times `load_requests` (one service) and a service delete (which cascades
+to its requests and their history) on the latest schema, with and without
+every index on `requests`.
+
+    uv run python benchmarks/list_requests.py [row counts...]
+"""
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from upguardian_backend.db import SCHEMA_VERSION, UpGuardianSQLiteDB, migrate
+from upguardian_backend.pool import PoolConfig, SQLitePool
+
+SERVICES = 200
+REPEATS = 20
+
+
+def _fill(conn, rows: int) -> None:
+    conn.executemany(
+        "INSERT INTO services(id, profile, name, old_endpoint, new_endpoint) VALUES(?, 'bench', ?, '', '')",
+        [(i, f"svc-{i}") for i in range(1, SERVICES + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO requests(service, endpoint, method, body) VALUES(?, ?, 'GET', ?)",
+        [(i % SERVICES + 1, f"/customers/{i}", '{"id": %d}' % i) for i in range(rows)],
+    )
+
+
+def _drop_request_indexes(conn) -> None:
+    # sql is NULL for the automatic indexes of constraints, which can't be dropped
+    names = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'requests' AND sql IS NOT NULL"
+    ).fetchall()
+    for (name,) in names:
+        conn.execute(f"DROP INDEX {name}")
+
+
+async def _measure(rows: int, indexed: bool) -> tuple[float, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = SQLitePool(PoolConfig(path=str(Path(tmp) / "bench.db")))
+        db = UpGuardianSQLiteDB(pool)
+        await pool.write(migrate)
+        if not indexed:
+            await pool.write(_drop_request_indexes)
+        await pool.write(lambda conn: _fill(conn, rows))
+
+        list_times = []
+        for i in range(REPEATS):
+            start = time.perf_counter()
+            await db.load_requests(i % SERVICES + 1)
+            list_times.append(time.perf_counter() - start)
+
+        delete_times = []
+        for i in range(REPEATS):
+            start = time.perf_counter()
+            await pool.write(lambda conn, s=i + 1: conn.execute("DELETE FROM services WHERE id = ?", (s,)))
+            delete_times.append(time.perf_counter() - start)
+
+        pool.close()
+        return statistics.median(list_times), statistics.median(delete_times)
+
+
+async def main(row_counts: list[int]) -> None:
+    print(f"schema v{SCHEMA_VERSION}")
+    print(f"{'rows':>9} {'indexes':>8} {'list p50 (ms)':>14} {'delete p50 (ms)':>16}")
+    for rows in row_counts:
+        for indexed in (False, True):
+            list_p50, delete_p50 = await _measure(rows, indexed)
+            label = "yes" if indexed else "no"
+            print(f"{rows:>9} {label:>8} {list_p50 * 1000:>14.3f} {delete_p50 * 1000:>16.3f}")
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000, 300_000]
+    asyncio.run(main(counts))
@@ -1,26 +1,161 @@
+import argparse
 import asyncio
+import json
 import sys
 
 import uvicorn
 
-from .main import init_db, run_tests_helper
+from .bulk import FORMATS, export_requests, guess_format, import_requests, iter_file
+from .diffpool import close_diff_pool
+from .loadtest import LoadTestConfig, filter_methods, run_load_test
+from .main import MAX_LATENCY_SAMPLES, init_db, init_replay_engine, run_many_helper
+from .nemotron import close_nemotron_client
+from .report import combined_report, exit_code, junit_xml
 
-async def cli_main(service_id: int) -> int:
-    thingy = await run_tests_helper(
-        service_id,
-        db_manager=init_db()
+def parse_cli_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="upguardian-backend cli",
+        description="Run the stored test suites of one or more services.",
     )
-    print(thingy)
+    parser.add_argument("service_ids", nargs="*", type=int, help="ids of the services to run")
+    parser.add_argument("--profile", help="run every service of this profile")
+    parser.add_argument("--parallel", type=int, default=4, help="max services running at once")
+    parser.add_argument("--json", dest="json_path", help="write the combined JSON report here")
+    parser.add_argument("--junit", dest="junit_path", help="write a JUnit XML report here")
+    parser.add_argument("--samples", type=int, default=1, help="latency samples per GET/HEAD/OPTIONS request and side")
+    parser.add_argument("--fail-on-latency", action="store_true", help="fail services with latency regressions")
+    parser.add_argument(
+        "--full", action="store_true", help="replay every request, not only new, changed or previously failing ones"
+    )
+    args = parser.parse_args(argv)
+    if not args.service_ids and not args.profile:
+        parser.error("give service ids and/or --profile")
+    if not 1 <= args.samples <= MAX_LATENCY_SAMPLES:
+        parser.error(f"--samples must be between 1 and {MAX_LATENCY_SAMPLES}")
+    return args
+
+async def cli_main(args: argparse.Namespace) -> int:
+    db_manager = init_db()
+    try:
+        services = await db_manager.load_services(args.profile) if args.profile else []
+        found = {svc.id for svc in services}
+        by_id = await db_manager.load_services_by_id([i for i in args.service_ids if i not in found])
+        services += by_id
+        found |= {svc.id for svc in by_id}
+        missing = [i for i in args.service_ids if i not in found]
+
+        suites = await run_many_helper(
+            db_manager,
+            services,
+            parallel=args.parallel,
+            samples=args.samples,
+            fail_on_latency=args.fail_on_latency,
+            incremental=not args.full,
+        )
+    finally:
+        await close_nemotron_client()
+        close_diff_pool()
+        db_manager.close()
+
+    report = combined_report(suites, missing)
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.junit_path:
+        with open(args.junit_path, "w") as f:
+            f.write(junit_xml(suites, missing))
+
+    return exit_code(suites, missing)
+
+def parse_transfer_args(command: str, argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"upguardian-backend {command}",
+        description="Bulk-import captured requests into a service." if command == "import"
+        else "Export a service's stored requests.",
+    )
+    parser.add_argument("service_id", type=int, help="id of the service")
+    if command == "import":
+        parser.add_argument("path", help="HAR or NDJSON file to import")
+        parser.add_argument("--format", choices=FORMATS, help="input format (default: from the file extension)")
+    else:
+        parser.add_argument("--format", choices=FORMATS, default="ndjson", help="output format")
+        parser.add_argument("--output", "-o", help="write here instead of stdout")
+    return parser.parse_args(argv)
+
+async def transfer_main(command: str, args: argparse.Namespace) -> int:
+    db_manager = init_db()
+    try:
+        service = await db_manager.load_service(args.service_id)
+        if not service:
+            print(f"service {args.service_id} not found", file=sys.stderr)
+            return 1
+        if command == "import":
+            fmt = args.format or guess_format(args.path)
+            report = await import_requests(db_manager, service, iter_file(args.path), fmt)
+            print(json.dumps(report, indent=2))
+            return 0
+        out = open(args.output, "w") if args.output else sys.stdout
+        try:
+            async for chunk in export_requests(db_manager, service, args.format):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+        return 0
+    finally:
+        db_manager.close()
+
+def parse_loadtest_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="upguardian-backend loadtest",
+        description="Load-test a service's old and new endpoint side by side with its stored requests.",
+    )
+    parser.add_argument("service_id", type=int, help="id of the service")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to drive each side")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rps", type=float, help="open loop: requests per second per side")
+    mode.add_argument("--concurrency", type=int, help="closed loop: concurrent workers per side")
+    parser.add_argument("--methods", help="only send these methods, e.g. GET,HEAD")
+    parser.add_argument("--json", dest="json_path", help="also write the report here")
+    args = parser.parse_args(argv)
+    try:
+        args.config = LoadTestConfig(duration=args.duration, rps=args.rps, concurrency=args.concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
-    if False in thingy["response_statuses"]:
-        return 1
+async def loadtest_main(args: argparse.Namespace) -> int:
+    db_manager = init_db()
+    engine = init_replay_engine()
+    try:
+        service = await db_manager.load_service(args.service_id)
+        if not service:
+            print(f"service {args.service_id} not found", file=sys.stderr)
+            return 1
+        requests = filter_methods(await db_manager.load_requests(service.id, include_skipped=False), args.methods)
+        if not requests:
+            print("no requests to replay", file=sys.stderr)
+            return 1
+        report = await run_load_test(engine, service, requests, args.config)
+    finally:
+        await engine.aclose()
+        db_manager.close()
 
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
     return 0
 
 def main()-> int:
-    if sys.argv[1] == 'cli':
-        service_id = int(sys.argv[2])
-        return asyncio.run(cli_main(service_id))
+    if sys.argv[1:2] == ['cli']:
+        return asyncio.run(cli_main(parse_cli_args(sys.argv[2:])))
+    elif sys.argv[1:2] == ['loadtest']:
+        return asyncio.run(loadtest_main(parse_loadtest_args(sys.argv[2:])))
+    elif sys.argv[1:2] in (['import'], ['export']):
+        command = sys.argv[1]
+        return asyncio.run(transfer_main(command, parse_transfer_args(command, sys.argv[2:])))
     else:
         uvicorn.run('upguardian_backend.main:app', port=8000)
         return 0
@@ -4,9 +4,10 @@ from typing import Any, Dict
 import jwt
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jwt import InvalidTokenError, PyJWKClient
+from jwt import InvalidTokenError
 from starlette import status
 
+from .jwks import JwksCache, VerifiedTokenCache
 from .main import app, AUTH0_DOMAIN
 
 API_AUDIENCE = os.getenv("API_AUDIENCE", "")
@@ -20,31 +21,45 @@ bearer_scheme = HTTPBearer()
 
 # (Auth0/JWT code temporarily ignored per user request.)
 
-def _get_jwks_client_cached() -> PyJWKClient:
-    client = getattr(app.state, "jwks_client", None)
-    if client:
-        return client
+def _get_jwks_cache() -> JwksCache:
+    cache = getattr(app.state, "jwks_cache", None)
+    if cache:
+        return cache
     if not AUTH0_DOMAIN:
         raise RuntimeError("AUTH0_DOMAIN not configured; cannot fetch JWKS")
     jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-    client = PyJWKClient(jwks_url)
-    app.state.jwks_client = client
-    return client
+    cache = JwksCache(jwks_url)
+    app.state.jwks_cache = cache
+    return cache
 
 
-def verify_jwt(
+def _get_token_cache() -> VerifiedTokenCache:
+    cache = getattr(app.state, "token_cache", None)
+    if cache is None:
+        cache = app.state.token_cache = VerifiedTokenCache()
+    return cache
+
+
+async def verify_jwt(
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
 ) -> Dict[str, Any]:
     """Verify an incoming JWT using Auth0's JWKS and return the token payload.
 
     Use as a dependency via FastAPI's Security(...) to protect endpoints.
+    Tokens seen before are answered from a cache until they expire, so the
+    signature is only checked once per token.
     """
     token = credentials.credentials
-    # Use PyJWKClient to obtain the signing key for this token. This avoids
-    # assuming RSA or converting to PEM; PyJWT handles the JWK types.
+    token_cache = _get_token_cache()
+    payload = token_cache.get(token)
+    if payload is not None:
+        return dict(payload)
+
+    # The JWKS cache fetches keys asynchronously and keeps them, so this only
+    # waits on the network for the first token or a rotated key.
     try:
-        client = _get_jwks_client_cached()
-        signing_key = client.get_signing_key_from_jwt(token)
+        kid = jwt.get_unverified_header(token).get("kid")
+        signing_key = await _get_jwks_cache().get_signing_key(kid)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,17 +69,17 @@ def verify_jwt(
     issuer = f"https://{AUTH0_DOMAIN}/" if AUTH0_DOMAIN else None
 
     try:
-        # Pass the signing key object via the signing_key parameter to jwt.decode
         payload = jwt.decode(
             token,
-            signing_key=signing_key.key,
+            key=signing_key.key,
             algorithms=ALGORITHMS,
             audience=API_AUDIENCE or None,
             issuer=issuer,
         )
-        return payload
     except InvalidTokenError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token validation error: {str(e)}",
-        )
\ No newline at end of file
+        )
+    token_cache.put(token, payload)
+    return dict(payload)
@@ -0,0 +1,375 @@
+import json
+import re
+import time
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .service import ServiceRow
+
+if TYPE_CHECKING:
+    from .db import UpGuardianSQLiteDB
+
+# Imported requests are inserted this many rows per transaction.
+IMPORT_BATCH_SIZE = 1000
+
+# At most this many per-entry errors are returned in an import report.
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = ("ndjson", "har")
+
+# A HAR entry or NDJSON line still incomplete after this many characters is
+# reported as an error, so input that never ends one can't be buffered whole.
+HAR_MAX_ENTRY_CHARS = 32 * 1024 * 1024
+NDJSON_MAX_LINE_CHARS = 32 * 1024 * 1024
+
+_ENTRIES_RE = re.compile(r'"entries"\s*:\s*\[')
+_STRUCTURE_RE = re.compile(r'["{}\[\],]')
+_STRING_RE = re.compile(r'["\\]')
+_WS = " \t\r\n"
+
+
+class NdjsonDecoder:
+    """Incremental decoder for newline-delimited JSON.
+
+    Feed it text in arbitrary chunks; every complete line comes back as one
+    decoded value. Blank lines are skipped. A line longer than
+    NDJSON_MAX_LINE_CHARS is reported as an error and dropped.
+    """
+
+    def __init__(self):
+        # the unfinished last line, in the pieces it arrived in
+        self._parts: List[str] = []
+        self._size = 0
+        self._overflow = False
+        self.line = 0
+
+    def feed(self, text: str) -> List[Tuple[int, object]]:
+        """Return (line number, value) for each line completed by `text`.
+        A line that isn't valid JSON yields its ValueError as the value.
+        """
+        if self._overflow:
+            # rest of a line that was too long
+            newline = text.find("\n")
+            if newline < 0:
+                return []
+            self._overflow = False
+            text = text[newline + 1:]
+        *lines, rest = text.split("\n")
+        if lines:
+            lines[0] = "".join(self._parts) + lines[0]
+            self._parts, self._size = [], 0
+        items = [item for item in map(self._decode, lines) if item is not None]
+        self._parts.append(rest)
+        self._size += len(rest)
+        if self._size > NDJSON_MAX_LINE_CHARS:
+            self._parts, self._size = [], 0
+            self._overflow = True
+            self.line += 1
+            items.append((self.line, ValueError(f"line exceeds {NDJSON_MAX_LINE_CHARS} characters")))
+        return items
+
+    def close(self) -> List[Tuple[int, object]]:
+        if self._overflow:
+            return []
+        rest, self._parts = "".join(self._parts), []
+        item = self._decode(rest)
+        return [item] if item is not None else []
+
+    def _decode(self, line: str) -> Optional[Tuple[int, object]]:
+        self.line += 1
+        if not line.strip():
+            return None
+        try:
+            return self.line, json.loads(line)
+        except ValueError as e:
+            return self.line, e
+
+
+class HarDecoder:
+    """Incremental decoder for the `log.entries` array of a HAR file.
+
+    A HAR file is one JSON document, so it can't be split on lines; instead
+    each entry is decoded with `raw_decode` as soon as it is fully buffered,
+    and everything before the entries array is skipped. Only the current
+    entry is held in memory. A malformed entry is reported and skipped; an
+    entry that doesn't end within HAR_MAX_ENTRY_CHARS stops decoding.
+
+    An incomplete entry isn't decoded again per chunk: its pieces are kept
+    and only new text is scanned for where it ends, so a large entry costs
+    time linear in its size.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._in_entries = False
+        self._done = False
+        # the incomplete entry's pieces and _value_end state, if any
+        self._parts: List[str] = []
+        self._size = 0
+        self._scan: Optional[tuple] = None
+        self.entry = 0
+
+    def feed(self, text: str) -> List[Tuple[int, object]]:
+        """Return (entry number, entry) for each entry completed by `text`."""
+        if self._done:
+            return []
+        if self._scan is not None:
+            end, self._scan = _value_end(text, 0, self._scan)
+            if end is None:
+                self._parts.append(text)
+                self._size += len(text)
+                return self._check_size()
+            # the entry is complete; decode it (and what follows) below
+            self._buffer, self._parts, self._size = "".join(self._parts) + text, [], 0
+        else:
+            self._buffer += text
+        if not self._in_entries:
+            match = _ENTRIES_RE.search(self._buffer)
+            if match is None:
+                # keep enough of the tail to match a key split across chunks
+                self._buffer = self._buffer[-64:]
+                return []
+            self._buffer = self._buffer[match.end():]
+            self._in_entries = True
+
+        buffer, items = self._buffer, []
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WS + ",":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._done = True
+                break
+            try:
+                entry, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                end, scan = _value_end(buffer, pos)
+                if end is None:
+                    # incomplete entry; wait for more input
+                    self._parts, self._size, self._scan = [buffer[pos:]], len(buffer) - pos, scan
+                    pos = len(buffer)
+                    items.extend(self._check_size())
+                    break
+                entry = ValueError(f"malformed entry: {e.msg}")
+                # a stray closing bracket is stepped over on its own
+                end = max(end, pos + 1)
+            self.entry += 1
+            items.append((self.entry, entry))
+            pos = end
+        self._buffer = "" if self._done else buffer[pos:]
+        return items
+
+    def _check_size(self) -> List[Tuple[int, object]]:
+        if self._size <= HAR_MAX_ENTRY_CHARS:
+            return []
+        self._done = True
+        self._parts, self._size, self._scan = [], 0, None
+        self.entry += 1
+        return [(self.entry, ValueError(f"entry exceeds {HAR_MAX_ENTRY_CHARS} characters"))]
+
+    def close(self) -> List[Tuple[int, object]]:
+        if not self._done:
+            self.entry += 1
+            reason = "no log.entries array found" if not self._in_entries else "truncated entries array"
+            return [(self.entry, ValueError(reason))]
+        return []
+
+
+def _value_end(text: str, pos: int, state: tuple = (0, False, 0)) -> Tuple[Optional[int], Optional[tuple]]:
+    """Where the JSON value starting at `pos` ends, judged by brackets and
+    strings alone. Used to step over an entry that didn't decode.
+
+    Returns (end, None), or (None, state) if `text` ends first; passing
+    that state with the next piece of text (from 0) resumes the scan.
+    """
+    depth, in_string, skip = state
+    i, size = pos + skip, len(text)
+    while i < size:
+        if in_string:
+            match = _STRING_RE.search(text, i)
+            if match is None:
+                i = size
+                break
+            if match.group() == "\\":
+                # skip the escaped character, which may be in the next piece
+                i = match.end() + 1
+            else:
+                in_string, i = False, match.end()
+            continue
+        match = _STRUCTURE_RE.search(text, i)
+        if match is None:
+            i = size
+            break
+        char, i = match.group(), match.end()
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            if depth == 0:
+                return i - 1, None
+            depth -= 1
+            if depth == 0:
+                return i, None
+        elif depth == 0:
+            return i - 1, None
+    return None, (depth, in_string, i - size)
+
+
+def make_decoder(format: str):
+    if format == "har":
+        return HarDecoder()
+    if format == "ndjson":
+        return NdjsonDecoder()
+    raise ValueError(f"unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+
+
+def endpoint_from_url(url: str, service: ServiceRow) -> str:
+    """The part of a captured URL that gets appended to a service's old and
+    new endpoints: the URL minus whichever of them it starts with, or else
+    just its path and query.
+    """
+    for base in (service.old_endpoint, service.new_endpoint):
+        if base and url.startswith(base.rstrip("/")):
+            return url[len(base.rstrip("/")):] or "/"
+    parts = urlsplit(url)
+    return (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+
+def ndjson_row(item: object) -> Tuple[str, str, Optional[str]]:
+    """(endpoint, method, body) from an NDJSON record, the same shape that
+    `POST /services/{id}/requests` accepts and the export produces.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("expected a JSON object")
+    endpoint, method, body = item.get("endpoint"), item.get("method"), item.get("body")
+    if not isinstance(endpoint, str) or not isinstance(method, str):
+        raise ValueError("endpoint and method are required")
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    return endpoint, method.upper(), body
+
+
+def har_row(entry: object, service: ServiceRow) -> Tuple[str, str, Optional[str]]:
+    """(endpoint, method, body) from a HAR entry's request."""
+    request = entry.get("request") if isinstance(entry, dict) else None
+    if not isinstance(request, dict):
+        raise ValueError("entry has no request url/method")
+    url, method = request.get("url"), request.get("method")
+    if not isinstance(url, str) or not isinstance(method, str) or not url or not method:
+        raise ValueError("entry has no request url/method")
+    post_data = request.get("postData") or {}
+    if not isinstance(post_data, dict):
+        raise ValueError("entry postData is not an object")
+    body = post_data.get("text") or None
+    if body is not None and not isinstance(body, str):
+        raise ValueError("entry postData.text is not a string")
+    return endpoint_from_url(url, service), method.upper(), body
+
+
+async def import_requests(
+    db_manager: "UpGuardianSQLiteDB",
+    service: ServiceRow,
+    chunks: AsyncIterable[str],
+    format: str = "ndjson",
+) -> dict:
+    """Stream HAR or NDJSON text into a service's stored requests.
+
+    Input is decoded as it arrives and inserted in transactions of
+    IMPORT_BATCH_SIZE rows, so memory use doesn't grow with the input.
+    Entries that can't be read are skipped and reported. Returns counts and
+    throughput.
+    """
+    decoder = make_decoder(format)
+    started = time.perf_counter()
+    batch: List[Tuple[str, str, Optional[str]]] = []
+    imported = skipped = 0
+    errors: List[dict] = []
+
+    async def _flush() -> None:
+        nonlocal batch, imported
+        rows, batch = batch, []
+        if rows:
+            imported += await db_manager.insert_requests(service.id, rows)
+
+    async def _take(items) -> None:
+        nonlocal skipped
+        for number, item in items:
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                batch.append(har_row(item, service) if format == "har" else ndjson_row(item))
+            except ValueError as e:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"entry": number, "error": str(e)})
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _flush()
+
+    async for chunk in chunks:
+        await _take(decoder.feed(chunk))
+    await _take(decoder.close())
+    await _flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "service_id": service.id,
+        "format": format,
+        "imported": imported,
+        "skipped": skipped,
+        "errors": errors,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "requests_per_second": round(imported / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+async def export_requests(
+    db_manager: "UpGuardianSQLiteDB",
+    service: ServiceRow,
+    format: str = "ndjson",
+) -> AsyncIterator[str]:
+    """Yield a service's stored requests as NDJSON lines or as a HAR file,
+    reading them from the database a page at a time.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+    requests = db_manager.iter_requests(service.id)
+    if format == "ndjson":
+        async for request in requests:
+            yield json.dumps({"endpoint": request.endpoint, "method": request.method, "body": request.body}) + "\n"
+        return
+
+    yield '{"log":{"version":"1.2","creator":{"name":"upguardian","version":"0.1.0"},"entries":['
+    first = True
+    base = (service.old_endpoint or "").rstrip("/")
+    async for request in requests:
+        har_request = {
+            "method": request.method,
+            "url": base + request.endpoint,
+            "httpVersion": "HTTP/1.1",
+            "headers": [],
+            "queryString": [],
+            "cookies": [],
+            "headersSize": -1,
+            "bodySize": len(request.body.encode()) if request.body is not None else 0,
+        }
+        if request.body is not None:
+            har_request["postData"] = {"mimeType": "application/json", "text": request.body}
+        entry = {"startedDateTime": "1970-01-01T00:00:00.000Z", "time": 0, "request": har_request}
+        yield ("\n" if first else ",\n") + json.dumps(entry)
+        first = False
+    yield "\n]}}\n"
+
+
+async def iter_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[str]:
+    """Read a text file in chunks (for the CLI import)."""
+    with open(path, encoding="utf-8") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def guess_format(path: str) -> str:
+    return "har" if path.lower().endswith(".har") else "ndjson"
@@ -1,68 +1,285 @@
-import asyncio
 import sqlite3
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple
 
-from .service import Service
-from .request import Request
+from .history import RunHistory
+from .pool import SQLitePool
+from .readcache import ReadCache
+from .schema import SchemaStore
+from .service import Service, ServiceRow
+from .request import Request, RequestRow
+from .verdicts import VerdictCache
+
+SERVICE_COLUMNS = "id, profile, name, old_endpoint, new_endpoint"
+REQUEST_COLUMNS = "id, service, endpoint, method, body, skipped"
+
+# Fields the listing endpoints can project, in response order
+SERVICE_FIELDS = ("id", "name", "old_endpoint", "new_endpoint")
+REQUEST_FIELDS = ("id", "service", "endpoint", "method", "body", "skipped")
+
+
+# --- Schema migrations --------------------------------------------------
+# Each migration moves the schema up by one version; `PRAGMA user_version`
+# records the version a database file is at, so every migration runs exactly
+# once per file. Append new migrations to MIGRATIONS and never edit or reorder
+# the existing ones -- change the schema with ALTER TABLE / CREATE INDEX or a
+# copy-and-swap of the table so stored data is kept.
+
+def _migration_base_tables(conn: sqlite3.Connection) -> None:
+    # Create required tables if they don't exist. Use a composite primary
+    # key (profile, id) since service ids are only unique within a profile.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS services (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile TEXT,
+            name TEXT,
+            old_endpoint TEXT,
+            new_endpoint TEXT,
+            UNIQUE(profile, name)
+        )
+        """
+    )
+    # Requests table stores individual HTTP requests tied to a service
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service INTEGER NOT NULL,
+            endpoint TEXT NOT NULL,
+            method TEXT NOT NULL,
+            body TEXT,
+            FOREIGN KEY(service) REFERENCES services(id) ON DELETE CASCADE
+        )
+        """
+    )
+
+
+def _migration_request_indexes(conn: sqlite3.Connection) -> None:
+    # Lookups of a service's requests and the ON DELETE CASCADE from services
+    # both filter on requests.service.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_service ON requests(service)")
+    # Covering index for listing: walks one service's requests in id order
+    # and answers id/method/endpoint without touching the table rows.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_requests_listing ON requests(service, id, method, endpoint)"
+    )
+
+
+def _migration_verdicts(conn: sqlite3.Connection) -> None:
+    # Cached model verdicts, keyed by the fingerprint of a response schema diff
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS verdicts (
+            fingerprint TEXT PRIMARY KEY,
+            unimportant_keys TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _migration_run_history(conn: sqlite3.Connection) -> None:
+    # One row per test run of a service
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            total INTEGER NOT NULL,
+            passed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(service) REFERENCES services(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_service ON runs(service, id)")
+    # Per-request outcome of a run; body1/body2 are hashes into `bodies`
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS run_results (
+            run INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            request INTEGER,
+            method TEXT,
+            endpoint TEXT,
+            passed INTEGER NOT NULL,
+            error TEXT,
+            elapsed_ms REAL,
+            diff TEXT,
+            body1 TEXT,
+            body2 TEXT,
+            PRIMARY KEY(run, idx),
+            FOREIGN KEY(run) REFERENCES runs(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+    )
+    # Content-addressed, zlib-compressed response bodies
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bodies (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _migration_request_skipped(conn: sqlite3.Connection) -> None:
+    # Requests left out of runs by suite reduction (see reduction.py)
+    conn.execute("ALTER TABLE requests ADD COLUMN skipped INTEGER NOT NULL DEFAULT 0")
+
+
+def _migration_result_timing(conn: sqlite3.Connection) -> None:
+    # Connect/TTFB/total of the old and new call, as JSON
+    conn.execute("ALTER TABLE run_results ADD COLUMN timing TEXT")
+
+
+def _migration_listing_indexes(conn: sqlite3.Connection) -> None:
+    # Keyset pages of a profile's services, and of a service's requests
+    # filtered by method, both walk the index in id order.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_services_profile ON services(profile, id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_requests_method ON requests(service, method COLLATE NOCASE, id)"
+    )
+
+
+def _migration_request_verdicts(conn: sqlite3.Connection) -> None:
+    # Last verdict of each request against an old/new endpoint pair, with
+    # the hash of the request content it was made for; incremental runs
+    # only replay requests that changed or didn't pass last time.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS request_verdicts (
+            request INTEGER NOT NULL,
+            pair TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            passed INTEGER NOT NULL,
+            run INTEGER NOT NULL,
+            PRIMARY KEY(request, pair),
+            FOREIGN KEY(request) REFERENCES requests(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _migration_schemas(conn: sqlite3.Connection) -> None:
+    # Response signatures inferred per route and side (see schema.py)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schemas (
+            service INTEGER NOT NULL,
+            pair TEXT NOT NULL,
+            method TEXT NOT NULL,
+            route TEXT NOT NULL,
+            side TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY(service, pair, method, route, side),
+            FOREIGN KEY(service) REFERENCES services(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _migration_endpoint_index(conn: sqlite3.Connection) -> None:
+    # Pages of a service's requests filtered by endpoint prefix: a range
+    # scan over (service, endpoint).
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_endpoint ON requests(service, endpoint, id)")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_base_tables,
+    _migration_request_indexes,
+    _migration_verdicts,
+    _migration_run_history,
+    _migration_request_skipped,
+    _migration_result_timing,
+    _migration_listing_indexes,
+    _migration_request_verdicts,
+    _migration_schemas,
+    _migration_endpoint_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to `target` (default: latest) and return
+    the resulting schema version.
+
+    Must run inside a transaction (e.g. as a SQLitePool write) so that a
+    failing migration leaves both the schema and user_version untouched.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number in range(version, target):
+        MIGRATIONS[number](conn)
+        conn.execute(f"PRAGMA user_version = {number + 1}")
+    return max(version, target)
+
+
+def _prefix_end(prefix: str) -> Optional[str]:
+    """The smallest string above every string starting with `prefix`, or
+    None if there is none (the prefix is all U+10FFFF).
+    """
+    stripped = prefix.rstrip(chr(0x10FFFF))
+    if not stripped:
+        return None
+    return stripped[:-1] + chr(ord(stripped[-1]) + 1)
 
 
 class UpGuardianSQLiteDB:
     """Encapsulates sqlite3 access and provides async helpers.
 
+        All access goes through a SQLitePool: reads run on per-thread reader
+        connections and writes are queued to a single writer connection.
+
         The DB stores a `services` table with columns: id (INTEGER PK), profile, name,
         old_endpoint and new_endpoint. Services are unique per (profile, name).
     """
 
-    def __init__(self, conn: sqlite3.Connection):
-        self._conn = conn
+    def __init__(self, pool: SQLitePool):
+        self._pool = pool
+        # Model verdicts for response diffs, shared by every run using this DB
+        self.verdicts = VerdictCache(pool)
+        # Stored test runs and their per-request results
+        self.history = RunHistory(pool)
+        # Response signatures per route, for schema-level comparison
+        self.schemas = SchemaStore(pool)
+        # Cached service/request reads; every write to those tables must
+        # invalidate it (Service and Request get it for their setters)
+        self.cache = ReadCache()
+
+    def close(self) -> None:
+        self._pool.close()
 
     def ensure_tables(self) -> None:
-        # Create required tables if they don't exist. Use a composite primary
-        # key (profile, id) since service ids are only unique within a profile.
-        self._conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS services (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                profile TEXT,
-                name TEXT,
-                old_endpoint TEXT,
-                new_endpoint TEXT,
-                UNIQUE(profile, name)
-            )
-            """
-        )
-        # Requests table stores individual HTTP requests tied to a service
-        self._conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                service INTEGER NOT NULL,
-                endpoint TEXT NOT NULL,
-                method TEXT NOT NULL,
-                body TEXT,
-                FOREIGN KEY(service) REFERENCES services(id) ON DELETE CASCADE
-            )
-            """
-        )
-        self._conn.commit()
+        """Create the schema if needed and apply any pending migrations."""
+        self._pool.write_sync(migrate)
 
     async def getServices(self, profile: Optional[str] = None) -> List[Service]:
         """Return a list of Service objects. If profile is provided, return
         only services belonging to that profile; otherwise return all.
         """
 
-        def _fetch():
+        def _fetch(conn):
             if profile is None:
-                cur = self._conn.execute("SELECT id, name, profile FROM services")
+                cur = conn.execute("SELECT id, name, profile FROM services")
                 return cur.fetchall()
             else:
-                cur = self._conn.execute(
+                cur = conn.execute(
                     "SELECT id, name, profile FROM services WHERE profile = ?", (profile,)
                 )
                 return cur.fetchall()
 
-        rows = await asyncio.to_thread(_fetch)
-        return [Service(self._conn, id, name, prof) for id, name, prof in rows]
+        rows = await self._pool.read(_fetch)
+        return [Service(self._pool, id, name, prof, cache=self.cache) for id, name, prof in rows]
 
     async def createService(self, profile: Optional[str], name: str, old_endpoint: Optional[str] = None, new_endpoint: Optional[str] = None) -> Service:
         """Create or update a service row (by profile+name) and return a Service.
@@ -70,74 +287,269 @@ class UpGuardianSQLiteDB:
         Returns a Service instance with the integer primary key `id`.
         """
 
-        def _upsert():
+        def _upsert(conn):
             # Try update first; set both endpoint columns (may be NULL)
-            cur = self._conn.execute(
+            cur = conn.execute(
                 "UPDATE services SET old_endpoint = ?, new_endpoint = ? WHERE profile IS ? AND name = ?",
                 (old_endpoint, new_endpoint, profile, name),
             )
             rowid = None
             if cur.rowcount == 0:
-                ins = self._conn.execute(
+                ins = conn.execute(
                     "INSERT INTO services(profile, name, old_endpoint, new_endpoint) VALUES(?, ?, ?, ?)",
                     (profile, name, old_endpoint, new_endpoint),
                 )
                 rowid = ins.lastrowid
             else:
-                row = self._conn.execute(
+                row = conn.execute(
                     "SELECT id FROM services WHERE profile IS ? AND name = ?",
                     (profile, name),
                 ).fetchone()
                 rowid = int(row[0]) if row else None
-            self._conn.commit()
             return rowid
 
-        rowid = await asyncio.to_thread(_upsert)
+        rowid = await self._pool.write(_upsert)
+        self.cache.invalidate("services")
         if rowid is None:
             raise RuntimeError("Failed to create or locate service row")
-        return Service(self._conn, rowid, name, profile)
+        return Service(self._pool, rowid, name, profile, cache=self.cache)
+
+    # --- Bulk hydration ----------------------------------------------
+    # These load whole rows in one query into immutable row objects, instead
+    # of one SELECT (and one thread hop) per field through Service/Request.
+    # Service reads and listing pages go through the read cache; callers
+    # must not modify what they get back.
+    async def load_service(self, service_id: int) -> Optional[ServiceRow]:
+        def _get(conn):
+            cur = conn.execute(f"SELECT {SERVICE_COLUMNS} FROM services WHERE id = ?", (service_id,))
+            return cur.fetchone()
+
+        async def _load():
+            row = await self._pool.read(_get)
+            return ServiceRow(*row) if row else None
+
+        return await self.cache.get_or_load(("services",), ("service", service_id), _load)
+
+    async def load_services(self, profile: Optional[str] = None) -> List[ServiceRow]:
+        """Load all services (optionally only those of `profile`) in one query."""
+
+        def _fetch(conn):
+            if profile is None:
+                cur = conn.execute(f"SELECT {SERVICE_COLUMNS} FROM services ORDER BY id")
+            else:
+                cur = conn.execute(
+                    f"SELECT {SERVICE_COLUMNS} FROM services WHERE profile = ? ORDER BY id", (profile,)
+                )
+            return cur.fetchall()
+
+        async def _load():
+            return [ServiceRow(*row) for row in await self._pool.read(_fetch)]
+
+        return await self.cache.get_or_load(("services",), ("services", profile), _load)
+
+    async def load_services_by_id(self, service_ids: List[int]) -> List[ServiceRow]:
+        """Load the given services in one query, in the order of `service_ids`.
+        Unknown ids are skipped.
+        """
+
+        def _fetch(conn):
+            placeholders = ", ".join("?" * len(service_ids))
+            cur = conn.execute(f"SELECT {SERVICE_COLUMNS} FROM services WHERE id IN ({placeholders})", service_ids)
+            return cur.fetchall()
+
+        if not service_ids:
+            return []
+        rows = {row[0]: ServiceRow(*row) for row in await self._pool.read(_fetch)}
+        return [rows[i] for i in dict.fromkeys(service_ids) if i in rows]
+
+    async def load_requests(self, service_id: int, include_skipped: bool = True) -> List[RequestRow]:
+        """Load all requests of a service in one query, ordered by id.
+        Runs pass `include_skipped=False` to leave out requests that suite
+        reduction marked as skipped.
+        """
+
+        def _fetch(conn):
+            query = f"SELECT {REQUEST_COLUMNS} FROM requests WHERE service = ?"
+            if not include_skipped:
+                query += " AND skipped = 0"
+            cur = conn.execute(query + " ORDER BY id", (service_id,))
+            return cur.fetchall()
+
+        rows = await self._pool.read(_fetch)
+        return [RequestRow(*row) for row in rows]
+
+    async def iter_requests(self, service_id: int, page_size: int = 1000) -> AsyncIterator[RequestRow]:
+        """Yield all requests of a service ordered by id, reading one page
+        at a time (keyset on id) so large suites aren't loaded at once.
+        """
+        after = 0
+
+        def _fetch(conn):
+            cur = conn.execute(
+                f"SELECT {REQUEST_COLUMNS} FROM requests WHERE service = ? AND id > ? ORDER BY id LIMIT ?",
+                (service_id, after, page_size),
+            )
+            return cur.fetchall()
+
+        while rows := await self._pool.read(_fetch):
+            for row in rows:
+                yield RequestRow(*row)
+            after = rows[-1][0]
+
+    async def insert_requests(self, service_id: int, rows: List[Tuple[str, str, Optional[str]]]) -> int:
+        """Insert many (endpoint, method, body) rows in one transaction."""
+
+        def _insert(conn):
+            conn.executemany(
+                "INSERT INTO requests(service, endpoint, method, body) VALUES(?, ?, ?, ?)",
+                [(service_id, endpoint, method, body) for endpoint, method, body in rows],
+            )
+            return len(rows)
+
+        inserted = await self._pool.write(_insert)
+        self.cache.invalidate("requests")
+        return inserted
+
+    async def set_skipped(self, service_id: int, skipped_ids: List[int]) -> int:
+        """Mark exactly `skipped_ids` of a service's requests as skipped and
+        all others as active, in one transaction. Returns how many are
+        skipped.
+        """
+
+        def _set(conn):
+            conn.execute("UPDATE requests SET skipped = 0 WHERE service = ? AND skipped != 0", (service_id,))
+            conn.executemany(
+                "UPDATE requests SET skipped = 1 WHERE id = ? AND service = ?",
+                [(request_id, service_id) for request_id in skipped_ids],
+            )
+            return conn.execute(
+                "SELECT COUNT(*) FROM requests WHERE service = ? AND skipped = 1", (service_id,)
+            ).fetchone()[0]
+
+        skipped = await self._pool.write(_set)
+        self.cache.invalidate("requests")
+        return skipped
+
+    # --- Listing pages -------------------------------------------------
+    # One keyset query per page (id > after, in id order), selecting only the
+    # projected columns so small projections are answered from the indexes.
+    async def page_services(
+        self,
+        profile: Optional[str],
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        fields: Sequence[str] = SERVICE_FIELDS,
+    ) -> List[dict]:
+        """One page of a profile's services as dicts holding only `fields`.
+        Without `limit` all services after `after` are returned.
+        """
+        columns = ", ".join(fields)
+
+        def _fetch(conn):
+            query = f"SELECT {columns} FROM services WHERE profile = ? AND id > ? ORDER BY id"
+            params: List = [profile, after or 0]
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            return conn.execute(query, params).fetchall()
+
+        async def _load():
+            return [dict(zip(fields, row)) for row in await self._pool.read(_fetch)]
+
+        key = ("page_services", profile, after, limit, tuple(fields))
+        return await self.cache.get_or_load(("services",), key, _load)
+
+    async def page_requests(
+        self,
+        service_id: int,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        fields: Sequence[str] = REQUEST_FIELDS,
+        method: Optional[str] = None,
+        endpoint_prefix: Optional[str] = None,
+    ) -> List[dict]:
+        """One page of a service's requests as dicts holding only `fields`,
+        optionally only those with `method` (case-insensitive) or whose
+        endpoint starts with `endpoint_prefix`. Without `limit` all matching
+        requests after `after` are returned.
+        """
+        columns = ", ".join(fields)
+
+        def _fetch(conn):
+            # Without statistics the planner would rather walk the service's
+            # requests in id order than range-scan a prefix
+            index = " INDEXED BY idx_requests_endpoint" if endpoint_prefix else ""
+            query = f"SELECT {columns} FROM requests{index} WHERE service = ? AND id > ?"
+            params: List = [service_id, after or 0]
+            if method:
+                query += " AND method = ? COLLATE NOCASE"
+                params.append(method)
+            if endpoint_prefix:
+                # a range rather than LIKE: case-sensitive and no wildcards
+                query += " AND endpoint >= ?"
+                params.append(endpoint_prefix)
+                upper = _prefix_end(endpoint_prefix)
+                if upper is not None:
+                    query += " AND endpoint < ?"
+                    params.append(upper)
+            query += " ORDER BY id"
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            return conn.execute(query, params).fetchall()
+
+        async def _load():
+            pages = [dict(zip(fields, row)) for row in await self._pool.read(_fetch)]
+            if "skipped" in fields:
+                for row in pages:
+                    row["skipped"] = bool(row["skipped"])
+            return pages
+
+        key = ("page_requests", service_id, after, limit, tuple(fields), method, endpoint_prefix)
+        return await self.cache.get_or_load(("requests",), key, _load)
 
     # --- Request-related DB helpers ---------------------------------
     async def create_request(self, service_id: int, endpoint: str, method: str, body: Optional[str] = None) -> Request:
         """Insert a new request row and return a Request object."""
 
-        def _insert():
-            cur = self._conn.execute(
+        def _insert(conn):
+            cur = conn.execute(
                 "INSERT INTO requests(service, endpoint, method, body) VALUES(?, ?, ?, ?)",
                 (service_id, endpoint, method, body),
             )
-            self._conn.commit()
             return cur.lastrowid
 
-        rowid = await asyncio.to_thread(_insert)
-        return Request(self._conn, int(rowid))
+        rowid = await self._pool.write(_insert)
+        self.cache.invalidate("requests")
+        return Request(self._pool, int(rowid), cache=self.cache)
 
     async def get_service_by_id(self, service_id: int) -> Optional[Service]:
-        def _get():
-            cur = self._conn.execute("SELECT id, name, profile FROM services WHERE id = ?", (service_id,))
+        def _get(conn):
+            cur = conn.execute("SELECT id, name, profile FROM services WHERE id = ?", (service_id,))
             return cur.fetchone()
 
-        row = await asyncio.to_thread(_get)
+        row = await self._pool.read(_get)
         if not row:
             return None
-        return Service(self._conn, int(row[0]), row[1], row[2])
+        return Service(self._pool, int(row[0]), row[1], row[2], cache=self.cache)
 
     async def get_request(self, request_id: int) -> Optional[Request]:
-        def _get():
-            cur = self._conn.execute(
+        def _get(conn):
+            cur = conn.execute(
                 "SELECT id FROM requests WHERE id = ?", (request_id,)
             )
             return cur.fetchone()
 
-        row = await asyncio.to_thread(_get)
+        row = await self._pool.read(_get)
         if not row:
             return None
-        return Request(self._conn, int(row[0]))
+        return Request(self._pool, int(row[0]), cache=self.cache)
 
     async def delete_request(self, request_id: int) -> bool:
-        def _delete():
-            cur = self._conn.execute("DELETE FROM requests WHERE id = ?", (request_id,))
-            self._conn.commit()
+        def _delete(conn):
+            cur = conn.execute("DELETE FROM requests WHERE id = ?", (request_id,))
             return cur.rowcount > 0
 
-        return await asyncio.to_thread(_delete)
+        deleted = await self._pool.write(_delete)
+        self.cache.invalidate("requests")
+        return deleted
@@ -0,0 +1,226 @@
+import fnmatch
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_TIMESTAMP_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$"
+)
+_UUID_RE = re.compile(
+    r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+)
+_INDEX_RE = re.compile(r"\[\d+\]")
+
+
+def is_timestamp(value: Any) -> bool:
+    return isinstance(value, str) and _TIMESTAMP_RE.match(value) is not None
+
+
+def is_uuid(value: Any) -> bool:
+    return isinstance(value, str) and _UUID_RE.match(value) is not None
+
+
+# Detectors for values that are expected to differ between two otherwise
+# identical responses. A changed value is ignored when both the old and the
+# new value satisfy the same detector.
+VOLATILE_DETECTORS: Dict[str, Callable[[Any], bool]] = {
+    "timestamp": is_timestamp,
+    "uuid": is_uuid,
+}
+
+
+def json_type(value: Any) -> str:
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    return "string"
+
+
+def json_equal(old: Any, new: Any) -> bool:
+    """`old == new` for decoded JSON values, except that booleans never
+    equal numbers (Python has `True == 1`), at any depth.
+    """
+    if old != new:
+        return False
+    if isinstance(old, (dict, list)):
+        # Already ==, so only a boolean/number mix can tell them apart;
+        # comparing the encoded forms is quicker than walking them here.
+        return json.dumps(old, sort_keys=True) == json.dumps(new, sort_keys=True)
+    return json_type(old) == json_type(new)
+
+
+@dataclass
+class DiffRules:
+    """What the diff engine treats as noise.
+
+    `ignore_paths` are globs matched against diff paths such as
+    `$.address.city` or `$.items[3].id` (`*.created_at` matches a
+    `created_at` key at any depth). `volatile` names entries of
+    VOLATILE_DETECTORS to apply. With `allow_added` set, fields that only
+    exist in the new response are treated as compatible additions.
+    """
+
+    ignore_paths: List[str] = field(default_factory=list)
+    volatile: List[str] = field(default_factory=lambda: list(VOLATILE_DETECTORS))
+    allow_added: bool = True
+
+    def __post_init__(self):
+        # One compiled regex for all globs instead of fnmatch per glob per path
+        pattern = "|".join(fnmatch.translate(glob) for glob in self.ignore_paths)
+        self._ignore_re = re.compile(pattern) if pattern else None
+        self._detectors = [VOLATILE_DETECTORS[name] for name in self.volatile]
+
+    def ignores_path(self, path: str) -> bool:
+        return self._ignore_re is not None and self._ignore_re.match(path) is not None
+
+    def is_volatile(self, old: Any, new: Any) -> bool:
+        return any(detect(old) and detect(new) for detect in self._detectors)
+
+
+@dataclass
+class JsonDiff:
+    """Paths at which two JSON values differ, grouped by kind of change.
+
+    Paths matched by the rules' ignore globs or holding volatile values are
+    listed in `ignored` rather than with the other changes.
+    """
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # path -> [old type, new type]
+    type_changed: Dict[str, List[str]] = field(default_factory=dict)
+    value_changed: List[str] = field(default_factory=list)
+    ignored: List[str] = field(default_factory=list)
+
+    @property
+    def equal(self) -> bool:
+        return not (self.added or self.removed or self.type_changed or self.value_changed)
+
+    @property
+    def breaking(self) -> bool:
+        """Fields were removed or changed type: old clients would break."""
+        return bool(self.removed or self.type_changed)
+
+    def verdict(self, rules: "DiffRules") -> Optional[bool]:
+        """True/False if the diff can be classified deterministically,
+        None if it needs the model: the remaining `value_changed` paths are
+        neither ignored nor volatile, and only the model can tell whether
+        they matter.
+        """
+        if self.breaking or (self.added and not rules.allow_added):
+            return False
+        if not self.value_changed:
+            return True
+        return None
+
+    def fingerprint(self) -> str:
+        """Canonical hash of the diff's shape (paths and types, never values).
+
+        Array indices are folded to `[]` so the same difference on a longer
+        or shorter list produces the same fingerprint.
+        """
+
+        def _norm(paths: Iterable[str]) -> List[str]:
+            return sorted({_INDEX_RE.sub("[]", p) for p in paths})
+
+        canonical = json.dumps(
+            [
+                _norm(self.added),
+                _norm(self.removed),
+                sorted({_INDEX_RE.sub("[]", p): t for p, t in self.type_changed.items()}.items()),
+                _norm(self.value_changed),
+            ],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def summary(self, limit: int = 10) -> dict:
+        """A compact version of to_dict(): counts plus the first `limit`
+        paths of each kind, for storing alongside run results.
+        """
+        return {
+            "counts": {
+                "added": len(self.added),
+                "removed": len(self.removed),
+                "type_changed": len(self.type_changed),
+                "value_changed": len(self.value_changed),
+                "ignored": len(self.ignored),
+            },
+            "added": self.added[:limit],
+            "removed": self.removed[:limit],
+            "type_changed": dict(list(self.type_changed.items())[:limit]),
+            "value_changed": self.value_changed[:limit],
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "added": self.added,
+            "removed": self.removed,
+            "type_changed": self.type_changed,
+            "value_changed": self.value_changed,
+            "ignored": self.ignored,
+        }
+
+
+def diff_json(
+    old: Any,
+    new: Any,
+    rules: Optional[DiffRules] = None,
+    path: str = "$",
+    into: Optional[JsonDiff] = None,
+) -> JsonDiff:
+    """Recursively compare two decoded JSON values.
+
+    `path` is the diff path of the values themselves (e.g. `$[3]` when
+    comparing one element of a larger array), and with `into` the changes
+    are added to an existing diff rather than a new one.
+    """
+    rules = rules or DiffRules()
+    result = into if into is not None else JsonDiff()
+    _diff(old, new, path, rules, result)
+    return result
+
+
+def _diff(old: Any, new: Any, path: str, rules: DiffRules, out: JsonDiff) -> None:
+    if json_equal(old, new):
+        return
+    if rules.ignores_path(path):
+        out.ignored.append(path)
+        return
+
+    old_type, new_type = json_type(old), json_type(new)
+    if old_type != new_type:
+        out.type_changed[path] = [old_type, new_type]
+        return
+
+    if old_type == "object":
+        for key, old_child in old.items():
+            child_path = f"{path}.{key}"
+            if key in new:
+                _diff(old_child, new[key], child_path, rules, out)
+            elif rules.ignores_path(child_path):
+                out.ignored.append(child_path)
+            else:
+                out.removed.append(child_path)
+        for key in (k for k in new if k not in old):
+            child_path = f"{path}.{key}"
+            (out.ignored if rules.ignores_path(child_path) else out.added).append(child_path)
+    elif old_type == "array":
+        for i, (old_child, new_child) in enumerate(zip(old, new)):
+            _diff(old_child, new_child, f"{path}[{i}]", rules, out)
+        # A different number of elements is a change in data, not in schema.
+        if len(old) != len(new):
+            out.value_changed.append(path)
+    elif rules.is_volatile(old, new):
+        out.ignored.append(path)
+    else:
+        out.value_changed.append(path)
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from .diff import DiffRules, JsonDiff, diff_json, json_equal
+
+# Response pairs whose raw bodies add up to at least this many bytes are
+# decoded and diffed in a worker process instead of on the event loop.
+DIFF_OFFLOAD_BYTES = int(os.getenv("DIFF_OFFLOAD_BYTES", 1024 * 1024))
+
+# Worker processes for offloaded diffs (default: one per core).
+DIFF_WORKERS = int(os.getenv("DIFF_WORKERS", os.cpu_count() or 1))
+
+
+def _diff_raw(raw1: bytes, raw2: bytes, rules: DiffRules) -> Tuple[bool, Optional[JsonDiff]]:
+    # Runs in a worker: only the raw bytes go in and only the (small) diff
+    # comes back, never the decoded documents. Raises ValueError on bodies
+    # that aren't JSON.
+    old, new = json.loads(raw1), json.loads(raw2)
+    if json_equal(old, new):
+        return True, None
+    return False, diff_json(old, new, rules)
+
+
+class DiffPool:
+    """Runs structural diffs of large response pairs in a process pool.
+
+    Small pairs are cheaper to diff inline than to ship to another process,
+    so callers check `offloads` first. Submissions are bounded to twice the
+    worker count; further diffs wait for a free slot instead of piling up
+    raw bodies in the executor's queue.
+    """
+
+    def __init__(self, workers: int = DIFF_WORKERS, threshold: int = DIFF_OFFLOAD_BYTES):
+        self.workers = max(1, workers)
+        self.threshold = threshold
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def offloads(self, raw1: Optional[bytes], raw2: Optional[bytes]) -> bool:
+        if self.threshold <= 0 or raw1 is None or raw2 is None:
+            return False
+        return len(raw1) + len(raw2) >= self.threshold
+
+    async def diff(self, raw1: bytes, raw2: bytes, rules: DiffRules) -> Tuple[bool, Optional[JsonDiff]]:
+        """(equal, diff) of two raw JSON bodies, computed in a worker."""
+        if self._executor is None:
+            # spawn rather than fork: the app has SQLite and HTTP threads
+            # running, which a forked child would inherit in a broken state
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(2 * self.workers)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._executor, _diff_raw, raw1, raw2, rules)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                # on the next call and diff this pair inline.
+                self.close()
+                return _diff_raw(raw1, raw2, rules)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+
+_pool: Optional[DiffPool] = None
+
+
+def get_diff_pool() -> DiffPool:
+    """Return the process-wide DiffPool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = DiffPool()
+    return _pool
+
+
+def close_diff_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
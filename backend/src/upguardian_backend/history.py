@@ -0,0 +1,279 @@
+import asyncio
+import json
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from .pool import SQLitePool
+
+# Run results are written in batches of this many rows.
+RESULT_BATCH_SIZE = 200
+
+# Bodies at least this large are compressed on a worker thread instead of
+# the event loop.
+COMPRESS_OFFLOAD_BYTES = 64 * 1024
+
+RUN_COLUMNS = "id, service, status, started_at, finished_at, total, passed, failed, errors"
+
+
+def _run_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "service": row[1],
+        "status": row[2],
+        "started_at": row[3],
+        "finished_at": row[4],
+        "total": row[5],
+        "passed": row[6],
+        "failed": row[7],
+        "errors": row[8],
+    }
+
+
+def encode_body(raw: bytes) -> tuple[bytes, int]:
+    """Compress a raw response body for storage.
+
+    Returns (zlib-compressed bytes, uncompressed size). Bodies are keyed by
+    the replay's content hash (replay.body_digest), so identical bodies are
+    stored once no matter how many runs or requests produced them.
+    """
+    return zlib.compress(raw), len(raw)
+
+
+def prune_bodies(conn) -> int:
+    """Delete stored bodies no run result refers to any more, e.g. after a
+    service's runs were deleted. Call it in the transaction of that delete.
+    """
+    cur = conn.execute(
+        """
+        DELETE FROM bodies WHERE hash NOT IN (
+            SELECT body1 FROM run_results WHERE body1 IS NOT NULL
+            UNION SELECT body2 FROM run_results WHERE body2 IS NOT NULL
+        )
+        """
+    )
+    return cur.rowcount
+
+
+class RunRecorder:
+    """Writes the outcomes of one run as they arrive.
+
+    Created by RunHistory.start(). Results are buffered and flushed in
+    batches; bodies are stored content-addressed in the `bodies` table.
+    With an endpoint `pair`, each request's verdict is also kept as its
+    last verdict for that pair (see RunHistory.last_verdicts).
+    """
+
+    def __init__(self, pool: SQLitePool, run_id: int, pair: Optional[str] = None):
+        self._pool = pool
+        self.run_id = run_id
+        self.pair = pair
+        self._buffer: List[tuple] = []
+        self._verdicts: List[tuple] = []
+        self._bodies: dict[str, tuple[bytes, int]] = {}
+        self.passed = self.failed = self.errors = 0
+        self.finished = False
+
+    async def add(self, outcome) -> None:
+        """Record a runner.RunOutcome."""
+        result = outcome.result
+        if outcome.passed:
+            self.passed += 1
+        else:
+            self.failed += 1
+        if result.error is not None:
+            self.errors += 1
+
+        for raw, digest in ((result.raw1, result.digest1), (result.raw2, result.digest2)):
+            if raw is not None and digest not in self._bodies:
+                if len(raw) >= COMPRESS_OFFLOAD_BYTES:
+                    self._bodies[digest] = await asyncio.to_thread(encode_body, raw)
+                else:
+                    self._bodies[digest] = encode_body(raw)
+
+        diff = json.dumps(outcome.diff.summary()) if outcome.diff is not None else None
+        timing = outcome.timing()
+        self._buffer.append((
+            self.run_id,
+            outcome.index,
+            outcome.request.id,
+            outcome.request.method,
+            outcome.request.endpoint,
+            int(outcome.passed),
+            result.error,
+            result.elapsed * 1000,
+            diff,
+            result.digest1,
+            result.digest2,
+            json.dumps(timing) if timing is not None else None,
+        ))
+        if self.pair is not None:
+            self._verdicts.append((
+                outcome.request.id, self.pair, outcome.request.content_hash(), int(outcome.passed), self.run_id
+            ))
+        if len(self._buffer) >= RESULT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self._buffer = self._buffer, []
+        bodies, self._bodies = self._bodies, {}
+        verdicts, self._verdicts = self._verdicts, []
+        if not rows:
+            return
+
+        def _write(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO bodies(hash, size, data) VALUES(?, ?, ?)",
+                [(digest, size, data) for digest, (data, size) in bodies.items()],
+            )
+            conn.executemany(
+                """
+                INSERT INTO run_results(run, idx, request, method, endpoint, passed, error, elapsed_ms, diff, body1, body2, timing)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            # a request deleted while the run was going has no verdict to keep
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO request_verdicts(request, pair, content_hash, passed, run)
+                SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM requests WHERE id = ?)
+                """,
+                [(*verdict, verdict[0]) for verdict in verdicts],
+            )
+
+        await self._pool.write(_write)
+
+    async def finish(self, status: str = "completed") -> None:
+        """Flush and set the run's final status; later calls do nothing."""
+        if self.finished:
+            return
+        self.finished = True
+        await self.flush()
+
+        def _finish(conn):
+            conn.execute(
+                "UPDATE runs SET status = ?, finished_at = ?, passed = ?, failed = ?, errors = ? WHERE id = ?",
+                (status, time.time(), self.passed, self.failed, self.errors, self.run_id),
+            )
+
+        await self._pool.write(_finish)
+
+
+class RunHistory:
+    """Stored test runs: one `runs` row per run, one `run_results` row per
+    replayed request, and the response bodies they reference.
+    """
+
+    def __init__(self, pool: SQLitePool):
+        self._pool = pool
+
+    async def start(self, service_id: int, total: int, pair: Optional[str] = None) -> RunRecorder:
+        def _insert(conn):
+            cur = conn.execute(
+                "INSERT INTO runs(service, status, started_at, total) VALUES(?, 'running', ?, ?)",
+                (service_id, time.time(), total),
+            )
+            return cur.lastrowid
+
+        return RunRecorder(self._pool, await self._pool.write(_insert), pair)
+
+    async def last_verdicts(self, service_id: int, pair: str) -> Dict[int, Tuple[str, bool]]:
+        """Request id -> (content hash, passed) of the latest verdict of each
+        of a service's requests against the endpoint `pair`.
+        """
+
+        def _fetch(conn):
+            cur = conn.execute(
+                """
+                SELECT v.request, v.content_hash, v.passed FROM requests r
+                JOIN request_verdicts v ON v.request = r.id AND v.pair = ?
+                WHERE r.service = ?
+                """,
+                (pair, service_id),
+            )
+            return cur.fetchall()
+
+        return {request: (content_hash, bool(passed)) for request, content_hash, passed in await self._pool.read(_fetch)}
+
+    async def list_runs(self, service_id: int, before: Optional[int] = None, limit: int = 20) -> List[dict]:
+        """Runs of a service, newest first. Pass the last id of a page as
+        `before` to get the next one.
+        """
+
+        def _fetch(conn):
+            if before is None:
+                cur = conn.execute(
+                    f"SELECT {RUN_COLUMNS} FROM runs WHERE service = ? ORDER BY id DESC LIMIT ?",
+                    (service_id, limit),
+                )
+            else:
+                cur = conn.execute(
+                    f"SELECT {RUN_COLUMNS} FROM runs WHERE service = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                    (service_id, before, limit),
+                )
+            return cur.fetchall()
+
+        return [_run_dict(row) for row in await self._pool.read(_fetch)]
+
+    async def get_run(self, run_id: int) -> Optional[dict]:
+        def _get(conn):
+            return conn.execute(f"SELECT {RUN_COLUMNS} FROM runs WHERE id = ?", (run_id,)).fetchone()
+
+        row = await self._pool.read(_get)
+        return _run_dict(row) if row else None
+
+    async def list_results(
+        self,
+        run_id: int,
+        after: Optional[int] = None,
+        limit: int = 100,
+        failed_only: bool = False,
+    ) -> List[dict]:
+        """Per-request outcomes of a run in request order. Pass the last
+        `index` of a page as `after` to get the next one.
+        """
+
+        def _fetch(conn):
+            query = (
+                "SELECT idx, request, method, endpoint, passed, error, elapsed_ms, diff, body1, body2, timing"
+                " FROM run_results WHERE run = ? AND idx > ?"
+            )
+            if failed_only:
+                query += " AND passed = 0"
+            query += " ORDER BY idx LIMIT ?"
+            return conn.execute(query, (run_id, -1 if after is None else after, limit)).fetchall()
+
+        return [
+            {
+                "index": row[0],
+                "request_id": row[1],
+                "method": row[2],
+                "endpoint": row[3],
+                "passed": bool(row[4]),
+                "error": row[5],
+                "elapsed_ms": row[6],
+                "diff": json.loads(row[7]) if row[7] else None,
+                "body1": row[8],
+                "body2": row[9],
+                "timing": json.loads(row[10]) if row[10] else None,
+            }
+            for row in await self._pool.read(_fetch)
+        ]
+
+    async def get_body(self, digest: str) -> Optional[Any]:
+        """Return a stored response body by content hash: decoded JSON, or
+        the text as-is if it isn't JSON.
+        """
+
+        def _get(conn):
+            return conn.execute("SELECT data FROM bodies WHERE hash = ?", (digest,)).fetchone()
+
+        row = await self._pool.read(_get)
+        if not row:
+            return None
+        raw = zlib.decompress(row[0])
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return raw.decode(errors="replace")
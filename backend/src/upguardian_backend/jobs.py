@@ -0,0 +1,205 @@
+import asyncio
+import bisect
+import itertools
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Optional
+
+from .replay import ReplayEngine
+from .runner import RunOutcome, run_service
+from .stats import percentile
+
+if TYPE_CHECKING:
+    from .db import UpGuardianSQLiteDB
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    """A test run of one service, executed in the background."""
+
+    service_id: int
+    priority: int = 0
+    # replay every request instead of only new, changed or failing ones
+    full: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    run_id: Optional[int] = None
+    error: Optional[str] = None
+    total: int = 0
+    done: int = 0
+    passed: int = 0
+    failed: int = 0
+    # left out of an incremental run, set once it finishes
+    unchanged: int = 0
+    # per-request replay latencies (ms), kept sorted for percentiles
+    latencies: List[float] = field(default_factory=list, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    # RunObserver
+    def started(self, run_id: int, total: int) -> None:
+        self.run_id = run_id
+        self.total = total
+
+    def record(self, outcome: RunOutcome) -> None:
+        self.done += 1
+        if outcome.passed:
+            self.passed += 1
+        else:
+            self.failed += 1
+        # insort keeps percentiles cheap to read while polling
+        bisect.insort(self.latencies, outcome.result.elapsed * 1000)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED, CANCELLED)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "service_id": self.service_id,
+            "priority": self.priority,
+            "full": self.full,
+            "status": self.status,
+            "run_id": self.run_id,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "done": self.done,
+                "total": self.total,
+                "passed": self.passed,
+                "failed": self.failed,
+                "unchanged": self.unchanged,
+                "p50_ms": round(percentile(self.latencies, 50), 3),
+                "p95_ms": round(percentile(self.latencies, 95), 3),
+            },
+        }
+
+
+def _settle(job: Job, task: asyncio.Task) -> None:
+    # A task cancelled before its first step never runs _execute's handlers
+    if not job.finished:
+        job.status = CANCELLED if task.cancelled() else FAILED
+        job.finished_at = time.time()
+
+
+class JobScheduler:
+    """In-process queue of test-run jobs.
+
+    Jobs wait in a priority queue (higher `priority` first, FIFO among equal
+    priorities) and are executed by a fixed number of worker tasks, so only
+    that many suites replay at once. Queued and running jobs can be
+    cancelled. Finished jobs are kept (up to `keep_finished`) so their final
+    progress can still be polled.
+    """
+
+    def __init__(
+        self,
+        db_manager: "UpGuardianSQLiteDB",
+        engine: ReplayEngine,
+        workers: int = 2,
+        keep_finished: int = 500,
+    ):
+        self._db = db_manager
+        self._engine = engine
+        self._workers_count = workers
+        self._keep_finished = keep_finished
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._seq = itertools.count()
+
+    def _ensure_started(self) -> asyncio.PriorityQueue:
+        # Started on first use so the queue and workers bind to the app's loop
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+        return self._queue
+
+    def submit(self, service_id: int, priority: int = 0, full: bool = False) -> Job:
+        queue = self._ensure_started()
+        job = Job(service_id=service_id, priority=priority, full=full)
+        self._jobs[job.id] = job
+        queue.put_nowait((-priority, next(self._seq), job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it is unknown or
+        already finished.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued: the worker skips it when it comes up.
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status == QUEUED:
+                job.task = asyncio.create_task(self._execute(job))
+                job.task.add_done_callback(lambda task, job=job: _settle(job, task))
+                try:
+                    await asyncio.wait([job.task])
+                finally:
+                    job.task = None
+            self._queue.task_done()
+            self._evict()
+
+    async def _execute(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            service = await self._db.load_service(job.service_id)
+            if not service:
+                raise LookupError("service not found")
+            report = await run_service(
+                self._db, self._engine, service, observer=job, collect=False, incremental=not job.full
+            )
+            job.unchanged = report.unchanged
+            job.status = COMPLETED
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[job_id]
+
+    async def aclose(self) -> None:
+        for job in self._jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
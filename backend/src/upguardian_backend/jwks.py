@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from jwt import PyJWK
+from jwt.exceptions import PyJWKError
+
+# How often the JWKS is refetched in the background, in seconds.
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "600"))
+
+# After a token names a key id the cached JWKS doesn't have, another
+# refetch for an unknown kid is only attempted this many seconds later, so
+# tokens with bogus kids can't make us hammer the JWKS endpoint.
+JWKS_MISS_BACKOFF = float(os.getenv("JWKS_MISS_BACKOFF", "30"))
+
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "5"))
+
+# Verified tokens remembered at once.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class JwksCache:
+    """Signing keys of a JWKS endpoint, fetched without blocking the event
+    loop and indexed by key id.
+
+    The first lookup fetches the key set; after that a background task
+    refetches it every `refresh_interval` seconds so rotated keys show up
+    before tokens signed with them arrive. A lookup for an unknown kid
+    triggers an immediate refetch, at most once per `miss_backoff` seconds.
+    Concurrent fetches are collapsed into one.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        refresh_interval: float = JWKS_REFRESH_INTERVAL,
+        miss_backoff: float = JWKS_MISS_BACKOFF,
+        timeout: float = JWKS_FETCH_TIMEOUT,
+    ):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.miss_backoff = miss_backoff
+        self._timeout = timeout
+        self._keys: Dict[str, PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._last_miss_fetch = float("-inf")
+        self._fetching: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def _fetch(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self._timeout)
+        response = await self._client.get(self.url)
+        response.raise_for_status()
+        keys: Dict[str, PyJWK] = {}
+        for data in response.json().get("keys", []):
+            if data.get("use", "sig") != "sig" or "kid" not in data:
+                continue
+            try:
+                keys[data["kid"]] = PyJWK(data)
+            except PyJWKError:
+                # Unsupported key types are skipped, like PyJWKSet does
+                continue
+        if not keys:
+            raise PyJWKError("The JWKS endpoint did not contain any usable signing keys")
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self) -> None:
+        """Refetch the key set, joining a fetch already in progress."""
+        if self._fetching is None:
+            self._fetching = asyncio.create_task(self._fetch())
+            self._fetching.add_done_callback(self._fetch_done)
+        await asyncio.shield(self._fetching)
+
+    def _fetch_done(self, task: asyncio.Task) -> None:
+        self._fetching = None
+        if not task.cancelled():
+            # Mark the exception retrieved in case nobody else was waiting.
+            task.exception()
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                # Keep serving the keys we have; the next round or a kid
+                # miss tries again.
+                pass
+
+    async def get_signing_key(self, kid: Optional[str]) -> PyJWK:
+        if self._refresher is None:
+            # Started on first use so the task binds to the app's loop
+            self._refresher = asyncio.create_task(self._refresh_forever())
+        if self._fetched_at is None:
+            await self.refresh()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_miss_fetch >= self.miss_backoff:
+            self._last_miss_fetch = time.monotonic()
+            await self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise PyJWKError(f'Unable to find a signing key that matches: "{kid}"')
+        return key
+
+    async def aclose(self) -> None:
+        for task in (self._refresher, self._fetching):
+            if task is not None:
+                task.cancel()
+        self._refresher = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class VerifiedTokenCache:
+    """Payloads of tokens that already passed verification, keyed by a hash
+    of the token and dropped once the token's `exp` has passed.
+
+    Bounded to `capacity` entries; the least recently used go first.
+    Tokens without an `exp` claim are never cached.
+    """
+
+    def __init__(self, capacity: int = TOKEN_CACHE_SIZE):
+        self._capacity = capacity
+        # token digest -> (payload, exp)
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        digest = token_digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        payload, exp = entry
+        if time.time() >= exp:
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return payload
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or self._capacity < 1:
+            return
+        digest = token_digest(token)
+        self._entries[digest] = (payload, float(exp))
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
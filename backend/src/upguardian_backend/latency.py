@@ -0,0 +1,129 @@
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .reduction import path_template
+from .stats import percentile
+
+
+@dataclass
+class LatencyThresholds:
+    """When a slower new endpoint counts as a regression.
+
+    All conditions must hold: the new side's median is at least `max_ratio`
+    times the old one and at least `min_delta_ms` slower, and a one-sided
+    Mann-Whitney U test says the new side is slower with p < `alpha`. Routes
+    with fewer than `min_samples` samples per side are reported but never
+    flagged.
+    """
+
+    max_ratio: float = float(os.getenv("LATENCY_MAX_RATIO", "1.5"))
+    min_delta_ms: float = float(os.getenv("LATENCY_MIN_DELTA_MS", "5"))
+    alpha: float = float(os.getenv("LATENCY_ALPHA", "0.01"))
+    min_samples: int = int(os.getenv("LATENCY_MIN_SAMPLES", "5"))
+
+
+def mann_whitney_greater(new: Sequence[float], old: Sequence[float]) -> float:
+    """One-sided p-value that values in `new` tend to be larger than those in
+    `old` (Mann-Whitney U, normal approximation with tie and continuity
+    correction).
+    """
+    n1, n2 = len(new), len(old)
+    if not n1 or not n2:
+        return 1.0
+    pooled = sorted([(v, 0) for v in new] + [(v, 1) for v in old])
+    rank_sum = 0.0
+    tie_term = 0.0
+    i = 0
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        # tied values share the average of their ranks (1-based)
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if pooled[k][1] == 0)
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+    n = n1 + n2
+    u = rank_sum - n1 * (n1 + 1) / 2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _summary(sorted_ms: List[float]) -> dict:
+    return {
+        "samples": len(sorted_ms),
+        "mean_ms": round(sum(sorted_ms) / len(sorted_ms), 3) if sorted_ms else 0.0,
+        "p50_ms": round(percentile(sorted_ms, 50), 3),
+        "p90_ms": round(percentile(sorted_ms, 90), 3),
+        "p99_ms": round(percentile(sorted_ms, 99), 3),
+    }
+
+
+class LatencyStats:
+    """Collects old/new latency samples of a run per route (method plus
+    path template) and compares them.
+    """
+
+    def __init__(self, thresholds: Optional[LatencyThresholds] = None):
+        self.thresholds = thresholds or LatencyThresholds()
+        # (method, path template) -> (old samples, new samples), in ms
+        self._routes: Dict[Tuple[str, str], Tuple[List[float], List[float]]] = defaultdict(lambda: ([], []))
+
+    def add(self, outcome) -> None:
+        """Record the samples of a runner.RunOutcome."""
+        result = outcome.result
+        if not result.samples1 or not result.samples2:
+            return
+        old, new = self._routes[(outcome.request.method.upper(), path_template(outcome.request.endpoint))]
+        old.extend(s * 1000 for s in result.samples1)
+        new.extend(s * 1000 for s in result.samples2)
+
+    def routes(self) -> List[dict]:
+        t = self.thresholds
+        report = []
+        for (method, path), (old, new) in sorted(self._routes.items()):
+            old, new = sorted(old), sorted(new)
+            old_p50, new_p50 = percentile(old, 50), percentile(new, 50)
+            ratio = new_p50 / old_p50 if old_p50 > 0 else None
+            enough = len(old) >= t.min_samples and len(new) >= t.min_samples
+            p_value = mann_whitney_greater(new, old) if enough else None
+            regression = (
+                p_value is not None
+                and p_value < t.alpha
+                and ratio is not None
+                and ratio >= t.max_ratio
+                and new_p50 - old_p50 >= t.min_delta_ms
+            )
+            report.append({
+                "method": method,
+                "path": path,
+                "old": _summary(old),
+                "new": _summary(new),
+                "p50_ratio": round(ratio, 3) if ratio is not None else None,
+                "p_value": p_value,
+                "regression": regression,
+            })
+        return report
+
+    def to_dict(self) -> dict:
+        routes = self.routes()
+        return {
+            "thresholds": {
+                "max_ratio": self.thresholds.max_ratio,
+                "min_delta_ms": self.thresholds.min_delta_ms,
+                "alpha": self.thresholds.alpha,
+                "min_samples": self.thresholds.min_samples,
+            },
+            "regressions": sum(1 for r in routes if r["regression"]),
+            "routes": routes,
+        }
+
+    def regressions(self) -> List[dict]:
+        return [route for route in self.routes() if route["regression"]]
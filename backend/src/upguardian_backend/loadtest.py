@@ -0,0 +1,273 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import httpx
+
+from .replay import ReplayEngine
+from .request import RequestRow
+from .service import ServiceRow
+
+# Longest load test the API/CLI will run, in seconds.
+LOADTEST_MAX_DURATION = float(os.getenv("LOADTEST_MAX_DURATION", "600"))
+# Highest arrival rate (per side) and most closed-loop workers (per side)
+# the API/CLI will drive.
+LOADTEST_MAX_RPS = float(os.getenv("LOADTEST_MAX_RPS", "5000"))
+LOADTEST_MAX_CONCURRENCY = int(os.getenv("LOADTEST_MAX_CONCURRENCY", "1000"))
+
+# Open-loop tests stop scheduling new requests on a side once this many are
+# outstanding; the ones not sent are counted as `dropped`.
+DEFAULT_MAX_IN_FLIGHT = 1000
+
+# Histogram resolution: values keep SUB_BUCKET_BITS - 1 significant bits,
+# i.e. a relative error under 1/64 (~1.6%), from 1 µs up to MAX_TRACKED_US.
+SUB_BUCKET_BITS = 7
+MAX_TRACKED_US = 3_600_000_000
+
+
+class LatencyHistogram:
+    """Fixed-bucket, log-linear latency histogram in the style of
+    HdrHistogram.
+
+    Values are recorded in microseconds into a preallocated array of
+    counters: exact below 2**SUB_BUCKET_BITS µs, then SUB_BUCKET_BITS - 1
+    significant bits per power of two. Recording is O(1), memory is
+    constant no matter how many values are recorded, and histograms with
+    the same layout can be merged by adding counts.
+    """
+
+    _HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self.counts = [0] * (self._index(MAX_TRACKED_US) + 1)
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, us: int) -> int:
+        magnitude = max(0, us.bit_length() - SUB_BUCKET_BITS)
+        return magnitude * cls._HALF + (us >> magnitude)
+
+    @classmethod
+    def _value(cls, index: int) -> int:
+        # midpoint of the bucket's range
+        if index < 2 * cls._HALF:
+            return index
+        magnitude = index // cls._HALF - 1
+        sub = index - magnitude * cls._HALF
+        return (sub << magnitude) + (1 << magnitude) // 2
+
+    def record(self, seconds: float) -> None:
+        us = min(max(int(seconds * 1_000_000), 0), MAX_TRACKED_US)
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        self.total_us += us
+        self.max_us = max(self.max_us, us)
+        self.min_us = us if self.min_us is None else min(self.min_us, us)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+
+    def percentile(self, q: float) -> float:
+        """Value (ms) at or below which `q` percent of recordings fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._value(i), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "min_ms": (self.min_us or 0) / 1000,
+            "mean_ms": round(self.total_us / self.count / 1000, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "p999_ms": self.percentile(99.9),
+            "max_ms": self.max_us / 1000,
+        }
+
+
+@dataclass
+class SideStats:
+    """What one side (old or new endpoint) did during a load test."""
+
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    statuses: Counter = field(default_factory=Counter)
+    sent: int = 0
+    errors: int = 0
+    dropped: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def completed(self) -> int:
+        return self.histogram.count
+
+    def to_dict(self) -> dict:
+        done = self.completed + self.errors
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "error_rate": round(self.errors / done, 4) if done else 0.0,
+            "throughput_rps": round(self.completed / self.elapsed, 2) if self.elapsed > 0 else 0.0,
+            "statuses": {str(status): n for status, n in sorted(self.statuses.items())},
+            "latency": self.histogram.to_dict(),
+        }
+
+
+@dataclass
+class LoadTestConfig:
+    """Either `rps` (open loop: requests are started on a fixed schedule
+    regardless of how fast responses come back) or `concurrency` (closed
+    loop: that many workers each send the next request as soon as the last
+    one finished), for `duration` seconds per side.
+    """
+
+    duration: float = 10.0
+    rps: Optional[float] = None
+    concurrency: Optional[int] = None
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+
+    def __post_init__(self):
+        if (self.rps is None) == (self.concurrency is None):
+            raise ValueError("give exactly one of rps and concurrency")
+        if self.rps is not None and not 0 < self.rps <= LOADTEST_MAX_RPS:
+            raise ValueError(f"rps must be between 0 and {LOADTEST_MAX_RPS:g}")
+        if self.concurrency is not None and not 1 <= self.concurrency <= LOADTEST_MAX_CONCURRENCY:
+            raise ValueError(f"concurrency must be between 1 and {LOADTEST_MAX_CONCURRENCY}")
+        if not 0 < self.duration <= LOADTEST_MAX_DURATION:
+            raise ValueError(f"duration must be between 0 and {LOADTEST_MAX_DURATION:g} seconds")
+
+    def to_dict(self) -> dict:
+        mode = "open" if self.rps is not None else "closed"
+        return {"mode": mode, "duration_s": self.duration, "rps": self.rps, "concurrency": self.concurrency}
+
+
+async def _send(engine: ReplayEngine, stats: SideStats, base: str, request: RequestRow, since: float) -> None:
+    stats.sent += 1
+    try:
+        response = await engine.send(request.method, base + request.endpoint, request.body)
+    except httpx.HTTPError:
+        stats.errors += 1
+        return
+    stats.statuses[response.status_code] += 1
+    if response.status_code >= 500:
+        stats.errors += 1
+    else:
+        stats.histogram.record(time.perf_counter() - since)
+
+
+async def _open_loop(engine: ReplayEngine, base: str, requests: Sequence[RequestRow], config: LoadTestConfig) -> SideStats:
+    # Latency is measured from each request's scheduled start, so a backed-up
+    # server shows up in the numbers instead of silently lowering the rate
+    # (no coordinated omission).
+    stats = SideStats()
+    interval = 1 / config.rps
+    in_flight: set[asyncio.Task] = set()
+    started = time.perf_counter()
+    try:
+        for n, request in enumerate(itertools.cycle(requests)):
+            scheduled = started + n * interval
+            if scheduled - started >= config.duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= config.max_in_flight:
+                stats.dropped += 1
+                continue
+            task = asyncio.create_task(_send(engine, stats, base, request, scheduled))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(in_flight)
+    finally:
+        for task in in_flight:
+            task.cancel()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+async def _closed_loop(engine: ReplayEngine, base: str, requests: Sequence[RequestRow], config: LoadTestConfig) -> SideStats:
+    stats = SideStats()
+    queue = itertools.cycle(requests)
+    started = time.perf_counter()
+    deadline = started + config.duration
+
+    async def _worker() -> None:
+        while time.perf_counter() < deadline:
+            await _send(engine, stats, base, next(queue), time.perf_counter())
+
+    await asyncio.gather(*[_worker() for _ in range(config.concurrency)])
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def _ratio(new: float, old: float) -> Optional[float]:
+    return round(new / old, 3) if old else None
+
+
+async def run_load_test(
+    engine: ReplayEngine,
+    service: ServiceRow,
+    requests: Sequence[RequestRow],
+    config: LoadTestConfig,
+) -> dict:
+    """Drive the old and new endpoint of `service` with `requests` (cycled
+    in order) at the same time and return a side-by-side report.
+
+    Uses the engine's pooled HTTP clients, and is counted in their
+    connection statistics, but not its concurrency limits, which are meant
+    to keep suites from overloading a target.
+    """
+    if not requests:
+        raise ValueError("service has no requests to replay")
+    drive = _open_loop if config.rps is not None else _closed_loop
+    old, new = await asyncio.gather(
+        drive(engine, service.old_endpoint, requests, config),
+        drive(engine, service.new_endpoint, requests, config),
+    )
+    old_report, new_report = old.to_dict(), new.to_dict()
+    return {
+        "service_id": service.id,
+        "config": config.to_dict(),
+        "requests": len(requests),
+        "old": old_report,
+        "new": new_report,
+        "comparison": {
+            "p50_ratio": _ratio(new_report["latency"]["p50_ms"], old_report["latency"]["p50_ms"]),
+            "p99_ratio": _ratio(new_report["latency"]["p99_ms"], old_report["latency"]["p99_ms"]),
+            "throughput_ratio": _ratio(new_report["throughput_rps"], old_report["throughput_rps"]),
+            "error_rate_delta": round(new_report["error_rate"] - old_report["error_rate"], 4),
+        },
+    }
+
+
+def filter_methods(requests: Sequence[RequestRow], methods: Optional[str]) -> List[RequestRow]:
+    """Keep requests whose method is in the comma-separated `methods`
+    (all of them if None).
+    """
+    if not methods:
+        return list(requests)
+    wanted = {m.strip().upper() for m in methods.split(",") if m.strip()}
+    return [r for r in requests if r.method.upper() in wanted]
@@ -1,22 +1,40 @@
+import codecs
 import json
+import time
 
 import fastapi
-import sqlite3
 from pathlib import Path
 import os
 
-import httpx
 from dotenv import load_dotenv
 import asyncio
+from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from jwt import PyJWKClient
 from pydantic import BaseModel
 
-from .db import UpGuardianSQLiteDB
-from .nemotron import get_unimportant_keys_nemotron
-from .service import Service
+from .bulk import FORMATS as TRANSFER_FORMATS, export_requests, import_requests
+from .db import REQUEST_FIELDS, SERVICE_FIELDS, UpGuardianSQLiteDB
+from .diffpool import close_diff_pool
+from .jobs import JobScheduler
+from .jwks import JwksCache
+from .latency import LatencyStats
+from .loadtest import LoadTestConfig, filter_methods, run_load_test
+from .metrics import CONTENT_TYPE, HTTP_SECONDS, REGISTRY
+from .nemotron import close_nemotron_client
+from .pool import PoolConfig, SQLitePool
+from .replay import (
+    DEFAULT_GLOBAL_CONCURRENCY,
+    DEFAULT_HOST_CONCURRENCY,
+    DEFAULT_SERVICE_CONCURRENCY,
+    ReplayEngine,
+)
+from .reduction import STRATEGIES, reduce_suite
+from .report import SuiteReport, combined_report, junit_xml
+from .runner import changed_requests, iter_run, run_service, run_services
+from .schema import check_schemas
+from .service import ServiceRow
 
 load_dotenv()
 
@@ -32,8 +50,21 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Listing endpoints return their page cursor and ETag in headers
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Concurrency limits for replaying stored requests against service endpoints
+REPLAY_HOST_CONCURRENCY = int(os.getenv("REPLAY_HOST_CONCURRENCY", DEFAULT_HOST_CONCURRENCY))
+REPLAY_SERVICE_CONCURRENCY = int(os.getenv("REPLAY_SERVICE_CONCURRENCY", DEFAULT_SERVICE_CONCURRENCY))
+REPLAY_GLOBAL_CONCURRENCY = int(os.getenv("REPLAY_GLOBAL_CONCURRENCY", DEFAULT_GLOBAL_CONCURRENCY))
+
+# Most latency samples per safe request and side a run may ask for
+MAX_LATENCY_SAMPLES = int(os.getenv("MAX_LATENCY_SAMPLES", "20"))
+
+# Largest page the listing endpoints return
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "5000"))
+
 # Database file placed at the repository root (two parents up from this file)
 DB_PATH = Path(__file__).resolve().parents[2] / "upguardian.db"
 
@@ -41,76 +72,195 @@ def init_db() -> UpGuardianSQLiteDB:
     # Ensure parent directory exists (usually it will)
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    # allow usage from different threads (FastAPI workers). For simple apps
-    # this is sufficient; for high concurrency consider a connection pool.
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    # WAL-mode pool: one reader connection per worker thread plus a single
+    # queued writer, so concurrent reads don't block on each other or on writes.
+    pool = SQLitePool(PoolConfig(
+        path=str(DB_PATH),
+        readers=int(os.getenv("SQLITE_READERS", 4)),
+        synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        cache_size=int(os.getenv("SQLITE_CACHE_SIZE", -16000)),
+        mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    ))
 
-    app.state.db = conn
+    app.state.db = pool
 
     # Attach a DB manager that wraps sqlite access and ensure tables exist.
-    db_manager = UpGuardianSQLiteDB(conn)
+    db_manager = UpGuardianSQLiteDB(pool)
     db_manager.ensure_tables()
     app.state.db_manager = db_manager
 
     return db_manager
 
+def init_replay_engine() -> ReplayEngine:
+    return ReplayEngine(
+        host_concurrency=REPLAY_HOST_CONCURRENCY,
+        service_concurrency=REPLAY_SERVICE_CONCURRENCY,
+        global_concurrency=REPLAY_GLOBAL_CONCURRENCY,
+    )
+
 @app.on_event("startup")
 def startup():
     """Open DB connection and (optionally) fetch JWKS from Auth0.
 
-    The JWKS fetch is only attempted if AUTH0_DOMAIN is configured. The
-    fetched JWKS is stored in `app.state.jwks` for use by the JWT verifier.
+    The JWKS cache is only prepared if AUTH0_DOMAIN is configured. It is
+    stored in `app.state.jwks_cache` for use by the JWT verifier.
     """
-    init_db()
-
-    # If Auth0 domain is set, prepare a PyJWKClient to fetch JWKs on demand.
+    db_manager = init_db()
+    app.state.replay_engine = init_replay_engine()
+    app.state.jobs = JobScheduler(
+        db_manager,
+        app.state.replay_engine,
+        workers=int(os.getenv("JOB_WORKERS", 2)),
+    )
+
+    # If Auth0 domain is set, prepare a JWKS cache; keys are fetched on the
+    # first verification and refreshed in the background after that.
     if AUTH0_DOMAIN:
-        try:
-            jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-            app.state.jwks_client = PyJWKClient(jwks_url)
-        except Exception:
-            # Do not crash the app if JWKS client cannot be prepared at startup;
-            # verification will attempt to prepare/fetch on demand and raise a
-            # proper 401/500.
-            app.state.jwks_client = None
+        jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
+        app.state.jwks_cache = JwksCache(jwks_url)
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
+    jobs = getattr(app.state, "jobs", None)
+    if jobs:
+        await jobs.aclose()
+
+    engine = getattr(app.state, "replay_engine", None)
+    if engine:
+        await engine.aclose()
+    await close_nemotron_client()
+    close_diff_pool()
+
+    jwks_cache = getattr(app.state, "jwks_cache", None)
+    if jwks_cache:
+        await jwks_cache.aclose()
+
     db = getattr(app.state, "db", None)
     if db:
         db.close()
 
 
-def get_db() -> sqlite3.Connection:
-    """Return the application's database connection.
+def get_db() -> SQLitePool:
+    """Return the application's database connection pool.
 
     Use this in endpoints as a dependency if needed:
 
-        def endpoint(db: sqlite3.Connection = Depends(get_db)):
+        def endpoint(db: SQLitePool = Depends(get_db)):
             ...
     """
     return app.state.db
 
 
+@app.middleware("http")
+async def observe_requests(request: fastapi.Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep the label set bounded
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
+
+@app.get("/metrics")
+def metrics():
+    """Process metrics in the Prometheus text format."""
+    return fastapi.responses.Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/replay/connections")
+def replay_connections():
+    """Per replay target origin: its connection pool settings and how many
+    calls reused a pooled connection instead of opening a new one.
+    """
+    return app.state.replay_engine.transports.stats()
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
 
-@app.get("/profiles/{profile}/services")
-async def list_services(profile: str):
+def parse_fields(fields: Optional[str], allowed) -> tuple:
+    """Turn a comma-separated `fields` query value into the columns to
+    select, in `allowed` order. `id` is always included since it is the
+    page cursor.
+    """
+    if not fields:
+        return tuple(allowed)
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}; expected some of {', '.join(allowed)}")
+    wanted.add("id")
+    return tuple(f for f in allowed if f in wanted)
+
+
+def listing_etag(request: fastapi.Request, tables: tuple) -> str:
+    """ETag of a listing response. It only depends on the URL and on the
+    write generations of `tables`, so it is known before reading anything
+    and must be taken before the read.
+    """
     db_manager: UpGuardianSQLiteDB = app.state.db_manager
-    services = await db_manager.getServices(profile)
+    return db_manager.cache.etag(tables, str(request.url.path) + "?" + str(request.url.query))
 
-    async def _get(svc: Service):
-        old_endpoint = await svc.get_old_endpoint()
-        new_endpoint = await svc.get_new_endpoint()
-        name = await svc.get_name()
-        return {"id": svc.id, "name": name, "old_endpoint": old_endpoint, "new_endpoint": new_endpoint}
 
-    results = await asyncio.gather(*[_get(s) for s in services])
-    return list(results)
+def not_modified(request: fastapi.Request, etag: str) -> Optional[fastapi.responses.Response]:
+    """A 304 response if the client's If-None-Match already has `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    tags = {tag.strip() for tag in header.split(",")}
+    # If-None-Match uses the weak comparison
+    if "*" in tags or etag in tags or etag.removeprefix("W/") in tags:
+        return fastapi.responses.Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def page_response(rows: list, limit: Optional[int], etag: Optional[str] = None):
+    """List response for a listing page; when the page is full, the id to
+    pass as `after` for the next page goes in the X-Next-Cursor header.
+    """
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    if etag:
+        # clients may keep the response but must revalidate it
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    return fastapi.responses.JSONResponse(rows, headers=headers)
+
+
+@app.get("/profiles/{profile}/services")
+async def list_services(
+    request: fastapi.Request,
+    profile: str,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+):
+    """Services of a profile in id order. Page with `limit` and
+    `after=<X-Next-Cursor>`; `fields` picks the returned keys. Send the
+    ETag back in If-None-Match to get a 304 while nothing changed.
+    """
+    try:
+        columns = parse_fields(fields, SERVICE_FIELDS)
+    except ValueError as e:
+        return fastapi.responses.JSONResponse({"error": str(e)}, status_code=400)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    etag = listing_etag(request, ("services",))
+    if cached := not_modified(request, etag):
+        return cached
+
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    services = await db_manager.page_services(profile, after=after, limit=limit, fields=columns)
+    return page_response(services, limit, etag)
 
 
 @app.post("/profiles/{profile}/services")
@@ -129,10 +279,8 @@ async def create_service_for_profile(profile: str, body: dict):
 
     db_manager: UpGuardianSQLiteDB = app.state.db_manager
     svc = await db_manager.createService(profile, name, old_endpoint=old_endpoint, new_endpoint=new_endpoint)
-    current_name = await svc.get_name()
-    current_old = await svc.get_old_endpoint()
-    current_new = await svc.get_new_endpoint()
-    return {"id": svc.id, "name": current_name, "old_endpoint": current_old, "new_endpoint": current_new, "profile": svc.profile}
+    row = await db_manager.load_service(svc.id)
+    return {**row.to_dict(), "profile": svc.profile}
 
 
 @app.put("/services/{service_id}")
@@ -157,10 +305,8 @@ async def put_service(service_id: str, body: dict):
     service = await db_manager.createService(profile, service_id, old_endpoint=old_endpoint, new_endpoint=new_endpoint)
 
     # read back endpoint and name to confirm
-    current_old = await service.get_old_endpoint()
-    current_new = await service.get_new_endpoint()
-    current_name = await service.get_name()
-    return {"id": service.id, "name": current_name, "old_endpoint": current_old, "new_endpoint": current_new, "profile": service.profile}
+    row = await db_manager.load_service(service.id)
+    return {**row.to_dict(), "profile": service.profile}
 
 
 @app.delete("/services/{service_id}")
@@ -190,6 +336,8 @@ async def create_request(service_id: int, body: dict):
         return fastapi.responses.JSONResponse({"error": "endpoint and method are required"}, status_code=400)
 
     db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    if not await db_manager.load_service(service_id):
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
     req = await db_manager.create_request(int(service_id), endpoint, method, rb)
     data = await req.to_dict()
     return data
@@ -212,6 +360,9 @@ async def update_request(request_id: int, body: dict):
     req = await db_manager.get_request(request_id)
     if not req:
         return fastapi.responses.JSONResponse({"error": "not found"}, status_code=404)
+    # Checked up front so a bad service id doesn't leave a partial update
+    if body.get("service") is not None and not await db_manager.load_service(int(body["service"])):
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=400)
 
     # Use the Request instance setters (they offload to threads).
     if "service" in body and body.get("service") is not None:
@@ -223,6 +374,8 @@ async def update_request(request_id: int, body: dict):
     if "body" in body:
         # allow setting body to null/None
         await req.set_body(body.get("body"))
+    if "skipped" in body and body.get("skipped") is not None:
+        await req.set_skipped(bool(body.get("skipped")))
 
     return await req.to_dict()
 
@@ -237,18 +390,120 @@ async def delete_request(request_id: int):
 
 
 @app.get("/services/{service}/requests")
-async def list_service_requests(service: int):
-    """List stored requests for the given integer service id by acquiring a
-    Service object and using its list_requests() method.
+async def list_service_requests(
+    request: fastapi.Request,
+    service: int,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    method: Optional[str] = None,
+    endpoint_prefix: Optional[str] = None,
+):
+    """List stored requests for the given integer service id in id order,
+    one indexed query per page.
+
+    Page with `limit` and `after=<X-Next-Cursor>`; `fields` picks the
+    returned keys (e.g. `fields=id,method,endpoint` leaves out bodies);
+    `method` and `endpoint_prefix` filter the requests. Send the ETag
+    back in If-None-Match to get a 304 while nothing changed.
     """
+    try:
+        columns = parse_fields(fields, REQUEST_FIELDS)
+    except ValueError as e:
+        return fastapi.responses.JSONResponse({"error": str(e)}, status_code=400)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    etag = listing_etag(request, ("services", "requests"))
+    if cached := not_modified(request, etag):
+        return cached
+
     db_manager: UpGuardianSQLiteDB = app.state.db_manager
-    svc = await db_manager.get_service_by_id(service)
+    svc = await db_manager.load_service(service)
     if not svc:
         return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
 
-    reqs = await svc.list_requests()
-    results = await asyncio.gather(*[r.to_dict() for r in reqs])
-    return list(results)
+    reqs = await db_manager.page_requests(
+        service, after=after, limit=limit, fields=columns, method=method, endpoint_prefix=endpoint_prefix
+    )
+    return page_response(reqs, limit, etag)
+
+
+@app.post("/services/{service_id}/reduce")
+async def reduce_service_requests(
+    service_id: int,
+    per_group: int = 3,
+    strategy: str = "stratified",
+    dry_run: bool = False,
+):
+    """Shrink a service's suite to a representative subset.
+
+    Requests are grouped by method, path template (ids normalized to `{id}`)
+    and body shape; `per_group` of each group are kept, picked evenly over
+    capture order ("stratified") or to cover the most distinct body fields
+    and query parameters ("coverage"). The rest are marked skipped and left
+    out of runs. Re-running replaces the previous reduction; `dry_run` only
+    reports what would be kept.
+    """
+    if strategy not in STRATEGIES:
+        return fastapi.responses.JSONResponse({"error": "strategy must be stratified or coverage"}, status_code=400)
+    if per_group < 1:
+        return fastapi.responses.JSONResponse({"error": "per_group must be at least 1"}, status_code=400)
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    if not await db_manager.load_service(service_id):
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+
+    reduction = reduce_suite(await db_manager.load_requests(service_id), per_group, strategy)
+    if not dry_run:
+        await db_manager.set_skipped(service_id, reduction.skip)
+    return {"service_id": service_id, "strategy": strategy, "dry_run": dry_run, **reduction.to_dict()}
+
+
+@app.delete("/services/{service_id}/reduce")
+async def clear_service_reduction(service_id: int):
+    """Undo suite reduction: every stored request is replayed again."""
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    if not await db_manager.load_service(service_id):
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    await db_manager.set_skipped(service_id, [])
+    return {"service_id": service_id, "skipped": 0}
+
+@app.post("/services/{service_id}/requests/import")
+async def import_service_requests(service_id: int, request: fastapi.Request, format: str = "ndjson"):
+    """Bulk-add requests to a service from a HAR file or NDJSON (one
+    {"endpoint", "method", "body"} object per line) sent as the request
+    body. The body is parsed as it streams in and inserted in batches;
+    the response reports counts, skipped entries and throughput.
+    """
+    if format not in TRANSFER_FORMATS:
+        return fastapi.responses.JSONResponse({"error": "format must be ndjson or har"}, status_code=400)
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+
+    async def _text():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for chunk in request.stream():
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    return await import_requests(db_manager, service, _text(), format)
+
+
+@app.get("/services/{service_id}/requests/export")
+async def export_service_requests(service_id: int, format: str = "ndjson"):
+    """Stream a service's stored requests as NDJSON (the import format) or
+    as a HAR file with URLs on the service's old endpoint.
+    """
+    if format not in TRANSFER_FORMATS:
+        return fastapi.responses.JSONResponse({"error": "format must be ndjson or har"}, status_code=400)
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    media_type = "application/json" if format == "har" else "application/x-ndjson"
+    return fastapi.responses.StreamingResponse(export_requests(db_manager, service, format), media_type=media_type)
 
 class TestRequest(BaseModel):
     method: str
@@ -259,65 +514,402 @@ class TestResponse(BaseModel):
     service2_responses: list[bytes]
 
 @app.put("/run/{service_id}")
-async def run_tests(service_id: int):
+async def run_tests(
+    service_id: int,
+    concurrency: Optional[int] = fastapi.Query(None, ge=1, le=REPLAY_GLOBAL_CONCURRENCY),
+    samples: int = fastapi.Query(1, ge=1, le=MAX_LATENCY_SAMPLES),
+    fail_on_latency: bool = False,
+    breakdown: bool = False,
+    full: bool = False,
+):
+    """Replay the stored requests of a service against its old and new
+    endpoints. `concurrency` optionally overrides how many requests of this
+    service are replayed at once, for this run only.
+
+    Only requests that are new, were edited or didn't pass their last run
+    against the same endpoints are replayed (`unchanged` counts the rest);
+    `full` replays all of them.
+
+    The response also compares old and new latency per route. `samples`
+    sends each GET/HEAD/OPTIONS request that many times per side for more
+    stable numbers; with `fail_on_latency`, a latency regression makes the
+    run fail (`passed` false) just like a schema break. `breakdown` adds
+    the time the run spent per stage (database, replay, analysis, model).
+    """
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    return await run_tests_helper(
+        service_id,
+        db_manager,
+        engine=app.state.replay_engine,
+        concurrency=concurrency,
+        samples=samples,
+        fail_on_latency=fail_on_latency,
+        breakdown=breakdown,
+        incremental=not full,
+    )
+
+@app.put("/run/{service_id}/stream")
+async def run_tests_stream(
+    service_id: int,
+    format: str = "ndjson",
+    concurrency: Optional[int] = fastapi.Query(None, ge=1, le=REPLAY_GLOBAL_CONCURRENCY),
+    include_bodies: bool = False,
+    samples: int = fastapi.Query(1, ge=1, le=MAX_LATENCY_SAMPLES),
+    full: bool = False,
+):
+    """Streaming variant of PUT /run/{service_id}.
+
+    Emits one event per request verdict as soon as it is ready (in completion
+    order; each event carries the request's `index`), followed by a final
+    summary event. `format` is "ndjson" (one JSON object per line, with a
+    `type` of "result" or "summary") or "sse" (server-sent events named
+    "result" and "summary"). Response bodies are only included with
+    `include_bodies`, so the stream doesn't have to hold them. The summary
+    carries the per-route latency comparison (see `samples` on PUT
+    /run/{service_id}). Like there, unchanged passing requests are only
+    replayed with `full`.
+    """
+    if format not in ("ndjson", "sse"):
+        return fastapi.responses.JSONResponse({"error": "format must be ndjson or sse"}, status_code=400)
+
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    requests = await db_manager.load_requests(service_id, include_skipped=False)
+    pair = service.endpoint_pair()
+    unchanged = 0
+    if not full:
+        stored = len(requests)
+        requests = changed_requests(requests, await db_manager.history.last_verdicts(service_id, pair))
+        unchanged = stored - len(requests)
+
+    engine: ReplayEngine = app.state.replay_engine
+
+    def _encode(event: str, data: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"type": event, **data}) + "\n"
+
+    async def _events():
+        # The run is only recorded once the response actually starts
+        # streaming, so a client that's gone by then leaves no run behind.
+        recorder = await db_manager.history.start(service_id, len(requests), pair)
+        started = time.perf_counter()
+        passed = failed = errors = 0
+        latency = LatencyStats()
+        outcomes = iter_run(
+            engine, service, requests, db_manager.verdicts, recorder, samples, concurrency
+        )
+        try:
+            async for outcome in outcomes:
+                latency.add(outcome)
+                if outcome.passed:
+                    passed += 1
+                else:
+                    failed += 1
+                if outcome.result.error is not None:
+                    errors += 1
+                yield _encode("result", outcome.to_dict(include_bodies))
+        finally:
+            # iter_run finishes the run itself, unless it was never started
+            await outcomes.aclose()
+            await asyncio.shield(recorder.finish("aborted"))
+        yield _encode("summary", {
+            "service_id": service_id,
+            "run_id": recorder.run_id,
+            "total": len(requests),
+            "passed": passed,
+            "failed": failed,
+            "errors": errors,
+            "unchanged": unchanged,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "latency": latency.to_dict(),
+        })
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return fastapi.responses.StreamingResponse(_events(), media_type=media_type)
+
+@app.put("/loadtest/{service_id}")
+async def load_test(
+    service_id: int,
+    duration: float = 10.0,
+    rps: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    methods: Optional[str] = None,
+):
+    """Load-test the old and new endpoint of a service side by side with its
+    stored requests (cycled in order, skipped ones left out).
+
+    Give either `rps` for an open-loop test at a fixed arrival rate or
+    `concurrency` for that many closed-loop workers; both sides are driven
+    at once for `duration` seconds. `methods` (e.g. "GET,HEAD") limits which
+    stored requests are sent. Returns latency histograms, status counts,
+    error rates and throughput per side.
+    """
+    try:
+        config = LoadTestConfig(duration=duration, rps=rps, concurrency=concurrency)
+    except ValueError as e:
+        return fastapi.responses.JSONResponse({"error": str(e)}, status_code=400)
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    requests = filter_methods(await db_manager.load_requests(service_id, include_skipped=False), methods)
+    if not requests:
+        return fastapi.responses.JSONResponse({"error": "no requests to replay"}, status_code=400)
+    return await run_load_test(app.state.replay_engine, service, requests, config)
+
+@app.put("/schema/{service_id}")
+async def check_schema(service_id: int, per_route: int = 3, refresh: bool = False):
+    """Schema-level comparison of a service's old and new endpoint.
+
+    Instead of diffing every response, a few requests per route (method and
+    path template) are replayed and a signature is inferred from the
+    responses of each side: types per field, which fields are always
+    present, array item shapes. Signatures are cached per route for the
+    service's current endpoints; `refresh` samples again. Each route
+    reports fields added, removed, made optional, or changed in type or
+    nesting, and whether the new schema is compatible.
+    """
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    return await check_schemas(db_manager, app.state.replay_engine, service, per_route=max(1, per_route), refresh=refresh)
+
+@app.get("/services/{service_id}/schemas")
+async def list_schemas(service_id: int):
+    """Cached response signatures of a service's routes for its current
+    endpoints, as inferred by PUT /schema/{service_id}.
+    """
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    service = await db_manager.load_service(service_id)
+    if not service:
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+    routes = await db_manager.schemas.load(service_id, service.endpoint_pair())
+    return [{"method": method, "path": route, **sides} for (method, route), sides in routes.items()]
+
+@app.post("/jobs/run/{service_id}", status_code=202)
+async def submit_run_job(service_id: int, priority: int = 0, full: bool = False):
+    """Queue a test run of the service in the background and return its job
+    id at once. Poll GET /jobs/{job_id} for progress; the finished run is
+    stored like any other (see `run_id`). Like PUT /run/{service_id}, only
+    new, changed or previously failing requests are replayed unless `full`.
+    """
     db_manager: UpGuardianSQLiteDB = app.state.db_manager
-    return await run_tests_helper(service_id, db_manager)
+    if not await db_manager.load_service(service_id):
+        return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
+
+    scheduler: JobScheduler = app.state.jobs
+    return scheduler.submit(service_id, priority=priority, full=full).to_dict()
 
-async def run_tests_helper(service_id: int, db_manager: UpGuardianSQLiteDB):
-    service = await db_manager.get_service_by_id(service_id)
+@app.get("/jobs")
+async def list_jobs():
+    scheduler: JobScheduler = app.state.jobs
+    return [job.to_dict() for job in scheduler.list()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a job: done/total and p50/p95 replay latency
+    of the requests finished so far.
+    """
+    scheduler: JobScheduler = app.state.jobs
+    job = scheduler.get(job_id)
+    if not job:
+        return fastapi.responses.JSONResponse({"error": "job not found"}, status_code=404)
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    scheduler: JobScheduler = app.state.jobs
+    if not scheduler.cancel(job_id):
+        return fastapi.responses.JSONResponse({"error": "job not found or already finished"}, status_code=404)
+    return scheduler.get(job_id).to_dict()
+
+async def run_tests_helper(
+    service_id: int,
+    db_manager: UpGuardianSQLiteDB,
+    engine: Optional[ReplayEngine] = None,
+    concurrency: Optional[int] = None,
+    samples: int = 1,
+    fail_on_latency: bool = False,
+    breakdown: bool = False,
+    incremental: bool = False,
+):
+    service = await db_manager.load_service(service_id)
     if not service:
         return fastapi.responses.JSONResponse({"error": "service not found"}, status_code=404)
 
-    requests = await service.list_requests()
-
-    responses_1 = []
-    responses_2 = []
-    response_statuses: list[bool] = []
-    for request in requests:
-        service_endpoint1 = await service.get_old_endpoint()
-        service_endpoint2 = await service.get_new_endpoint()
-        request_endpoint = await request.get_endpoint()
-        request_data = await request.get_body()
-
-        response1 = httpx.request(
-            method=await request.get_method(),
-            url=service_endpoint1 + request_endpoint,
-            data=request_data,
-        ).json()
-
-        response2 = httpx.request(
-            method=await request.get_method(),
-            url=service_endpoint2 + request_endpoint,
-            data=request_data,
-        ).json()
-
-        responses_1.append(response1)
-        responses_2.append(response2)
-
-        response_statuses.append(analyze_responses(response1, response2))
-
-    return {
-        "service1_responses": responses_1,
-        "service2_responses": responses_2,
-        "response_statuses": response_statuses,
+    # Without a shared engine (e.g. from the CLI) use a private one for this run.
+    owns_engine = engine is None
+    if engine is None:
+        engine = init_replay_engine()
+
+    try:
+        report = await run_service(
+            db_manager,
+            engine,
+            service,
+            samples=max(1, samples),
+            breakdown=breakdown,
+            incremental=incremental,
+            concurrency=concurrency,
+        )
+    finally:
+        if owns_engine:
+            await engine.aclose()
+
+    latency = report.latency.to_dict()
+    passed = all(o.passed for o in report.outcomes) and not (fail_on_latency and latency["regressions"])
+    data = {
+        "run_id": report.run_id,
+        "passed": passed,
+        "unchanged": report.unchanged,
+        "service1_responses": [o.result.response1 for o in report.outcomes],
+        "service2_responses": [o.result.response2 for o in report.outcomes],
+        "response_statuses": [o.passed for o in report.outcomes],
+        "timings": [o.timing() for o in report.outcomes],
+        "latency": latency,
     }
+    if report.timings is not None:
+        data["breakdown"] = report.timings.to_dict()
+    return data
+
 
-def analyze_responses(response1: dict, response2: dict) -> bool:
+@app.put("/profiles/{profile}/run")
+async def run_profile(
+    profile: str,
+    parallel: int = 4,
+    format: str = "json",
+    samples: int = fastapi.Query(1, ge=1, le=MAX_LATENCY_SAMPLES),
+    fail_on_latency: bool = False,
+    full: bool = False,
+):
+    """Run every service of a profile in parallel and return one combined
+    report (`format` "json" or "junit"). `samples`, `fail_on_latency` and
+    `full` work as on PUT /run/{service_id}.
+    """
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    services = await db_manager.load_services(profile)
+    suites = await run_many_helper(
+        db_manager,
+        services,
+        engine=app.state.replay_engine,
+        parallel=parallel,
+        samples=samples,
+        fail_on_latency=fail_on_latency,
+        incremental=not full,
+    )
+    return _many_response(suites, [], format)
+
+@app.put("/run")
+async def run_many(
+    ids: str,
+    parallel: int = 4,
+    format: str = "json",
+    samples: int = fastapi.Query(1, ge=1, le=MAX_LATENCY_SAMPLES),
+    fail_on_latency: bool = False,
+    full: bool = False,
+):
+    """Run the services in `ids` (comma-separated) in parallel and return one
+    combined report (`format` "json" or "junit"). `samples`,
+    `fail_on_latency` and `full` work as on PUT /run/{service_id}.
+    """
     try:
-        if response1 == response2:
-            return True
+        service_ids = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        return fastapi.responses.JSONResponse({"error": "ids must be comma-separated integers"}, status_code=400)
+
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    services = await db_manager.load_services_by_id(service_ids)
+    found = {svc.id for svc in services}
+    missing = [i for i in service_ids if i not in found]
+    suites = await run_many_helper(
+        db_manager,
+        services,
+        engine=app.state.replay_engine,
+        parallel=parallel,
+        samples=samples,
+        fail_on_latency=fail_on_latency,
+        incremental=not full,
+    )
+    return _many_response(suites, missing, format)
+
+def _many_response(suites: list[SuiteReport], missing: list[int], format: str):
+    if format == "junit":
+        return fastapi.responses.Response(junit_xml(suites, missing), media_type="application/xml")
+    return combined_report(suites, missing)
+
+async def run_many_helper(
+    db_manager: UpGuardianSQLiteDB,
+    services: list[ServiceRow],
+    engine: Optional[ReplayEngine] = None,
+    parallel: int = 4,
+    samples: int = 1,
+    fail_on_latency: bool = False,
+    incremental: bool = False,
+) -> list[SuiteReport]:
+    """Run several services in one process on a shared engine, at most
+    `parallel` suites at a time. `incremental` runs skip unchanged passing
+    requests (see run_service).
+    """
+    owns_engine = engine is None
+    if engine is None:
+        engine = init_replay_engine()
+
+    suites = {svc.id: SuiteReport(svc, fail_on_latency) for svc in services}
+    try:
+        reports = await run_services(
+            db_manager,
+            engine,
+            services,
+            max_parallel=max(1, parallel),
+            make_observer=lambda svc: suites[svc.id],
+            samples=max(1, samples),
+            incremental=incremental,
+        )
+    finally:
+        if owns_engine:
+            await engine.aclose()
+    for report in reports:
+        suites[report.service.id].latency = report.latency
+        suites[report.service.id].unchanged_requests = report.unchanged_requests
+    return list(suites.values())
+
+
+@app.get("/services/{service_id}/runs")
+async def list_service_runs(service_id: int, before: Optional[int] = None, limit: int = 20):
+    """Past runs of a service, newest first. Page with `before=<last run id>`."""
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    return await db_manager.history.list_runs(service_id, before=before, limit=min(limit, 200))
 
-        unimportant_keys = json.loads(get_unimportant_keys_nemotron(response1, response2))["unimportant_keys"]
-        for key in unimportant_keys:
-            if key in response1:
-                del response1[key]
 
-            if key in response2:
-                del response2[key]
+@app.get("/runs/{run_id}")
+async def get_run(run_id: int):
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    run = await db_manager.history.get_run(run_id)
+    if not run:
+        return fastapi.responses.JSONResponse({"error": "run not found"}, status_code=404)
+    return run
+
+
+@app.get("/runs/{run_id}/results")
+async def list_run_results(run_id: int, after: Optional[int] = None, limit: int = 100, failed_only: bool = False):
+    """Per-request results of a stored run in request order, with diff
+    summaries and body hashes (fetch bodies via GET /bodies/{hash}). Page
+    with `after=<last index>`.
+    """
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    if not await db_manager.history.get_run(run_id):
+        return fastapi.responses.JSONResponse({"error": "run not found"}, status_code=404)
+    return await db_manager.history.list_results(run_id, after=after, limit=min(limit, 1000), failed_only=failed_only)
 
-        if response1 == response2:
-            return True
-    except Exception:
-        return False
 
-    return False
\ No newline at end of file
+@app.get("/bodies/{digest}")
+async def get_body(digest: str):
+    db_manager: UpGuardianSQLiteDB = app.state.db_manager
+    body = await db_manager.history.get_body(digest)
+    if body is None:
+        return fastapi.responses.JSONResponse({"error": "body not found"}, status_code=404)
+    return body
@@ -0,0 +1,265 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds, from 0.5 ms to 60 s.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._label_text(key)} {_format_value(v)}" for key, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative `le` buckets, plus their sum and
+    count, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label key -> (per-bucket counts, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of the `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds every metric of the process and renders them in the Prometheus
+    text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DB_SECONDS = REGISTRY.histogram(
+    "upguardian_db_operation_seconds",
+    "Time from issuing a database operation to getting its result, including the thread hop.",
+    ["kind", "op"],
+)
+DB_QUEUE_SECONDS = REGISTRY.histogram(
+    "upguardian_db_queue_wait_seconds",
+    "Time a database operation waited for a reader thread or the writer.",
+    ["kind"],
+)
+DB_WRITE_BATCH = REGISTRY.histogram(
+    "upguardian_db_write_batch_size",
+    "Writes committed together in one writer transaction.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+REPLAY_REQUESTS = REGISTRY.counter(
+    "upguardian_replay_requests_total", "Outbound replay calls.", ["side", "outcome"]
+)
+REPLAY_CONNECTIONS = REGISTRY.counter(
+    "upguardian_replay_connections_total",
+    "Replay calls by target origin and whether they opened a new connection or reused a pooled one.",
+    ["origin", "connection"],
+)
+REPLAY_SECONDS = REGISTRY.histogram(
+    "upguardian_replay_request_seconds", "Total time of an outbound replay call.", ["side"]
+)
+REPLAY_TTFB_SECONDS = REGISTRY.histogram(
+    "upguardian_replay_ttfb_seconds", "Time to first byte of an outbound replay call.", ["side"]
+)
+NEMOTRON_CALLS = REGISTRY.counter(
+    "upguardian_nemotron_calls_total", "Model calls, by outcome.", ["outcome"]
+)
+NEMOTRON_SECONDS = REGISTRY.histogram(
+    "upguardian_nemotron_call_seconds", "Time of one model call (a batch of response pairs)."
+)
+NEMOTRON_BATCH = REGISTRY.histogram(
+    "upguardian_nemotron_batch_size", "Response pairs sent in one model call.", buckets=(1, 2, 4, 8, 16, 32)
+)
+ANALYZE_SECONDS = REGISTRY.histogram(
+    "upguardian_analyze_seconds",
+    "Time to judge one response pair, by how it was decided.",
+    ["decided_by"],
+)
+DIFF_SECONDS = REGISTRY.histogram(
+    "upguardian_diff_seconds", "Time of one structural JSON diff."
+)
+DIFF_OFFLOADS = REGISTRY.counter(
+    "upguardian_diff_offloaded_total", "Diffs of large responses run in the worker process pool."
+)
+STREAM_COMPARES = REGISTRY.counter(
+    "upguardian_stream_compares_total",
+    "Large JSON array responses compared element by element while streaming.",
+    ["outcome"],
+)
+VERDICTS = REGISTRY.counter("upguardian_verdicts_total", "Judged response pairs.", ["result"])
+VERDICT_CACHE = REGISTRY.counter(
+    "upguardian_verdict_cache_total", "Model verdict cache lookups.", ["result"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "upguardian_http_request_seconds", "Time to handle an API request.", ["method", "route", "status"]
+)
+
+
+class StageTimings:
+    """Per-run time spent per stage, summed over all requests of the run.
+
+    Stages overlap (many requests are in flight at once), so the sums can
+    exceed the run's wall time; they show which stage dominates.
+    """
+
+    def __init__(self):
+        self._seconds: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+        self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "stages": {
+                stage: {"total_ms": round(seconds * 1000, 3), "count": self._counts[stage]}
+                for stage, seconds in sorted(self._seconds.items())
+            },
+        }
+
+
+# The breakdown of the run the current task belongs to, if one is collected.
+# Tasks spawned by a run inherit it, so nested stages land in the same run.
+current_timings: contextvars.ContextVar[Optional[StageTimings]] = contextvars.ContextVar(
+    "current_timings", default=None
+)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
@@ -1,5 +1,28 @@
-from openai import OpenAI
-from pydantic import BaseModel
+import asyncio
+import json
+import os
+from typing import Any, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+from pydantic import BaseModel, ValidationError
+
+from .metrics import NEMOTRON_BATCH, NEMOTRON_CALLS, NEMOTRON_SECONDS
+
+# hosted instance; point these at e.g. https://integrate.api.nvidia.com/v1
+# (with a real key) to use the free API endpoint instead
+NEMOTRON_BASE_URL = os.getenv("NEMOTRON_BASE_URL", "http://38.80.122.216:8000/v1")
+NEMOTRON_API_KEY = os.getenv("NEMOTRON_API_KEY", "no-key")
+NEMOTRON_MODEL = "nvidia/nvidia-nemotron-nano-9b-v2"
+
+PROMPT = (
+    "You are a developer checking for breaking changes after upgrading an API server. You are given two API responses: one from an older version of the API, and another from an upgraded version. Compare the response schemas to detect breaking changes."
+    "List which keys are unchanged in the new schema."
+)
+
+BATCH_PROMPT = (
+    "You are a developer checking for breaking changes after upgrading an API server. You are given numbered pairs of API responses; in each pair, one response is from an older version of the API, and the other from an upgraded version. Compare the response schemas of each pair to detect breaking changes."
+    "For every pair, list which keys are unchanged in the new schema, and answer with one result per pair using the pair's index."
+)
 
 
 class OutputSchema(BaseModel):
@@ -18,61 +41,146 @@ class OutputSchemaStr(BaseModel):
 class OutputSchemaResponse(BaseModel):
     unimportant_keys: list[str]
 
+class OutputSchemaBatchItem(BaseModel):
+    index: int
+    unimportant_keys: list[str]
+
+class OutputSchemaBatch(BaseModel):
+    results: list[OutputSchemaBatchItem]
+
+
+class NemotronClient:
+    """Async Nemotron client shared for the life of the process.
+
+    Callers ask about one response pair at a time; pairs that arrive within
+    `batch_window` seconds of each other (up to `batch_size`) are sent to the
+    model together in a single guided-JSON prompt. At most `max_concurrency`
+    model calls are in flight, each bounded by `timeout`. Transport errors
+    are retried by the OpenAI client; replies that don't match the schema
+    are retried here, up to `max_retries` times either way.
+    """
+
+    def __init__(
+        self,
+        base_url: str = NEMOTRON_BASE_URL,
+        api_key: str = NEMOTRON_API_KEY,
+        model: str = NEMOTRON_MODEL,
+        batch_size: int = 8,
+        batch_window: float = 0.05,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+        max_retries: int = 2,
+    ):
+        self._client = AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=max_retries)
+        self._model = model
+        self._batch_size = batch_size
+        self._batch_window = batch_window
+        self._max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: List[Tuple[Any, Any, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def get_unimportant_keys(self, api_response_1, api_response_2) -> list[str]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((api_response_1, api_response_2, future))
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            # keep a reference so the task isn't garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, Any, asyncio.Future]]) -> None:
+        try:
+            async with self._semaphore:
+                NEMOTRON_BATCH.observe(len(batch))
+                with NEMOTRON_SECONDS.time():
+                    results = await self._ask([(r1, r2) for r1, r2, _ in batch])
+            NEMOTRON_CALLS.inc(outcome="ok")
+        except Exception as e:
+            NEMOTRON_CALLS.inc(outcome="error")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if i in results:
+                future.set_result(results[i])
+            else:
+                future.set_exception(RuntimeError(f"model returned no verdict for pair {i}"))
+
+    async def _ask(self, pairs: List[Tuple[Any, Any]]) -> dict[int, list[str]]:
+        if len(pairs) == 1:
+            schema = OutputSchemaResponse
+            messages = [
+                {"role": "system", "content": PROMPT},
+                {"role": "user", "content": json.dumps(pairs[0][0])},
+                {"role": "user", "content": json.dumps(pairs[0][1])},
+            ]
+        else:
+            schema = OutputSchemaBatch
+            messages = [{"role": "system", "content": BATCH_PROMPT}]
+            for i, (r1, r2) in enumerate(pairs):
+                messages.append({"role": "user", "content": f"Pair {i}:\nold: {json.dumps(r1)}\nnew: {json.dumps(r2)}"})
+
+        for attempt in range(self._max_retries + 1):
+            response = await self._client.chat.completions.create(
+                model=self._model,
+                messages=messages,
+                extra_body={"guided_json": schema.model_json_schema()},
+                temperature=0,
+                stream=False,
+            )
+            try:
+                parsed = schema.model_validate_json(response.choices[0].message.content)
+            except ValidationError:
+                if attempt == self._max_retries:
+                    raise
+                continue
+            if isinstance(parsed, OutputSchemaResponse):
+                return {0: parsed.unimportant_keys}
+            return {item.index: item.unimportant_keys for item in parsed.results}
+        return {}
+
+    async def aclose(self) -> None:
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._client.close()
+
+
+_client: Optional[NemotronClient] = None
+
+
+def get_nemotron_client() -> NemotronClient:
+    """Return the process-wide NemotronClient, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = NemotronClient(
+            batch_size=int(os.getenv("NEMOTRON_BATCH_SIZE", 8)),
+            max_concurrency=int(os.getenv("NEMOTRON_CONCURRENCY", 4)),
+            timeout=float(os.getenv("NEMOTRON_TIMEOUT", 60)),
+        )
+    return _client
+
 
-def get_unimportant_keys_nemotron(api_response_1, api_response_2):
-    json_schema = OutputSchemaResponse.model_json_schema()
-
-    prompt = (
-        "You are a developer checking for breaking changes after upgrading an API server. You are given two API responses: one from an older version of the API, and another from an upgraded version. Compare the response schemas to detect breaking changes."
-        "List which keys are unchanged in the new schema."
-    )
-
-    # api_response_1 = {
-    #     "id": "0",
-    #     "first_name": "john",
-    #     "last_name": "doe",
-    #     "street_address": "1111 SomePlace Lane",
-    #     "created_at": "2025-11-09T02:07:10.131782",
-    #     "last_login_at": "2025-11-09T02:07:10.131787"
-    # }
-    # api_response_2 = {
-    #     "id": "0",
-    #     "first_name": "john",
-    #     "middle_name": "",
-    #     "last_name": "doe",
-    #     "street_address": "1111 SomePlace Lane",
-    #     "created_at": "2025-11-09T03:26:07.728452",
-    #     "last_login_at": "2025-11-09T03:26:07.728456"
-    # }
-
-    messages = [
-        # system prompts
-        # {"role": "system", "content": "/no_think"},
-        {"role": "system", "content": prompt},
-
-        # user prompts (input from our application)
-        {"role": "user", "content": str(api_response_1)},
-        {"role": "user", "content": str(api_response_2)},
-    ]
-
-    # hosted instance
-    client = OpenAI(
-        base_url="http://38.80.122.216:8000/v1",
-        api_key="no-key",
-    )
-
-    # free API endpoint
-    # client = OpenAI(
-    #     base_url="https://integrate.api.nvidia.com/v1",
-    #     api_key="YOUR_API_KEY_HERE",
-    # )
-
-    response = client.chat.completions.create(
-        model="nvidia/nvidia-nemotron-nano-9b-v2",
-        messages=messages,
-        extra_body={"guided_json": json_schema},
-        temperature=0,
-        stream=False
-    )
-
-    return response.choices[0].message.content
+async def close_nemotron_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,226 @@
+import asyncio
+import concurrent.futures
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from .metrics import DB_QUEUE_SECONDS, DB_SECONDS, DB_WRITE_BATCH, record_stage
+
+T = TypeVar("T")
+
+# How many queued writes the writer thread folds into a single transaction.
+MAX_WRITE_BATCH = 64
+
+
+def _op_name(fn: Callable) -> str:
+    # "UpGuardianSQLiteDB.load_requests.<locals>._fetch" -> "UpGuardianSQLiteDB.load_requests"
+    name = getattr(fn, "__qualname__", None) or type(fn).__name__
+    return name.split(".<locals>", 1)[0]
+
+
+@dataclass
+class PoolConfig:
+    """Tunables for SQLitePool. The pragma values are applied to every
+    connection the pool opens.
+    """
+
+    path: str
+    # number of reader threads, each with its own connection
+    readers: int = 4
+    # OFF / NORMAL / FULL; NORMAL is durable enough under WAL
+    synchronous: str = "NORMAL"
+    # negative values are KiB, positive values are pages
+    cache_size: int = -16000
+    # bytes of the DB file to memory-map (0 disables mmap)
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5000
+
+
+def _fail(future: concurrent.futures.Future, error: BaseException) -> None:
+    # A caller may have cancelled its write meanwhile; setting the result of
+    # a done future raises, and would take the writer thread down with it.
+    if not future.done():
+        future.set_exception(error)
+
+
+class SQLitePool:
+    """Connection pool for a WAL-mode SQLite database.
+
+    Reads run on a small thread pool where every thread owns one connection,
+    so concurrent reads never share a connection and never wait on writes
+    (WAL readers see the last committed snapshot). All writes go through one
+    dedicated writer thread fed by a queue; queued writes are grouped into a
+    single transaction, each inside its own savepoint so one failing write
+    doesn't roll back its neighbours.
+
+    Callables passed to `read`/`write` receive the connection to use and must
+    not commit themselves; the writer commits on their behalf.
+    """
+
+    def __init__(self, config: PoolConfig):
+        self.config = config
+        self._local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._reader_lock = threading.Lock()
+        self._readers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.readers, thread_name_prefix="sqlite-reader"
+        )
+
+        self._write_queue: "queue.Queue[Optional[Tuple[Callable, concurrent.futures.Future, float]]]" = queue.Queue()
+        # The writer opens its connection first so WAL mode is in place before
+        # any reader connects.
+        self._writer_ready = threading.Event()
+        self._writer_error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        self._writer_ready.wait()
+        if self._writer_error is not None:
+            # e.g. an unusable path or a locked database
+            self._readers.shutdown(wait=False)
+            raise self._writer_error
+
+    def _connect(self, isolation_level: Optional[str] = "") -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.config.path,
+            check_same_thread=False,
+            isolation_level=isolation_level,
+            timeout=self.config.busy_timeout_ms / 1000,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA synchronous = {self.config.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.config.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.config.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.config.busy_timeout_ms)}")
+        # Off by default in SQLite, per connection; the schema's ON DELETE
+        # CASCADE clauses depend on it.
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    # --- reads ---------------------------------------------------------
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _run_read(self, fn: Callable[[sqlite3.Connection], T], issued: float) -> T:
+        DB_QUEUE_SECONDS.observe(time.perf_counter() - issued, kind="read")
+        return fn(self._reader_conn())
+
+    @staticmethod
+    def _observe(kind: str, fn: Callable, issued: float) -> None:
+        elapsed = time.perf_counter() - issued
+        DB_SECONDS.observe(elapsed, kind=kind, op=_op_name(fn))
+        record_stage(f"db_{kind}", elapsed)
+
+    async def read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run `fn(conn)` on a reader thread and return its result."""
+        loop = asyncio.get_running_loop()
+        issued = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._readers, self._run_read, fn, issued)
+        finally:
+            self._observe("read", fn, issued)
+
+    def read_sync(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return self._readers.submit(self._run_read, fn, time.perf_counter()).result()
+
+    # --- writes --------------------------------------------------------
+    def submit_write(self, fn: Callable[[sqlite3.Connection], T]) -> "concurrent.futures.Future[T]":
+        """Queue `fn(conn)` for the writer thread. The returned future
+        resolves once the transaction containing it has committed.
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._write_queue.put((fn, future, time.perf_counter()))
+        return future
+
+    async def write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        issued = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(self.submit_write(fn))
+        finally:
+            self._observe("write", fn, issued)
+
+    def write_sync(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return self.submit_write(fn).result()
+
+    def _writer_loop(self) -> None:
+        # Autocommit mode: transactions and savepoints are managed explicitly.
+        conn = None
+        try:
+            conn = self._connect(isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+        except BaseException as e:
+            # re-raised by __init__, which is waiting for us
+            self._writer_error = e
+            if conn is not None:
+                conn.close()
+            return
+        finally:
+            self._writer_ready.set()
+
+        stopping = False
+        while not stopping:
+            batch = [self._write_queue.get()]
+            while len(batch) < MAX_WRITE_BATCH:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [job for job in batch if job is not None]
+            if batch:
+                self._run_write_batch(conn, batch)
+
+        conn.close()
+
+    def _run_write_batch(self, conn: sqlite3.Connection, batch) -> None:
+        done = []
+        DB_WRITE_BATCH.observe(len(batch))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, future, _ in batch:
+                _fail(future, e)
+            return
+
+        for fn, future, queued_at in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            DB_QUEUE_SECONDS.observe(time.perf_counter() - queued_at, kind="write")
+            conn.execute("SAVEPOINT job")
+            try:
+                result = fn(conn)
+            except BaseException as e:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                _fail(future, e)
+                continue
+            conn.execute("RELEASE job")
+            done.append((future, result))
+
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            for future, _ in done:
+                _fail(future, e)
+            return
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
+
+    def close(self) -> None:
+        self._write_queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
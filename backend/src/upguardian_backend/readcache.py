@@ -0,0 +1,75 @@
+import hashlib
+import os
+import secrets
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Sequence, Tuple
+
+# Cached read results kept at once, and the total rows they may hold
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "256"))
+READ_CACHE_MAX_ROWS = int(os.getenv("READ_CACHE_MAX_ROWS", "50000"))
+
+
+class ReadCache:
+    """Read-through cache for reads of the `services` and `requests` tables.
+
+    Every table has a generation number that writers bump (through
+    `invalidate`) after their write committed. A cached result is stored
+    under the generations seen *before* it was read, so a result that may
+    predate a write is never served after that write. The same generations
+    make up ETags: a listing's ETag only changes when a table it reads was
+    written to, so it can be checked without touching the database.
+
+    Only writes made through this process are seen; the generations (and a
+    per-process nonce in every ETag) start over on restart.
+    """
+
+    def __init__(self, capacity: int = READ_CACHE_SIZE, max_rows: int = READ_CACHE_MAX_ROWS):
+        self._capacity = capacity
+        self._max_rows = max_rows
+        self._rows = 0
+        self._generations: Dict[str, int] = {}
+        # key -> (generations when read, value, row count)
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], Any, int]]" = OrderedDict()
+        self._nonce = secrets.token_hex(4)
+
+    def invalidate(self, *tables: str) -> None:
+        for table in tables:
+            self._generations[table] = self._generations.get(table, 0) + 1
+
+    def _version(self, tables: Sequence[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(table, 0) for table in tables)
+
+    def etag(self, tables: Sequence[str], key: str) -> str:
+        """Weak ETag for `key` (e.g. a request URL) reading `tables`."""
+        version = ",".join(map(str, self._version(tables)))
+        digest = hashlib.blake2b(f"{self._nonce}|{version}|{key}".encode(), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
+
+    async def get_or_load(self, tables: Sequence[str], key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result of `key`, or await `load()` and cache it
+        unless a table in `tables` was written to meanwhile.
+        """
+        if self._capacity < 1:
+            return await load()
+        version = self._version(tables)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._drop(key)
+
+        value = await load()
+        size = len(value) if isinstance(value, list) else 1
+        if size <= self._max_rows and self._version(tables) == version:
+            self._drop(key)
+            self._entries[key] = (version, value, size)
+            self._rows += size
+            while len(self._entries) > self._capacity or self._rows > self._max_rows:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= entry[2]
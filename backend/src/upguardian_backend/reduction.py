@@ -0,0 +1,160 @@
+import hashlib
+import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from .diff import json_type
+from .request import RequestRow
+
+STRATEGIES = ("stratified", "coverage")
+
+# Path segments that identify a resource rather than name an endpoint
+_ID_SEGMENT_RE = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,})$"
+)
+
+
+def path_template(endpoint: str) -> str:
+    """Normalize a stored endpoint to the route it hits.
+
+    Numeric, UUID and long hex path segments become `{id}` and query values
+    are dropped (keys are kept, sorted), so `/customers/17?sort=name` and
+    `/customers/42?sort=age` share the template `/customers/{id}?sort`.
+    """
+    parts = urlsplit(endpoint)
+    path = "/".join("{id}" if _ID_SEGMENT_RE.match(seg) else seg for seg in parts.path.split("/"))
+    keys = sorted({key for key, _ in parse_qsl(parts.query, keep_blank_values=True)})
+    return path + ("?" + "&".join(keys) if keys else "")
+
+
+def _shape(value: Any) -> Any:
+    kind = json_type(value)
+    if kind == "object":
+        return {key: _shape(child) for key, child in sorted(value.items())}
+    if kind == "array":
+        # union of the element shapes, in a stable order
+        return ["array", sorted({json.dumps(_shape(child), sort_keys=True) for child in value})]
+    return kind
+
+
+def body_shape(body: Optional[str]) -> str:
+    """Short hash of a request body's structure: keys and JSON types, never
+    values. Bodies that aren't JSON are grouped as "text".
+    """
+    if body is None:
+        return "none"
+    try:
+        value = json.loads(body)
+    except ValueError:
+        return "text"
+    canonical = json.dumps(_shape(value), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+
+def _features(request: RequestRow) -> Set[str]:
+    """What a request exercises, for coverage-based selection: each JSON
+    leaf path with its type (plus empty containers), and each query key
+    with whether it had a value.
+    """
+    features: Set[str] = set()
+    for key, value in parse_qsl(urlsplit(request.endpoint).query, keep_blank_values=True):
+        features.add(f"?{key}={'set' if value else 'empty'}")
+    if request.body is None:
+        return features
+    try:
+        value = json.loads(request.body)
+    except ValueError:
+        return features
+
+    def _walk(node: Any, path: str) -> None:
+        kind = json_type(node)
+        if kind == "object" and node:
+            for key, child in node.items():
+                _walk(child, f"{path}.{key}")
+        elif kind == "array" and node:
+            for child in node:
+                _walk(child, f"{path}[]")
+        else:
+            features.add(f"{path}:{kind}" + (":empty" if kind in ("object", "array") else ""))
+
+    _walk(value, "$")
+    return features
+
+
+def _stratified(members: Sequence[RequestRow], k: int) -> List[RequestRow]:
+    # evenly spaced across the group in capture (id) order
+    if len(members) <= k:
+        return list(members)
+    step = len(members) / k
+    return [members[int(i * step)] for i in range(k)]
+
+
+def _by_coverage(members: Sequence[RequestRow], k: int) -> List[RequestRow]:
+    # greedy set cover: repeatedly take the request adding the most unseen
+    # features, earliest first on ties
+    if len(members) <= k:
+        return list(members)
+    candidates = [(request, _features(request)) for request in members]
+    covered: Set[str] = set()
+    chosen: List[RequestRow] = []
+    while candidates and len(chosen) < k:
+        best = max(range(len(candidates)), key=lambda i: (len(candidates[i][1] - covered), -i))
+        request, features = candidates.pop(best)
+        chosen.append(request)
+        covered |= features
+    return chosen
+
+
+@dataclass
+class Reduction:
+    """The outcome of reduce_suite: which requests to keep replaying and
+    how the suite was grouped.
+    """
+
+    keep: List[int] = field(default_factory=list)
+    skip: List[int] = field(default_factory=list)
+    # (method, path template, body shape) -> (group size, kept ids)
+    groups: Dict[Tuple[str, str, str], Tuple[int, List[int]]] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": len(self.keep) + len(self.skip),
+            "kept": len(self.keep),
+            "skipped": len(self.skip),
+            "groups": [
+                {"method": method, "path": path, "body_shape": shape, "size": size, "kept": kept}
+                for (method, path, shape), (size, kept) in sorted(self.groups.items(), key=lambda g: -g[1][0])
+            ],
+        }
+
+
+def reduce_suite(requests: Sequence[RequestRow], per_group: int = 3, strategy: str = "stratified") -> Reduction:
+    """Group `requests` by method, path template and body shape and keep
+    `per_group` representatives of each group; the rest are to be skipped.
+
+    "stratified" spreads the picks evenly over each group in capture order;
+    "coverage" picks the requests that together exercise the most distinct
+    body fields, types and query parameters.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+    if per_group < 1:
+        raise ValueError("per_group must be at least 1")
+    pick = _stratified if strategy == "stratified" else _by_coverage
+
+    grouped: Dict[Tuple[str, str, str], List[RequestRow]] = defaultdict(list)
+    for request in sorted(requests, key=lambda r: r.id):
+        grouped[(request.method.upper(), path_template(request.endpoint), body_shape(request.body))].append(request)
+
+    reduction = Reduction()
+    for key, members in grouped.items():
+        kept = {request.id for request in pick(members, per_group)}
+        reduction.groups[key] = (len(members), sorted(kept))
+        for request in members:
+            (reduction.keep if request.id in kept else reduction.skip).append(request.id)
+    reduction.keep.sort()
+    reduction.skip.sort()
+    return reduction
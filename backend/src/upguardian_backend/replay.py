@@ -0,0 +1,500 @@
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .diff import DiffRules
+from .metrics import REPLAY_REQUESTS, REPLAY_SECONDS, REPLAY_TTFB_SECONDS, STREAM_COMPARES, record_stage
+from .request import RequestRow
+from .streamdiff import STREAM_COMPARE_BYTES, StreamComparison, compare_arrays, starts_array
+from .transport import TransportConfig, TransportPool
+
+# Defaults used when no explicit limit has been configured for a host or
+# service. They can be overridden when constructing the engine.
+DEFAULT_HOST_CONCURRENCY = 32
+DEFAULT_SERVICE_CONCURRENCY = 16
+DEFAULT_GLOBAL_CONCURRENCY = 256
+
+# Only these methods are sent more than once when extra latency samples are
+# requested; replaying anything else could change server state.
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Piece size in which the already buffered start of a streamed body is fed
+# to the comparison.
+_HEAD_PIECE = 64 * 1024
+
+
+def body_digest(raw: bytes) -> str:
+    """Content hash of a raw response body."""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+@dataclass
+class CallTiming:
+    """Where the time of one HTTP call went, in seconds.
+
+    `connect` is TCP connect plus TLS handshake (0 when a pooled connection
+    was `reused`), `ttfb` runs from sending the request until the response
+    headers arrived, and `total` until the body was fully read.
+    """
+
+    connect: float = 0.0
+    ttfb: float = 0.0
+    total: float = 0.0
+    reused: bool = True
+
+    def to_dict(self) -> dict:
+        return {
+            "connect_ms": round(self.connect * 1000, 3),
+            "ttfb_ms": round(self.ttfb * 1000, 3),
+            "total_ms": round(self.total * 1000, 3),
+            "reused": self.reused,
+        }
+
+
+class _Trace:
+    """httpx `trace` extension callback that fills in a CallTiming."""
+
+    def __init__(self, timing: CallTiming, started: float):
+        self._timing = timing
+        self._started = started
+        self._marks: Dict[str, float] = {}
+
+    async def __call__(self, event: str, info: dict) -> None:
+        now = time.perf_counter()
+        if event.endswith(".started"):
+            self._marks[event[: -len(".started")]] = now
+            if event == "connection.connect_tcp.started":
+                self._timing.reused = False
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self._timing.connect += now - self._marks.get(event[: -len(".complete")], now)
+        elif event.endswith("receive_response_headers.complete"):
+            self._timing.ttfb = now - self._started
+
+
+@dataclass
+class _Fetched:
+    """One call whose response headers arrived. `head` is the whole body,
+    or while `rest` is set only its first bytes, with the remainder still
+    unread on the open response (released by `close`).
+    """
+
+    side: str
+    timing: CallTiming
+    started: float
+    head: bytes = b""
+    rest: Optional[AsyncIterator[bytes]] = None
+    close: Optional[Callable[[], Awaitable[None]]] = None
+    done: bool = False
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        # the head in pieces, so it isn't all decoded at once either
+        for start in range(0, len(self.head), _HEAD_PIECE):
+            yield self.head[start:start + _HEAD_PIECE]
+        if self.rest is not None:
+            async for chunk in self.rest:
+                yield chunk
+
+
+@dataclass
+class ReplayResult:
+    """Outcome of replaying one stored request against both endpoints.
+
+    `raw1`/`raw2` hold the undecoded bodies from the old and new endpoint and
+    `digest1`/`digest2` their content hashes; `response1`/`response2` decode
+    them as JSON on first access, so byte-identical responses never need to
+    be parsed. A body that isn't valid JSON decodes to its text instead, with
+    the reason in `decode_error1`/`decode_error2`. If either call failed, `error` describes why and the bodies
+    may be None. `elapsed` is the wall time in seconds for both calls.
+
+    `timing1`/`timing2` break down the first call to each side; `samples1`
+    and `samples2` hold the total time of every call made to each side
+    (more than one when the engine was asked for repeated samples).
+
+    Bodies too large to buffer that were compared while streaming (see
+    ReplayEngine.stream) leave the raw bodies and digests None and set
+    `streamed` instead.
+    """
+
+    index: int
+    request_id: int
+    raw1: Optional[bytes] = None
+    raw2: Optional[bytes] = None
+    digest1: Optional[str] = None
+    digest2: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    timing1: Optional[CallTiming] = None
+    timing2: Optional[CallTiming] = None
+    samples1: List[float] = field(default_factory=list)
+    samples2: List[float] = field(default_factory=list)
+    streamed: Optional[StreamComparison] = None
+    decode_error1: Optional[str] = None
+    decode_error2: Optional[str] = None
+
+    @property
+    def identical(self) -> bool:
+        """Both endpoints returned exactly the same bytes."""
+        return self.digest1 is not None and self.digest1 == self.digest2
+
+    @cached_property
+    def response1(self) -> Any:
+        value, self.decode_error1 = _decode(self.raw1)
+        return value
+
+    @cached_property
+    def response2(self) -> Any:
+        value, self.decode_error2 = _decode(self.raw2)
+        return value
+
+    @property
+    def decode_error(self) -> Optional[str]:
+        """Why a decoded body wasn't JSON (the old side's reason first)."""
+        return self.decode_error1 or self.decode_error2
+
+
+def _decode(raw: Optional[bytes]) -> Tuple[Any, Optional[str]]:
+    # (JSON value, None), or (text, reason) for a body that isn't JSON
+    if raw is None:
+        return None, None
+    try:
+        return json.loads(raw), None
+    except ValueError as e:
+        return raw.decode("utf-8", errors="replace"), f"invalid JSON response: {e}"
+
+
+class ReplayEngine:
+    """Replays stored requests concurrently over pooled httpx clients.
+
+    The old and new endpoint calls for a request are fired together, and many
+    requests are in flight at once. Concurrency is bounded per service (how
+    many requests of one service run at a time) and per host (how many calls
+    hit one origin at a time), so a single large suite can't swamp a target,
+    and globally across all services sharing the engine.
+
+    Every origin has its own long-lived connection pool (see
+    transport.TransportPool), whose reuse statistics are in
+    `transports.stats()`.
+    """
+
+    def __init__(
+        self,
+        host_concurrency: int = DEFAULT_HOST_CONCURRENCY,
+        service_concurrency: int = DEFAULT_SERVICE_CONCURRENCY,
+        global_concurrency: int = DEFAULT_GLOBAL_CONCURRENCY,
+        stream_threshold: int = STREAM_COMPARE_BYTES,
+        transport: Optional[TransportConfig] = None,
+    ):
+        self._default_host_limit = host_concurrency
+        self._stream_threshold = stream_threshold
+        self._default_service_limit = service_concurrency
+        self._host_limits: Dict[str, int] = {}
+        self._service_limits: Dict[int, int] = {}
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._service_semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._global_limit = global_concurrency
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self.transports = TransportPool(transport)
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """The pooled client for the origin of `url`."""
+        # Clients are created on first use, so they bind to the loop that
+        # actually uses them.
+        return self.transports.client(url)
+
+    async def send(self, method: str, url: str, body: Optional[str] = None) -> httpx.Response:
+        """One call to `url` over its pooled client, outside the concurrency
+        limits (load tests drive their own rate). Counted in the transport
+        statistics like replayed calls; the response body is read.
+        """
+        timing = CallTiming()
+        http_version = None
+        try:
+            response = await self.client_for(url).request(
+                method, url, content=body, extensions={"trace": _Trace(timing, time.perf_counter())}
+            )
+            http_version = response.http_version
+        finally:
+            self.transports.record(url, not timing.reused, http_version)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transports.aclose()
+
+    def set_host_limit(self, host: str, limit: int) -> None:
+        """Limit concurrent calls to `host` (e.g. "localhost:5001")."""
+        self._host_limits[host] = limit
+        self._host_semaphores.pop(host, None)
+
+    def set_service_limit(self, service_id: int, limit: int) -> None:
+        """Limit how many requests of `service_id` are replayed at once."""
+        if limit < 1:
+            raise ValueError("service concurrency limit must be at least 1")
+        if self._service_limits.get(service_id) == limit:
+            return
+        self._service_limits[service_id] = limit
+        self._service_semaphores.pop(service_id, None)
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        sem = self._host_semaphores.get(host)
+        if sem is None:
+            limit = self._host_limits.get(host, self._default_host_limit)
+            sem = self._host_semaphores[host] = asyncio.Semaphore(limit)
+        return sem
+
+    def _global(self) -> asyncio.Semaphore:
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self._global_limit)
+        return self._global_semaphore
+
+    def _service_semaphore(self, service_id: int) -> asyncio.Semaphore:
+        sem = self._service_semaphores.get(service_id)
+        if sem is None:
+            limit = self._service_limits.get(service_id, self._default_service_limit)
+            sem = self._service_semaphores[service_id] = asyncio.Semaphore(limit)
+        return sem
+
+    async def _fetch(
+        self, method: str, url: str, body: Optional[str], side: str, limit: Optional[int] = None
+    ) -> _Fetched:
+        # Sends one call and reads its body, or with a `limit` only about
+        # that many bytes of it. The host slot is held until the body has
+        # been read; if it wasn't read to the end, until `close` is awaited.
+        call = contextlib.AsyncExitStack()
+        await call.enter_async_context(self._host_semaphore(url))
+        fetched = _Fetched(side, CallTiming(), time.perf_counter())
+        try:
+            client = self.client_for(url)
+            request = client.build_request(
+                method, url, content=body, extensions={"trace": _Trace(fetched.timing, fetched.started)}
+            )
+            try:
+                response = await client.send(request, stream=True)
+            except Exception:
+                self.transports.record(url, not fetched.timing.reused)
+                raise
+            self.transports.record(url, not fetched.timing.reused, response.http_version)
+            call.push_async_callback(response.aclose)
+            if limit is None:
+                fetched.head = await response.aread()
+            else:
+                chunks = response.aiter_bytes()
+                head = bytearray()
+                while len(head) < limit and (chunk := await anext(chunks, None)) is not None:
+                    head += chunk
+                fetched.head = bytes(head)
+                if len(head) >= limit:
+                    fetched.rest = chunks
+        except BaseException as e:
+            await call.aclose()
+            if isinstance(e, Exception):
+                REPLAY_REQUESTS.inc(side=side, outcome="error")
+            raise
+        if fetched.rest is None:
+            await call.aclose()
+            self._finish(fetched)
+        else:
+            fetched.close = call.aclose
+        return fetched
+
+    def _finish(self, fetched: _Fetched) -> None:
+        fetched.done = True
+        fetched.timing.total = time.perf_counter() - fetched.started
+        REPLAY_REQUESTS.inc(side=fetched.side, outcome="ok")
+        REPLAY_SECONDS.observe(fetched.timing.total, side=fetched.side)
+        REPLAY_TTFB_SECONDS.observe(fetched.timing.ttfb, side=fetched.side)
+
+    async def _read_rest(self, old: _Fetched, new: _Fetched, rules: DiffRules) -> Optional[StreamComparison]:
+        # At least one body ran past the stream threshold. Two JSON arrays
+        # are compared element by element as they arrive; anything else is
+        # read whole after all and judged like any other response.
+        unfinished = [f for f in (old, new) if not f.done]
+        try:
+            if starts_array(old.head) and starts_array(new.head):
+                comparison = await compare_arrays(old.chunks(), new.chunks(), rules)
+                STREAM_COMPARES.inc(outcome="truncated" if comparison.truncated else "complete")
+            else:
+                comparison = None
+                for fetched in unfinished:
+                    fetched.head += b"".join([chunk async for chunk in fetched.rest])
+                    fetched.rest = None
+        except httpx.HTTPError:
+            for fetched in unfinished:
+                REPLAY_REQUESTS.inc(side=fetched.side, outcome="error")
+            raise
+        except ValueError:
+            # The calls went fine, it's a body that isn't a valid array
+            STREAM_COMPARES.inc(outcome="invalid")
+            for fetched in unfinished:
+                self._finish(fetched)
+            raise
+        for fetched in unfinished:
+            self._finish(fetched)
+        return comparison
+
+    async def _call(self, method: str, url: str, body: Optional[str], side: str) -> CallTiming:
+        # Only timed: the body is read, so `total` covers it, but not kept.
+        async with self._host_semaphore(url):
+            timing = CallTiming()
+            started = time.perf_counter()
+            http_version = None
+            try:
+                async with self.client_for(url).stream(
+                    method, url, content=body, extensions={"trace": _Trace(timing, started)}
+                ) as response:
+                    http_version = response.http_version
+                    async for _ in response.aiter_raw():
+                        pass
+            except Exception:
+                REPLAY_REQUESTS.inc(side=side, outcome="error")
+                raise
+            finally:
+                self.transports.record(url, not timing.reused, http_version)
+            timing.total = time.perf_counter() - started
+        REPLAY_REQUESTS.inc(side=side, outcome="ok")
+        REPLAY_SECONDS.observe(timing.total, side=side)
+        REPLAY_TTFB_SECONDS.observe(timing.ttfb, side=side)
+        return timing
+
+    async def _sample(self, result: ReplayResult, request: RequestRow, old_url: str, new_url: str, rounds: int) -> None:
+        # Extra rounds for latency samples; only timed, bodies aren't compared.
+        for _ in range(rounds):
+            try:
+                old, new = await asyncio.gather(
+                    self._call(request.method, old_url, request.body, "old"),
+                    self._call(request.method, new_url, request.body, "new"),
+                )
+            except httpx.HTTPError:
+                return
+            result.samples1.append(old.total)
+            result.samples2.append(new.total)
+
+    async def _replay_one(
+        self,
+        index: int,
+        service_sem: asyncio.Semaphore,
+        old_endpoint: str,
+        new_endpoint: str,
+        request: RequestRow,
+        samples: int = 1,
+        rules: Optional[DiffRules] = None,
+    ) -> ReplayResult:
+        result = ReplayResult(index=index, request_id=request.id)
+        old_url, new_url = old_endpoint + request.endpoint, new_endpoint + request.endpoint
+        limit = self._stream_threshold if rules is not None and self._stream_threshold > 0 else None
+        async with service_sem, self._global():
+            started = time.perf_counter()
+            async with contextlib.AsyncExitStack() as opened:
+                outcomes = await asyncio.gather(
+                    self._fetch(request.method, old_url, request.body, "old", limit),
+                    self._fetch(request.method, new_url, request.body, "new", limit),
+                    return_exceptions=True,
+                )
+                fetched = [o for o in outcomes if not isinstance(o, BaseException)]
+                for f in fetched:
+                    if f.close is not None:
+                        opened.push_async_callback(f.close)
+                errors = [o for o in outcomes if isinstance(o, BaseException)]
+                if not errors and any(f.rest is not None for f in fetched):
+                    try:
+                        result.streamed = await self._read_rest(*fetched, rules)
+                    except httpx.HTTPError as e:
+                        errors.append(e)
+                    except ValueError as e:
+                        result.error = f"invalid JSON response: {e}"
+            result.elapsed = time.perf_counter() - started
+            record_stage("replay", result.elapsed)
+            if not errors and request.method.upper() in SAFE_METHODS:
+                await self._sample(result, request, old_url, new_url, samples - 1)
+        if errors:
+            result.error = f"{type(errors[0]).__name__}: {errors[0]}"
+        old, new = (o if isinstance(o, _Fetched) and o.done else None for o in outcomes)
+        if old is not None:
+            result.timing1 = old.timing
+            result.samples1.insert(0, old.timing.total)
+            if old.rest is None:
+                result.raw1, result.digest1 = old.head, body_digest(old.head)
+        if new is not None:
+            result.timing2 = new.timing
+            result.samples2.insert(0, new.timing.total)
+            if new.rest is None:
+                result.raw2, result.digest2 = new.head, body_digest(new.head)
+        return result
+
+    async def stream(
+        self,
+        service_id: int,
+        old_endpoint: str,
+        new_endpoint: str,
+        requests: Iterable[RequestRow],
+        samples: int = 1,
+        rules: Optional[DiffRules] = None,
+        concurrency: Optional[int] = None,
+    ) -> AsyncIterator[ReplayResult]:
+        """Replay `requests` against both endpoints, yielding each result as
+        soon as it completes (so not necessarily in request order; use
+        `ReplayResult.index` to restore it).
+
+        Only a bounded window of requests is scheduled at a time, so a slow
+        consumer holds back the replay instead of buffering every result.
+        With `samples` > 1, requests of SAFE_METHODS are sent that many times
+        to each side to collect latency samples.
+
+        With diff `rules`, bodies longer than the engine's stream threshold
+        aren't buffered when both are JSON arrays: they are compared element
+        by element while being read (see streamdiff.compare_arrays), and the
+        result carries that comparison in `streamed` instead of the bodies.
+
+        `concurrency` overrides the service's limit for this call only.
+        """
+        if concurrency is None:
+            service_sem = self._service_semaphore(service_id)
+            limit = self._service_limits.get(service_id, self._default_service_limit)
+        elif concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        else:
+            service_sem, limit = asyncio.Semaphore(concurrency), concurrency
+        # a window of 0 would schedule nothing and end the run right away
+        assert limit >= 1, f"service concurrency limit must be at least 1, got {limit}"
+        window = 2 * limit
+        pending: set[asyncio.Task] = set()
+        queued = iter(enumerate(requests))
+        try:
+            while True:
+                for i, request in itertools.islice(queued, window - len(pending)):
+                    pending.add(asyncio.create_task(
+                        self._replay_one(i, service_sem, old_endpoint, new_endpoint, request, samples, rules)
+                    ))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def replay(
+        self,
+        service_id: int,
+        old_endpoint: str,
+        new_endpoint: str,
+        requests: Sequence[RequestRow],
+    ) -> List[ReplayResult]:
+        """Replay `requests` against both endpoints.
+
+        Results are returned in the same order as `requests`, regardless of
+        the order in which they complete.
+        """
+        results = [r async for r in self.stream(service_id, old_endpoint, new_endpoint, requests)]
+        results.sort(key=lambda r: r.index)
+        return results
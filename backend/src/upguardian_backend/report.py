@@ -0,0 +1,163 @@
+import json
+import time
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Sequence
+
+from .latency import LatencyStats
+from .request import RequestRow
+from .runner import RunOutcome
+from .service import ServiceRow
+
+
+class SuiteReport:
+    """Per-service results of a multi-service run, for the combined JSON and
+    JUnit reports. Acts as the RunObserver of that service's run and keeps
+    only verdicts and diff summaries, not response bodies.
+
+    With `fail_on_latency`, routes flagged as latency regressions in
+    `latency` (the run's LatencyStats, set once it finishes) fail the suite
+    too.
+    """
+
+    def __init__(self, service: ServiceRow, fail_on_latency: bool = False):
+        self.service = service
+        self.fail_on_latency = fail_on_latency
+        self.latency: Optional[LatencyStats] = None
+        self.run_id: Optional[int] = None
+        self.total = 0
+        # left out of an incremental run, set once it finishes
+        self.unchanged_requests: List[RequestRow] = []
+        self.cases: List[dict] = []
+        self._started = time.perf_counter()
+        self._finished = self._started
+
+    def started(self, run_id: int, total: int) -> None:
+        self.run_id = run_id
+        self.total = total
+        self._started = self._finished = time.perf_counter()
+
+    def record(self, outcome: RunOutcome) -> None:
+        self.cases.append(outcome.to_dict())
+        self._finished = time.perf_counter()
+
+    @property
+    def unchanged(self) -> int:
+        return len(self.unchanged_requests)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for case in self.cases if not case["passed"])
+
+    @property
+    def passed(self) -> int:
+        return len(self.cases) - self.failed
+
+    @property
+    def regressions(self) -> List[dict]:
+        return self.latency.regressions() if self.latency is not None else []
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not (self.fail_on_latency and self.regressions)
+
+    @property
+    def duration(self) -> float:
+        return self._finished - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "service_id": self.service.id,
+            "name": self.service.name,
+            "run_id": self.run_id,
+            "total": self.total,
+            "passed": self.passed,
+            "failed": self.failed,
+            "unchanged": self.unchanged,
+            "duration_ms": round(self.duration * 1000, 3),
+            "latency": self.latency.to_dict() if self.latency is not None else None,
+            "results": sorted(self.cases, key=lambda case: case["index"]),
+        }
+
+
+def exit_code(suites: Sequence[SuiteReport], missing: Sequence[int] = ()) -> int:
+    """0 if every requested service ran and passed, 1 otherwise."""
+    if missing or not all(suite.ok for suite in suites):
+        return 1
+    return 0
+
+
+def combined_report(suites: Sequence[SuiteReport], missing: Sequence[int] = ()) -> dict:
+    return {
+        "passed": exit_code(suites, missing) == 0,
+        "services": len(suites),
+        "total": sum(suite.total for suite in suites),
+        "failed": sum(suite.failed for suite in suites),
+        "unchanged": sum(suite.unchanged for suite in suites),
+        "latency_regressions": sum(len(suite.regressions) for suite in suites),
+        "missing_services": list(missing),
+        "suites": [suite.to_dict() for suite in suites],
+    }
+
+
+def junit_xml(suites: Sequence[SuiteReport], missing: Sequence[int] = ()) -> str:
+    """JUnit XML with one <testsuite> per service and one <testcase> per
+    stored request; services that don't exist are reported as errors.
+    Requests an incremental run left out are skipped testcases. Suites that
+    fail on latency get a failing testcase per regressed route.
+    """
+
+    def _latency_failures(suite: SuiteReport) -> List[dict]:
+        return suite.regressions if suite.fail_on_latency else []
+
+    def _tests(suite: SuiteReport) -> int:
+        return suite.total + suite.unchanged + len(_latency_failures(suite))
+
+    root = ET.Element("testsuites", {
+        "name": "upguardian",
+        "tests": str(sum(_tests(suite) for suite in suites) + len(missing)),
+        "failures": str(sum(suite.failed + len(_latency_failures(suite)) for suite in suites)),
+        "errors": str(len(missing)),
+        "skipped": str(sum(suite.unchanged for suite in suites)),
+    })
+    for suite in suites:
+        latency_failures = _latency_failures(suite)
+        element = ET.SubElement(root, "testsuite", {
+            "name": suite.service.name,
+            "tests": str(_tests(suite)),
+            "failures": str(suite.failed + len(latency_failures)),
+            "errors": "0",
+            "skipped": str(suite.unchanged),
+            "time": f"{suite.duration:.3f}",
+        })
+        for case in sorted(suite.cases, key=lambda c: c["index"]):
+            testcase = ET.SubElement(element, "testcase", {
+                "classname": suite.service.name,
+                "name": f"{case['method']} {case['endpoint']} (request {case['request_id']})",
+                "time": f"{case['elapsed_ms'] / 1000:.3f}",
+            })
+            if not case["passed"]:
+                failure = ET.SubElement(testcase, "failure", {
+                    "message": case["error"] or "responses differ",
+                })
+                if case["diff"] is not None:
+                    failure.text = json.dumps(case["diff"], indent=2)
+        for request in suite.unchanged_requests:
+            testcase = ET.SubElement(element, "testcase", {
+                "classname": suite.service.name,
+                "name": f"{request.method} {request.endpoint} (request {request.id})",
+            })
+            ET.SubElement(testcase, "skipped", {"message": "unchanged since its last passing run"})
+        for route in latency_failures:
+            testcase = ET.SubElement(element, "testcase", {
+                "classname": suite.service.name,
+                "name": f"latency {route['method']} {route['path']}",
+            })
+            failure = ET.SubElement(testcase, "failure", {
+                "message": f"p50 {route['old']['p50_ms']} ms -> {route['new']['p50_ms']} ms (x{route['p50_ratio']})",
+            })
+            failure.text = json.dumps(route, indent=2)
+    for service_id in missing:
+        element = ET.SubElement(root, "testsuite", {"name": f"service {service_id}", "tests": "1", "errors": "1"})
+        testcase = ET.SubElement(element, "testcase", {"classname": f"service {service_id}", "name": "load"})
+        ET.SubElement(testcase, "error", {"message": "service not found"})
+    return ET.tostring(root, encoding="unicode", xml_declaration=True)
@@ -1,85 +1,151 @@
-import asyncio
-import sqlite3
+import hashlib
+from dataclasses import dataclass
 from typing import Optional
 
+from .pool import SQLitePool
+from .readcache import ReadCache
+
+
+@dataclass(frozen=True, slots=True)
+class RequestRow:
+    """An immutable snapshot of one `requests` row.
+
+    Loaded in bulk by UpGuardianSQLiteDB so hot paths (replay, listing) don't
+    have to issue a query per field like the Request getters do.
+    """
+
+    id: int
+    service: int
+    endpoint: str
+    method: str
+    body: Optional[str]
+    # left out of runs by suite reduction
+    skipped: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "service": self.service,
+            "endpoint": self.endpoint,
+            "method": self.method,
+            "body": self.body,
+            "skipped": bool(self.skipped),
+        }
+
+    def content_hash(self) -> str:
+        """Hash of what gets replayed (method, endpoint and body), so runs
+        can tell whether a request changed since its last verdict.
+        """
+        body = "\x01" if self.body is None else "\x02" + self.body
+        data = "\x00".join((self.method.upper(), self.endpoint, body))
+        return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
 
 class Request:
     """Represents a stored HTTP request row backed by sqlite3.
 
     Provides async getters/setters for its fields. The object holds the DB
-    connection and the integer primary key id.
+    connection pool and the integer primary key id.
     """
 
-    def __init__(self, db_conn: sqlite3.Connection, id: int):
-        self._conn = db_conn
+    def __init__(self, pool: SQLitePool, id: int, cache: Optional[ReadCache] = None):
+        self._pool = pool
         self.id = id
+        # read cache to invalidate after writes, if reads are cached
+        self._cache = cache
+
+    def _written(self) -> None:
+        if self._cache is not None:
+            self._cache.invalidate("requests")
 
     async def get_service(self) -> Optional[int]:
-        def _get():
-            cur = self._conn.execute("SELECT service FROM requests WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT service FROM requests WHERE id = ?", (self.id,))
             row = cur.fetchone()
             return int(row[0]) if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_service(self, service_id: int) -> None:
-        def _set():
-            self._conn.execute("UPDATE requests SET service = ? WHERE id = ?", (service_id, self.id))
-            self._conn.commit()
+        def _set(conn):
+            conn.execute("UPDATE requests SET service = ? WHERE id = ?", (service_id, self.id))
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written()
 
     async def get_endpoint(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute("SELECT endpoint FROM requests WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT endpoint FROM requests WHERE id = ?", (self.id,))
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_endpoint(self, endpoint: str) -> None:
-        def _set():
-            self._conn.execute("UPDATE requests SET endpoint = ? WHERE id = ?", (endpoint, self.id))
-            self._conn.commit()
+        def _set(conn):
+            conn.execute("UPDATE requests SET endpoint = ? WHERE id = ?", (endpoint, self.id))
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written()
 
     async def get_method(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute("SELECT method FROM requests WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT method FROM requests WHERE id = ?", (self.id,))
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_method(self, method: str) -> None:
-        def _set():
-            self._conn.execute("UPDATE requests SET method = ? WHERE id = ?", (method, self.id))
-            self._conn.commit()
+        def _set(conn):
+            conn.execute("UPDATE requests SET method = ? WHERE id = ?", (method, self.id))
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written()
 
     async def get_body(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute("SELECT body FROM requests WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT body FROM requests WHERE id = ?", (self.id,))
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_body(self, body: Optional[str]) -> None:
-        def _set():
-            self._conn.execute("UPDATE requests SET body = ? WHERE id = ?", (body, self.id))
-            self._conn.commit()
+        def _set(conn):
+            conn.execute("UPDATE requests SET body = ? WHERE id = ?", (body, self.id))
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written()
+
+    async def get_skipped(self) -> Optional[bool]:
+        def _get(conn):
+            cur = conn.execute("SELECT skipped FROM requests WHERE id = ?", (self.id,))
+            row = cur.fetchone()
+            return bool(row[0]) if row else None
+
+        return await self._pool.read(_get)
+
+    async def set_skipped(self, skipped: bool) -> None:
+        def _set(conn):
+            conn.execute("UPDATE requests SET skipped = ? WHERE id = ?", (int(skipped), self.id))
+
+        await self._pool.write(_set)
+        self._written()
 
     async def to_dict(self) -> dict:
-        def _get():
-            cur = self._conn.execute("SELECT id, service, endpoint, method, body FROM requests WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT id, service, endpoint, method, body, skipped FROM requests WHERE id = ?", (self.id,))
             row = cur.fetchone()
             if not row:
                 return {}
-            return {"id": int(row[0]), "service": int(row[1]), "endpoint": row[2], "method": row[3], "body": row[4]}
-
-        return await asyncio.to_thread(_get)
+            return {
+                "id": int(row[0]),
+                "service": int(row[1]),
+                "endpoint": row[2],
+                "method": row[3],
+                "body": row[4],
+                "skipped": bool(row[5]),
+            }
+
+        return await self._pool.read(_get)
@@ -0,0 +1,439 @@
+import asyncio
+import copy
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from .diff import DiffRules, JsonDiff, diff_json, json_equal
+from .diffpool import get_diff_pool
+from .history import RunRecorder
+from .latency import LatencyStats, LatencyThresholds
+from .metrics import ANALYZE_SECONDS, DIFF_OFFLOADS, DIFF_SECONDS, VERDICTS, StageTimings, current_timings, record_stage
+from .nemotron import get_nemotron_client
+from .replay import ReplayEngine, ReplayResult
+from .request import RequestRow
+from .service import ServiceRow
+from .verdicts import VerdictCache
+
+if TYPE_CHECKING:
+    from .db import UpGuardianSQLiteDB
+
+# Comma-separated globs of response paths to ignore when diffing, e.g.
+# "*.created_at,*.last_login_at". Timestamps and UUIDs are ignored regardless.
+DIFF_RULES = DiffRules(
+    ignore_paths=[p.strip() for p in os.getenv("DIFF_IGNORE_PATHS", "").split(",") if p.strip()],
+)
+
+# How many replayed requests may be waiting on analysis at once; beyond this
+# the replay itself is held back so memory stays bounded on big suites.
+MAX_PENDING_ANALYSES = 64
+
+# Methods whose identical stored requests (same endpoint and body) are
+# replayed once per run, with the verdict shared by every copy. Methods with
+# side effects are left out by default: replaying a POST twice can change
+# what the second one returns.
+DEDUP_METHODS = frozenset(
+    m.strip().upper() for m in os.getenv("DEDUP_METHODS", "GET,HEAD,OPTIONS").split(",") if m.strip()
+)
+
+
+@dataclass
+class RunOutcome:
+    """The verdict for one stored request in a run."""
+
+    request: RequestRow
+    result: ReplayResult
+    passed: bool
+    diff: Optional[JsonDiff] = None
+
+    @property
+    def index(self) -> int:
+        return self.result.index
+
+    def to_dict(self, include_bodies: bool = False) -> dict:
+        data = {
+            "index": self.index,
+            "request_id": self.request.id,
+            "method": self.request.method,
+            "endpoint": self.request.endpoint,
+            "passed": self.passed,
+            "error": self.result.error,
+            "elapsed_ms": round(self.result.elapsed * 1000, 3),
+            "diff": self.diff.summary() if self.diff is not None else None,
+            "timing": self.timing(),
+        }
+        if self.result.streamed is not None:
+            data["streamed"] = self.result.streamed.to_dict()
+        if include_bodies:
+            data["response1"] = self.result.response1
+            data["response2"] = self.result.response2
+        return data
+
+    def timing(self) -> Optional[dict]:
+        """Connect/TTFB/total breakdown of the old and new call."""
+        result = self.result
+        if result.timing1 is None and result.timing2 is None:
+            return None
+        return {
+            "old": result.timing1.to_dict() if result.timing1 is not None else None,
+            "new": result.timing2.to_dict() if result.timing2 is not None else None,
+        }
+
+
+def dedup_requests(requests: Sequence[RequestRow]) -> Tuple[List[RequestRow], List[List[int]]]:
+    """Collapse identical requests of DEDUP_METHODS.
+
+    Returns the requests to replay and, for each of them, the indices into
+    `requests` of every stored request it stands for (itself first).
+    """
+    unique: List[RequestRow] = []
+    copies: List[List[int]] = []
+    seen: Dict[tuple, int] = {}
+    for i, request in enumerate(requests):
+        if request.method.upper() in DEDUP_METHODS:
+            key = (request.method.upper(), request.endpoint, request.body)
+            if key in seen:
+                copies[seen[key]].append(i)
+                continue
+            seen[key] = len(unique)
+        unique.append(request)
+        copies.append([i])
+    return unique, copies
+
+
+def changed_requests(
+    requests: Sequence[RequestRow], last_verdicts: Dict[int, Tuple[str, bool]]
+) -> List[RequestRow]:
+    """The requests an incremental run replays: those without a verdict yet,
+    those edited since their last verdict and those that didn't pass.
+    """
+    return [r for r in requests if last_verdicts.get(r.id) != (r.content_hash(), True)]
+
+
+async def iter_run(
+    engine: ReplayEngine,
+    service: ServiceRow,
+    requests: Sequence[RequestRow],
+    verdicts: Optional[VerdictCache] = None,
+    recorder: Optional[RunRecorder] = None,
+    samples: int = 1,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[RunOutcome]:
+    """Replay and judge every request of `service`, yielding each outcome as
+    soon as its verdict is ready (completion order, not request order).
+
+    Identical requests (see dedup_requests) are replayed once and yield one
+    outcome per stored copy. `samples` is passed on to ReplayEngine.stream
+    for repeated latency samples; bodies too large to buffer are compared
+    while streaming there, with DIFF_RULES. `concurrency` overrides the
+    service's replay concurrency limit for this run only. With a `recorder`, every outcome is also
+    written to the run history and the run is marked completed (or aborted)
+    when the iteration ends.
+    """
+    outcomes: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_ANALYSES)
+    slots = asyncio.Semaphore(MAX_PENDING_ANALYSES)
+    unique, copies = dedup_requests(requests)
+
+    async def _judge(result: ReplayResult) -> None:
+        try:
+            passed, diff = await _verdict(result, verdicts)
+            for n, i in enumerate(copies[result.index]):
+                # copy.copy keeps already-decoded bodies shared between copies
+                shared = copy.copy(result) if n else result
+                shared.index, shared.request_id = i, requests[i].id
+                if n:
+                    # latency samples belong to the one replay, not each copy
+                    shared.samples1, shared.samples2 = [], []
+                await outcomes.put(RunOutcome(requests[i], shared, passed, diff))
+        finally:
+            slots.release()
+
+    async def _produce() -> None:
+        try:
+            async with asyncio.TaskGroup() as tg:
+                stream = engine.stream(
+                    service.id, service.old_endpoint, service.new_endpoint, unique, samples, DIFF_RULES, concurrency
+                )
+                async for result in stream:
+                    await slots.acquire()
+                    tg.create_task(_judge(result))
+        except Exception as e:
+            await outcomes.put(e)
+        else:
+            await outcomes.put(None)
+
+    producer = asyncio.create_task(_produce())
+    status = "aborted"
+    try:
+        while (item := await outcomes.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            if recorder is not None:
+                await recorder.add(item)
+            yield item
+        status = "completed"
+    finally:
+        producer.cancel()
+        if recorder is not None:
+            await asyncio.shield(recorder.finish(status))
+
+
+class RunObserver(Protocol):
+    """Receives progress from run_service as a run executes."""
+
+    def started(self, run_id: int, total: int) -> None: ...
+
+    def record(self, outcome: RunOutcome) -> None: ...
+
+
+@dataclass
+class RunReport:
+    run_id: int
+    service: ServiceRow
+    total: int
+    # in request order; empty if the run was executed with collect=False
+    outcomes: List[RunOutcome] = field(default_factory=list)
+    # old vs new latency per route; always collected
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    # time per stage, if run_service was asked for a breakdown
+    timings: Optional[StageTimings] = None
+    # requests an incremental run left out because they passed unchanged
+    unchanged_requests: List[RequestRow] = field(default_factory=list)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self.unchanged_requests)
+
+
+async def run_service(
+    db_manager: "UpGuardianSQLiteDB",
+    engine: ReplayEngine,
+    service: ServiceRow,
+    observer: Optional[RunObserver] = None,
+    collect: bool = True,
+    samples: int = 1,
+    thresholds: Optional[LatencyThresholds] = None,
+    breakdown: bool = False,
+    incremental: bool = False,
+    concurrency: Optional[int] = None,
+) -> RunReport:
+    """Run a service's whole suite and record it in the run history.
+
+    This is the shared core of the run endpoint, the CLI and background
+    jobs. Requests skipped by suite reduction are not replayed. Pass
+    `collect=False` when only the recorded history (or the observer) is
+    needed, so response bodies aren't all kept in memory.
+    Latency samples (`samples` per safe request and side) are aggregated in
+    `report.latency`, judged against `thresholds`. With `breakdown`,
+    `report.timings` sums the time spent per stage (DB, replay, analysis,
+    model). An `incremental` run only replays requests that are new,
+    changed or didn't pass their last run against the same endpoints
+    (see changed_requests); `report.unchanged_requests` lists the others.
+    `concurrency` is passed on to iter_run.
+    """
+    timings = StageTimings() if breakdown else None
+    token = current_timings.set(timings)
+    try:
+        requests = await db_manager.load_requests(service.id, include_skipped=False)
+        pair = service.endpoint_pair()
+        unchanged: List[RequestRow] = []
+        if incremental:
+            stored = requests
+            requests = changed_requests(requests, await db_manager.history.last_verdicts(service.id, pair))
+            replayed = {r.id for r in requests}
+            unchanged = [r for r in stored if r.id not in replayed]
+        recorder = await db_manager.history.start(service.id, len(requests), pair)
+        report = RunReport(
+            recorder.run_id,
+            service,
+            len(requests),
+            latency=LatencyStats(thresholds),
+            timings=timings,
+            unchanged_requests=unchanged,
+        )
+        if observer is not None:
+            observer.started(recorder.run_id, len(requests))
+
+        async for outcome in iter_run(
+            engine, service, requests, db_manager.verdicts, recorder, samples, concurrency
+        ):
+            report.latency.add(outcome)
+            if observer is not None:
+                observer.record(outcome)
+            if collect:
+                report.outcomes.append(outcome)
+    finally:
+        current_timings.reset(token)
+    report.outcomes.sort(key=lambda o: o.index)
+    return report
+
+
+async def run_services(
+    db_manager: "UpGuardianSQLiteDB",
+    engine: ReplayEngine,
+    services: Sequence[ServiceRow],
+    max_parallel: int = 4,
+    make_observer: Optional[Callable[[ServiceRow], RunObserver]] = None,
+    collect: bool = False,
+    samples: int = 1,
+    thresholds: Optional[LatencyThresholds] = None,
+    incremental: bool = False,
+) -> List[RunReport]:
+    """Run several services' suites in parallel on one shared engine.
+
+    At most `max_parallel` suites run at once; the engine's global, per-host
+    and per-service limits still apply across all of them. Reports come back
+    in the order of `services`.
+    """
+    parallel = asyncio.Semaphore(max_parallel)
+
+    async def _run(service: ServiceRow) -> RunReport:
+        observer = make_observer(service) if make_observer is not None else None
+        async with parallel:
+            return await run_service(
+                db_manager,
+                engine,
+                service,
+                observer=observer,
+                collect=collect,
+                samples=samples,
+                thresholds=thresholds,
+                incremental=incremental,
+            )
+
+    return list(await asyncio.gather(*[_run(s) for s in services]))
+
+
+async def _verdict(result: ReplayResult, verdicts: Optional[VerdictCache]) -> Tuple[bool, Optional[JsonDiff]]:
+    started = time.perf_counter()
+    passed, diff, decided_by = await _decide(result, verdicts)
+    _observe_verdict(passed, decided_by, time.perf_counter() - started)
+    return passed, diff
+
+
+async def _decide(result: ReplayResult, verdicts: Optional[VerdictCache]) -> Tuple[bool, Optional[JsonDiff], str]:
+    if result.error is not None:
+        return False, None, "error"
+    if result.identical:
+        # Same bytes from both endpoints: nothing to parse or diff
+        return True, None, "identical"
+    if result.streamed is not None:
+        diff = result.streamed.diff
+        if diff.equal:
+            return True, None, "equal"
+        # The bodies were never held whole, so there is nothing to show the
+        # model; value changes inside a root array would fail it anyway
+        # (see _top_level_key).
+        return diff.verdict(DIFF_RULES) is True, diff, "rules"
+    diff = None
+    pool = get_diff_pool()
+    if pool.offloads(result.raw1, result.raw2):
+        # Large bodies are decoded and diffed in a worker process so the
+        # event loop keeps serving other requests meanwhile.
+        DIFF_OFFLOADS.inc()
+        try:
+            with DIFF_SECONDS.time():
+                equal, diff = await pool.diff(result.raw1, result.raw2, DIFF_RULES)
+        except ValueError as e:
+            result.error = f"invalid JSON response: {e}"
+            return False, None, "error"
+        if equal:
+            return True, None, "equal"
+        verdict = diff.verdict(DIFF_RULES)
+        if verdict is not None:
+            return verdict, diff, "rules"
+        # Only the model still needs the decoded responses
+    response1, response2 = result.response1, result.response2
+    if result.decode_error is not None:
+        result.error = result.decode_error
+        return False, None, "error"
+    return await _compare(response1, response2, verdicts, diff=diff)
+
+
+def _observe_verdict(passed: bool, decided_by: str, elapsed: float) -> None:
+    ANALYZE_SECONDS.observe(elapsed, decided_by=decided_by)
+    VERDICTS.inc(result="pass" if passed else "fail")
+    record_stage("analyze", elapsed)
+
+
+async def analyze_responses(
+    response1: dict,
+    response2: dict,
+    verdicts: Optional[VerdictCache] = None,
+    rules: Optional[DiffRules] = None,
+) -> bool:
+    """Return True if the two responses are equivalent.
+
+    The structural diff decides most cases on its own: removed fields and
+    type changes fail, added fields and volatile values (timestamps, UUIDs,
+    ignored paths) pass. Only the remaining value changes go to the model,
+    whose verdict is cached by the diff's fingerprint.
+    """
+    passed, _ = await judge_responses(response1, response2, verdicts, rules)
+    return passed
+
+
+async def judge_responses(
+    response1: dict,
+    response2: dict,
+    verdicts: Optional[VerdictCache] = None,
+    rules: Optional[DiffRules] = None,
+) -> Tuple[bool, Optional[JsonDiff]]:
+    """analyze_responses, also returning the structural diff it was based
+    on (None if the responses are identical or couldn't be compared).
+    """
+    started = time.perf_counter()
+    passed, diff, decided_by = await _compare(response1, response2, verdicts, rules)
+    _observe_verdict(passed, decided_by, time.perf_counter() - started)
+    return passed, diff
+
+
+async def _compare(
+    response1: dict,
+    response2: dict,
+    verdicts: Optional[VerdictCache] = None,
+    rules: Optional[DiffRules] = None,
+    diff: Optional[JsonDiff] = None,
+) -> Tuple[bool, Optional[JsonDiff], str]:
+    # (passed, diff, what decided it) -- the last one labels the metrics.
+    # A `diff` computed elsewhere (see _decide) skips straight to the model.
+    try:
+        if diff is None:
+            if json_equal(response1, response2):
+                return True, None, "equal"
+
+            rules = rules or DIFF_RULES
+            with DIFF_SECONDS.time():
+                diff = diff_json(response1, response2, rules)
+            verdict = diff.verdict(rules)
+            if verdict is not None:
+                return verdict, diff, "rules"
+
+        async def _ask_model() -> list[str]:
+            # Batched with other pending comparisons into one model call
+            return await get_nemotron_client().get_unimportant_keys(response1, response2)
+
+        asked = time.perf_counter()
+        try:
+            if verdicts is None:
+                unimportant_keys = await _ask_model()
+            else:
+                unimportant_keys = await verdicts.get_or_compute(diff.fingerprint(), _ask_model)
+        finally:
+            record_stage("model", time.perf_counter() - asked)
+
+        # The model names unimportant top-level keys; the responses match if
+        # every unresolved change lies under one of them.
+        unimportant = set(unimportant_keys)
+        return all(_top_level_key(path) in unimportant for path in diff.value_changed), diff, "model"
+    except Exception:
+        return False, diff, "error"
+
+
+def _top_level_key(path: str) -> Optional[str]:
+    # "$.address.city" -> "address"; root arrays ("$[0].id") have no key
+    if not path.startswith("$."):
+        return None
+    return re.split(r"[.\[]", path[2:], maxsplit=1)[0]
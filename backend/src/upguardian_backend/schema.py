@@ -0,0 +1,282 @@
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from .diff import DiffRules, json_type
+from .pool import SQLitePool
+from .reduction import path_template, reduce_suite
+from .replay import ReplayEngine
+from .request import RequestRow
+from .runner import DIFF_RULES
+from .service import ServiceRow
+
+if TYPE_CHECKING:
+    from .db import UpGuardianSQLiteDB
+
+_CONTAINERS = frozenset({"object", "array"})
+
+
+class _Node:
+    """What was seen at one path over all samples."""
+
+    __slots__ = ("types", "objects", "properties", "items")
+
+    def __init__(self):
+        self.types: set = set()
+        # how many of the values here were objects, and per key how many
+        # of those objects had it
+        self.objects = 0
+        self.properties: Dict[str, Tuple[int, "_Node"]] = {}
+        self.items: Optional[_Node] = None
+
+    def add(self, value: Any) -> None:
+        kind = json_type(value)
+        self.types.add(kind)
+        if kind == "object":
+            self.objects += 1
+            for key, child in value.items():
+                seen, node = self.properties.get(key) or (0, _Node())
+                node.add(child)
+                self.properties[key] = (seen + 1, node)
+        elif kind == "array":
+            for child in value:
+                if self.items is None:
+                    self.items = _Node()
+                self.items.add(child)
+
+    def to_dict(self) -> dict:
+        data: Dict[str, Any] = {"type": sorted(self.types)}
+        if "object" in self.types:
+            data["properties"] = {key: node.to_dict() for key, (_, node) in sorted(self.properties.items())}
+            data["required"] = sorted(key for key, (seen, _) in self.properties.items() if seen == self.objects)
+        if self.items is not None:
+            data["items"] = self.items.to_dict()
+        return data
+
+
+def infer_signature(samples: Sequence[Any]) -> dict:
+    """Compact, JSON-schema-like signature of decoded JSON `samples`: the
+    types seen at every path, object properties and which of them were in
+    every sample (`required`), and the merged shape of array items. Values
+    themselves are never kept.
+    """
+    root = _Node()
+    for sample in samples:
+        root.add(sample)
+    return root.to_dict()
+
+
+@dataclass
+class SchemaDiff:
+    """How the new signature of an endpoint differs from the old one.
+    Paths look like diff paths, with array items as `[]`.
+    """
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # required before, optional (missing in some samples) now
+    made_optional: List[str] = field(default_factory=list)
+    # path -> [old types, new types]; the new side has types the old lacked
+    type_changed: Dict[str, List[List[str]]] = field(default_factory=dict)
+    # an object became an array or a scalar, or the other way around
+    nesting_changed: Dict[str, List[List[str]]] = field(default_factory=dict)
+    ignored: List[str] = field(default_factory=list)
+
+    @property
+    def breaking(self) -> bool:
+        return bool(self.removed or self.made_optional or self.type_changed or self.nesting_changed)
+
+    def compatible(self, rules: DiffRules) -> bool:
+        return not self.breaking and (rules.allow_added or not self.added)
+
+    def to_dict(self) -> dict:
+        return {
+            "added": self.added,
+            "removed": self.removed,
+            "made_optional": self.made_optional,
+            "type_changed": self.type_changed,
+            "nesting_changed": self.nesting_changed,
+            "ignored": self.ignored,
+        }
+
+
+def compare_signatures(old: dict, new: dict, rules: Optional[DiffRules] = None) -> SchemaDiff:
+    """Compare two signatures from infer_signature. Paths matched by the
+    rules' ignore globs are listed in `ignored` instead.
+    """
+    rules = rules or DiffRules()
+    result = SchemaDiff()
+    _compare(old, new, "$", rules, result)
+    return result
+
+
+def _compare(old: dict, new: dict, path: str, rules: DiffRules, out: SchemaDiff) -> None:
+    if rules.ignores_path(path):
+        if old != new:
+            out.ignored.append(path)
+        return
+    old_types, new_types = set(old["type"]), set(new["type"])
+    if (old_types & _CONTAINERS) != (new_types & _CONTAINERS) and (old_types | new_types) & _CONTAINERS:
+        out.nesting_changed[path] = [sorted(old_types), sorted(new_types)]
+    elif not new_types <= old_types:
+        # narrowing (e.g. no longer null) can't break a client, widening can
+        out.type_changed[path] = [sorted(old_types), sorted(new_types)]
+
+    if "object" in old_types and "object" in new_types:
+        old_props, new_props = old.get("properties", {}), new.get("properties", {})
+        old_required, new_required = set(old.get("required", [])), set(new.get("required", []))
+        for key, old_child in old_props.items():
+            child_path = f"{path}.{key}"
+            if key not in new_props:
+                (out.ignored if rules.ignores_path(child_path) else out.removed).append(child_path)
+                continue
+            if key in old_required and key not in new_required and not rules.ignores_path(child_path):
+                out.made_optional.append(child_path)
+            _compare(old_child, new_props[key], child_path, rules, out)
+        for key in (k for k in new_props if k not in old_props):
+            child_path = f"{path}.{key}"
+            (out.ignored if rules.ignores_path(child_path) else out.added).append(child_path)
+    if "items" in old and "items" in new:
+        _compare(old["items"], new["items"], f"{path}[]", rules, out)
+
+
+class SchemaStore:
+    """Inferred signatures, cached in the `schemas` table per service,
+    endpoint pair (see ServiceRow.endpoint_pair), route and side.
+    """
+
+    def __init__(self, pool: SQLitePool):
+        self._pool = pool
+
+    async def load(self, service_id: int, pair: str) -> Dict[Tuple[str, str], dict]:
+        """(method, route) -> {"old": entry, "new": entry} for one endpoint
+        pair, where an entry holds the signature, its sample count and when
+        it was inferred.
+        """
+
+        def _fetch(conn):
+            cur = conn.execute(
+                """
+                SELECT method, route, side, signature, samples, updated_at FROM schemas
+                WHERE service = ? AND pair = ? ORDER BY method, route
+                """,
+                (service_id, pair),
+            )
+            return cur.fetchall()
+
+        routes: Dict[Tuple[str, str], dict] = defaultdict(dict)
+        for method, route, side, signature, samples, updated_at in await self._pool.read(_fetch):
+            routes[(method, route)][side] = {
+                "signature": json.loads(signature),
+                "samples": samples,
+                "updated_at": updated_at,
+            }
+        return routes
+
+    async def save(self, service_id: int, pair: str, rows: List[Tuple[str, str, str, dict, int]]) -> None:
+        """Store (method, route, side, signature, samples) rows."""
+        now = time.time()
+
+        def _write(conn):
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO schemas(service, pair, method, route, side, signature, samples, updated_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (service_id, pair, method, route, side, json.dumps(signature, separators=(",", ":")), samples, now)
+                    for method, route, side, signature, samples in rows
+                ],
+            )
+
+        await self._pool.write(_write)
+
+
+def _route(request: RequestRow) -> Tuple[str, str]:
+    return request.method.upper(), path_template(request.endpoint)
+
+
+async def _sample_routes(
+    engine: ReplayEngine, service: ServiceRow, requests: Sequence[RequestRow]
+) -> Dict[Tuple[str, str], dict]:
+    # replay and decode; (method, route) -> {"old": [...], "new": [...], "errors": n}
+    samples: Dict[Tuple[str, str], dict] = defaultdict(lambda: {"old": [], "new": [], "errors": 0})
+    async for result in engine.stream(service.id, service.old_endpoint, service.new_endpoint, requests):
+        route = samples[_route(requests[result.index])]
+        if result.error is not None:
+            route["errors"] += 1
+        for side, value, invalid in (
+            ("old", result.response1, result.decode_error1),
+            ("new", result.response2, result.decode_error2),
+        ):
+            if invalid is not None:
+                route["errors"] += 1
+            elif value is not None:
+                route[side].append(value)
+    return samples
+
+
+async def check_schemas(
+    db_manager: "UpGuardianSQLiteDB",
+    engine: ReplayEngine,
+    service: ServiceRow,
+    per_route: int = 3,
+    refresh: bool = False,
+    rules: Optional[DiffRules] = None,
+) -> dict:
+    """Decide schema compatibility per route (method and path template)
+    from signatures instead of diffing every response.
+
+    Routes without a cached signature for the service's current endpoints
+    (or all routes, with `refresh`) are sampled: up to `per_route` requests
+    per request-body shape (picked for coverage, see reduce_suite) are
+    replayed and a signature is inferred per side and cached.
+    """
+    rules = rules or DIFF_RULES
+    pair = service.endpoint_pair()
+    requests = await db_manager.load_requests(service.id, include_skipped=False)
+    routes = {_route(r) for r in requests}
+    cached = {} if refresh else await db_manager.schemas.load(service.id, pair)
+    stale = [r for r in requests if not ("old" in cached.get(_route(r), {}) and "new" in cached.get(_route(r), {}))]
+
+    sampled: Dict[Tuple[str, str], dict] = {}
+    if stale:
+        keep = set(reduce_suite(stale, per_group=per_route, strategy="coverage").keep)
+        sampled = await _sample_routes(engine, service, [r for r in stale if r.id in keep])
+        rows = []
+        for (method, route), found in sampled.items():
+            for side in ("old", "new"):
+                if found[side]:
+                    rows.append((method, route, side, infer_signature(found[side]), len(found[side])))
+        await db_manager.schemas.save(service.id, pair, rows)
+
+    report = []
+    for method, route in sorted(routes):
+        entry: Dict[str, Any] = {"method": method, "path": route}
+        sides = cached.get((method, route), {})
+        if (method, route) in sampled:
+            found = sampled[(method, route)]
+            old = infer_signature(found["old"]) if found["old"] else None
+            new = infer_signature(found["new"]) if found["new"] else None
+            entry.update(cached=False, samples={"old": len(found["old"]), "new": len(found["new"])}, errors=found["errors"])
+        elif "old" in sides and "new" in sides:
+            old, new = sides["old"]["signature"], sides["new"]["signature"]
+            entry.update(cached=True, samples={"old": sides["old"]["samples"], "new": sides["new"]["samples"]}, errors=0)
+        else:
+            # needed sampling, but the replay produced nothing for it
+            old = new = None
+            entry.update(cached=False, samples={"old": 0, "new": 0}, errors=0)
+        if old is None or new is None:
+            entry.update(compatible=False, diff=None, error="no JSON responses to infer a signature from")
+        else:
+            diff = compare_signatures(old, new, rules)
+            entry.update(compatible=diff.compatible(rules), diff=diff.to_dict())
+        report.append(entry)
+
+    return {
+        "service_id": service.id,
+        "compatible": all(entry["compatible"] for entry in report),
+        "routes": report,
+    }
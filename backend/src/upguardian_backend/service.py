@@ -1,21 +1,47 @@
-import asyncio
-import sqlite3
+import hashlib
+from dataclasses import dataclass
 from typing import Optional
 from typing import List
 
+from .history import prune_bodies
+from .pool import SQLitePool
+from .readcache import ReadCache
 from .request import Request
 
 
+@dataclass(frozen=True, slots=True)
+class ServiceRow:
+    """An immutable snapshot of one `services` row, loaded in a single query."""
+
+    id: int
+    profile: Optional[str]
+    name: str
+    old_endpoint: Optional[str]
+    new_endpoint: Optional[str]
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "old_endpoint": self.old_endpoint, "new_endpoint": self.new_endpoint}
+
+    def endpoint_pair(self) -> str:
+        """Key of the old/new endpoint combination verdicts were made for;
+        pointing the service elsewhere starts over.
+        """
+        data = f"{self.old_endpoint or ''}\x00{self.new_endpoint or ''}"
+        return hashlib.blake2b(data.encode(), digest_size=8).hexdigest()
+
+
 class Service:
-    """A lightweight Service model that holds a DB connection and an id that
-    is unique within a given profile (not globally unique).
+    """A lightweight Service model that holds a DB connection pool and an id
+    that is unique within a given profile (not globally unique).
 
-    Methods use asyncio.to_thread to offload sqlite3 operations to a thread
-    pool since sqlite3 is not async-safe.
+    Methods run sqlite3 operations on the pool's reader threads or its writer
+    thread since sqlite3 is not async-safe.
     """
 
-    def __init__(self, db_conn: sqlite3.Connection, id: int, name: str, profile: Optional[str]):
-        self._conn = db_conn
+    def __init__(self, pool: SQLitePool, id: int, name: str, profile: Optional[str], cache: Optional[ReadCache] = None):
+        self._pool = pool
+        # read cache to invalidate after writes, if reads are cached
+        self._cache = cache
         # integer primary key
         self.id = id
         # human-friendly name (previously used as id)
@@ -23,87 +49,97 @@ class Service:
         # profile may be None for legacy/unknown profile entries
         self.profile = profile
 
+    def _written(self, *tables: str) -> None:
+        if self._cache is not None:
+            self._cache.invalidate(*tables)
+
     async def get_old_endpoint(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute(
+        def _get(conn):
+            cur = conn.execute(
                 "SELECT old_endpoint FROM services WHERE id = ?",
                 (self.id,),
             )
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_old_endpoint(self, endpoint: Optional[str]) -> None:
-        def _set():
+        def _set(conn):
             # Update by integer id
-            cur = self._conn.execute(
+            cur = conn.execute(
                 "UPDATE services SET old_endpoint = ? WHERE id = ?",
                 (endpoint, self.id),
             )
             if cur.rowcount == 0:
                 # Insert if missing
-                self._conn.execute(
+                conn.execute(
                     "INSERT INTO services(profile, name, old_endpoint) VALUES(?, ?, ?)",
                     (self.profile, self.name, endpoint),
                 )
-            self._conn.commit()
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written("services")
 
     async def get_new_endpoint(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute(
+        def _get(conn):
+            cur = conn.execute(
                 "SELECT new_endpoint FROM services WHERE id = ?",
                 (self.id,),
             )
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_new_endpoint(self, endpoint: Optional[str]) -> None:
-        def _set():
+        def _set(conn):
             # Update by integer id
-            cur = self._conn.execute(
+            cur = conn.execute(
                 "UPDATE services SET new_endpoint = ? WHERE id = ?",
                 (endpoint, self.id),
             )
             if cur.rowcount == 0:
                 # Insert if missing
-                self._conn.execute(
+                conn.execute(
                     "INSERT INTO services(profile, name, new_endpoint) VALUES(?, ?, ?)",
                     (self.profile, self.name, endpoint),
                 )
-            self._conn.commit()
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written("services")
 
     async def get_name(self) -> Optional[str]:
-        def _get():
-            cur = self._conn.execute("SELECT name FROM services WHERE id = ?", (self.id,))
+        def _get(conn):
+            cur = conn.execute("SELECT name FROM services WHERE id = ?", (self.id,))
             row = cur.fetchone()
             return row[0] if row else None
 
-        return await asyncio.to_thread(_get)
+        return await self._pool.read(_get)
 
     async def set_name(self, name: str) -> None:
-        def _set():
-            self._conn.execute("UPDATE services SET name = ? WHERE id = ?", (name, self.id))
-            self._conn.commit()
+        def _set(conn):
+            conn.execute("UPDATE services SET name = ? WHERE id = ?", (name, self.id))
 
-        await asyncio.to_thread(_set)
+        await self._pool.write(_set)
+        self._written("services")
 
-    async def list_requests(self) -> List[Request]:
-        """Return Request objects that belong to this service (by integer id)."""
+    async def list_requests(self, include_skipped: bool = True) -> List[Request]:
+        """Return Request objects that belong to this service (by integer id).
+        With `include_skipped=False`, requests skipped by suite reduction are
+        left out.
+        """
 
-        def _fetch():
-            cur = self._conn.execute("SELECT id FROM requests WHERE service = ?", (self.id,))
+        def _fetch(conn):
+            query = "SELECT id FROM requests WHERE service = ?"
+            if not include_skipped:
+                query += " AND skipped = 0"
+            cur = conn.execute(query, (self.id,))
             rows = cur.fetchall()
             return [row[0] for row in rows]
 
-        ids = await asyncio.to_thread(_fetch)
-        return [Request(self._conn, int(i)) for i in ids]
+        ids = await self._pool.read(_fetch)
+        return [Request(self._pool, int(i), cache=self._cache) for i in ids]
 
     async def delete(self) -> bool:
         """Delete this service row from the database.
@@ -111,9 +147,15 @@ class Service:
         Returns True if a row was deleted, False if no row existed.
         """
 
-        def _delete():
-            cur = self._conn.execute("DELETE FROM services WHERE id = ?", (self.id,))
-            self._conn.commit()
-            return cur.rowcount > 0
-
-        return await asyncio.to_thread(_delete)
+        def _delete(conn):
+            cur = conn.execute("DELETE FROM services WHERE id = ?", (self.id,))
+            deleted = cur.rowcount > 0
+            if deleted:
+                # the cascade took the service's runs; drop the bodies only they used
+                prune_bodies(conn)
+            return deleted
+
+        deleted = await self._pool.write(_delete)
+        # the delete cascades to the service's requests
+        self._written("services", "requests")
+        return deleted
@@ -0,0 +1,204 @@
+import codecs
+import json
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, List
+
+from .diff import DiffRules, JsonDiff, diff_json, json_equal
+
+# Response bodies that run past this many bytes are compared while they are
+# read (when both are JSON arrays) instead of being buffered whole.
+STREAM_COMPARE_BYTES = int(os.getenv("STREAM_COMPARE_BYTES", 8 * 1024 * 1024))
+
+# A streamed comparison stops reading after this many array elements
+# differed in a way that fails the request (0: read both bodies to the end).
+STREAM_MAX_DIFFS = int(os.getenv("STREAM_MAX_DIFFS", "10"))
+
+# Ignored and added paths don't fail a request, so they don't stop a
+# streamed comparison either; only this many of each are kept.
+STREAM_MAX_PATHS = 1000
+
+_WS = " \t\r\n"
+_NUMBER_START = "-0123456789"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+# JsonArrayDecoder states
+_START, _FIRST, _VALUE, _SEPARATOR, _DONE = range(5)
+
+
+def starts_array(head: bytes) -> bool:
+    """Whether a (partial) body looks like a top-level JSON array."""
+    return head.lstrip(b" \t\r\n")[:1] == b"["
+
+
+class JsonArrayDecoder:
+    """Incremental decoder for a JSON document that is a single array.
+
+    Feed it text in arbitrary chunks; every element completed by a chunk is
+    decoded with `raw_decode` and returned, so only the current element is
+    held in memory. Raises ValueError as soon as the text can't be an array.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = _START
+        # don't retry decoding an incomplete element before the buffer has
+        # grown to this size, so a huge element isn't re-parsed per chunk
+        self._retry_at = 0
+        self.items = 0
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        """Return the elements completed by `text`."""
+        self._buffer += text
+        if not final and len(self._buffer) < self._retry_at:
+            return []
+        self._retry_at = 0
+        buffer, pos, items = self._buffer, 0, []
+        size = len(buffer)
+        while True:
+            while pos < size and buffer[pos] in _WS:
+                pos += 1
+            if pos == size:
+                break
+            char = buffer[pos]
+            if self._state == _DONE:
+                raise ValueError("extra data after the JSON array")
+            if self._state == _START:
+                if char != "[":
+                    raise ValueError("response is not a JSON array")
+                pos, self._state = pos + 1, _FIRST
+            elif char == "]" and self._state in (_FIRST, _SEPARATOR):
+                pos, self._state = pos + 1, _DONE
+            elif self._state == _SEPARATOR:
+                if char != ",":
+                    raise ValueError(f"expected ',' or ']' in JSON array, got {char!r}")
+                pos, self._state = pos + 1, _VALUE
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    # incomplete element; wait for more input
+                    self._retry_at = 2 * (size - pos)
+                    break
+                if not final and char in _NUMBER_START and (end == size or buffer[end] in _NUMBER_CHARS):
+                    # a number that may still continue in the next chunk
+                    self._retry_at = size - pos + 1
+                    break
+                items.append(item)
+                self.items += 1
+                pos, self._state = end, _SEPARATOR
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self) -> List[Any]:
+        items = self.feed("", final=True)
+        if self._state != _DONE:
+            raise ValueError("truncated JSON array")
+        return items
+
+
+_END = object()
+
+
+class _ArrayReader:
+    """Element-at-a-time reader over the byte chunks of one body."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = JsonArrayDecoder()
+        self._ready: deque = deque()
+        self._eof = False
+        self.size = 0
+
+    async def next(self) -> Any:
+        while not self._ready:
+            if self._eof:
+                return _END
+            chunk = await anext(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                self._ready.extend(self._decoder.feed(self._text.decode(b"", final=True)))
+                self._ready.extend(self._decoder.close())
+            else:
+                self.size += len(chunk)
+                self._ready.extend(self._decoder.feed(self._text.decode(chunk)))
+        return self._ready.popleft()
+
+
+@dataclass
+class StreamComparison:
+    """Outcome of comparing two JSON array bodies element by element.
+
+    `diff` uses the same paths as diff_json on the whole arrays. `items` is
+    the number of element pairs compared; with `truncated` set the
+    comparison stopped early, after enough failing differences, and the
+    rest of both bodies was never read. `size1`/`size2` are the bytes read
+    from the old and new body.
+    """
+
+    diff: JsonDiff = field(default_factory=JsonDiff)
+    items: int = 0
+    truncated: bool = False
+    size1: int = 0
+    size2: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "truncated": self.truncated,
+            "bytes_old": self.size1,
+            "bytes_new": self.size2,
+        }
+
+
+def _failures(diff: JsonDiff, rules: DiffRules) -> int:
+    # changes that make JsonDiff.verdict anything but True
+    count = len(diff.removed) + len(diff.type_changed) + len(diff.value_changed)
+    return count if rules.allow_added else count + len(diff.added)
+
+
+async def compare_arrays(
+    old: AsyncIterator[bytes],
+    new: AsyncIterator[bytes],
+    rules: DiffRules,
+    max_diffs: int = STREAM_MAX_DIFFS,
+) -> StreamComparison:
+    """Diff two JSON array bodies, given as async iterators over their raw
+    bytes, pair by pair as elements arrive.
+
+    Memory stays bounded by one chunk and one element per side, whatever
+    the size of the bodies. Reading stops at the end of the shorter array
+    (a length difference is reported at `$`, like diff_json does) or after
+    `max_diffs` element pairs had failing differences. Raises ValueError if
+    a body isn't a valid JSON array.
+    """
+    readers = _ArrayReader(old), _ArrayReader(new)
+    result = StreamComparison()
+    diff = result.diff
+    failing = 0
+    while True:
+        a, b = await readers[0].next(), await readers[1].next()
+        if a is _END or b is _END:
+            if a is not b:
+                diff.value_changed.append("$")
+            break
+        result.items += 1
+        if json_equal(a, b):
+            continue
+        before = _failures(diff, rules)
+        diff_json(a, b, rules, path=f"$[{result.items - 1}]", into=diff)
+        del diff.ignored[STREAM_MAX_PATHS:]
+        if rules.allow_added:
+            del diff.added[STREAM_MAX_PATHS:]
+        if _failures(diff, rules) > before:
+            failing += 1
+            if max_diffs > 0 and failing >= max_diffs:
+                result.truncated = True
+                break
+    result.size1, result.size2 = readers[0].size, readers[1].size
+    return result
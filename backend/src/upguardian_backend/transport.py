@@ -0,0 +1,161 @@
+import dataclasses
+import importlib.util
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import REPLAY_CONNECTIONS
+
+# HTTP/2 needs the `h2` package, which the httpx[http2] dependency pulls in;
+# without it (e.g. a bare httpx install) replays fall back to HTTP/1.1.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Connection pool settings for every replay target origin. The pool size
+# defaults to no cap of its own: the engine's per-host concurrency limit
+# already bounds how many calls to an origin are in flight.
+REPLAY_POOL_SIZE = int(os.getenv("REPLAY_POOL_SIZE", "0")) or None
+REPLAY_KEEPALIVE_CONNECTIONS = int(os.getenv("REPLAY_KEEPALIVE_CONNECTIONS", "32"))
+REPLAY_KEEPALIVE_EXPIRY = float(os.getenv("REPLAY_KEEPALIVE_EXPIRY", "30"))
+REPLAY_CONNECT_TIMEOUT = float(os.getenv("REPLAY_CONNECT_TIMEOUT", "10"))
+REPLAY_TIMEOUT = float(os.getenv("REPLAY_TIMEOUT", "30"))
+# Retries of calls that failed to connect; nothing was sent yet, so even
+# non-idempotent requests are safe to retry.
+REPLAY_RETRIES = int(os.getenv("REPLAY_RETRIES", "1"))
+# Negotiate HTTP/2 (via TLS ALPN) with targets that support it
+REPLAY_HTTP2 = os.getenv("REPLAY_HTTP2", "true").lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """How calls to one replay target origin are pooled.
+
+    `max_connections` of None leaves the pool uncapped. `timeout` applies
+    to reading, writing and waiting for a pooled connection; `retries`
+    only to calls that failed to connect. `http2` is ignored unless the
+    `h2` package is installed.
+    """
+
+    max_connections: Optional[int] = REPLAY_POOL_SIZE
+    max_keepalive_connections: int = REPLAY_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = REPLAY_KEEPALIVE_EXPIRY
+    connect_timeout: float = REPLAY_CONNECT_TIMEOUT
+    timeout: float = REPLAY_TIMEOUT
+    retries: int = REPLAY_RETRIES
+    http2: bool = REPLAY_HTTP2
+
+    def to_dict(self) -> dict:
+        data = dataclasses.asdict(self)
+        data["http2"] = self.http2 and HTTP2_AVAILABLE
+        return data
+
+
+@dataclass
+class OriginStats:
+    """Connection reuse for one origin since the pool was created."""
+
+    requests: int = 0
+    # new connections opened, i.e. requests that paid for a TCP (and TLS)
+    # handshake; every other request reused a pooled connection
+    connections: int = 0
+    http2: int = 0
+    errors: int = 0
+
+    @property
+    def reused(self) -> int:
+        return max(0, self.requests - self.connections)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reused / self.requests, 4) if self.requests else None,
+            "http2_requests": self.http2,
+            "errors": self.errors,
+        }
+
+
+def origin(url: str) -> str:
+    """"http://host:port" of a URL; the unit connections are pooled by."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class TransportPool:
+    """Long-lived HTTP clients for replay targets, one per origin.
+
+    Each origin (scheme, host and port) gets its own connection pool, so
+    keep-alive connections to one slow target can't starve the others and
+    pool settings can differ per target (see `configure`). Clients are
+    created on first use and kept until `aclose`.
+    """
+
+    def __init__(self, config: Optional[TransportConfig] = None):
+        self.config = config or TransportConfig()
+        self._configs: Dict[str, TransportConfig] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._retired: List[httpx.AsyncClient] = []
+        self._stats: Dict[str, OriginStats] = {}
+
+    def configure(self, origin_url: str, **changes) -> None:
+        """Override TransportConfig fields for one origin. Its current
+        client, if any, finishes in-flight calls and is closed with the pool.
+        """
+        key = origin(origin_url)
+        self._configs[key] = dataclasses.replace(self._configs.get(key, self.config), **changes)
+        client = self._clients.pop(key, None)
+        if client is not None:
+            self._retired.append(client)
+
+    def config_for(self, url: str) -> TransportConfig:
+        return self._configs.get(origin(url), self.config)
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """The client for the origin of `url`."""
+        key = origin(url)
+        client = self._clients.get(key)
+        if client is None:
+            config = self.config_for(key)
+            transport = httpx.AsyncHTTPTransport(
+                http2=config.http2 and HTTP2_AVAILABLE,
+                retries=config.retries,
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                ),
+            )
+            client = self._clients[key] = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            )
+        return client
+
+    def record(self, url: str, new_connection: bool, http_version: Optional[str] = None) -> None:
+        """Count one call to `url`; `http_version` is None if it failed."""
+        key = origin(url)
+        stats = self._stats.setdefault(key, OriginStats())
+        stats.requests += 1
+        if new_connection:
+            stats.connections += 1
+        if http_version is None:
+            stats.errors += 1
+        elif http_version == "HTTP/2":
+            stats.http2 += 1
+        REPLAY_CONNECTIONS.inc(origin=key, connection="new" if new_connection else "reused")
+
+    def stats(self) -> Dict[str, dict]:
+        """Per origin: its pool settings and connection reuse so far."""
+        return {
+            key: {"config": self.config_for(key).to_dict(), **stats.to_dict()}
+            for key, stats in sorted(self._stats.items())
+        }
+
+    async def aclose(self) -> None:
+        clients, self._clients = [*self._clients.values(), *self._retired], {}
+        self._retired = []
+        for client in clients:
+            await client.aclose()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .metrics import VERDICT_CACHE
+from .pool import SQLitePool
+
+
+class VerdictCache:
+    """Persistent cache of model verdicts keyed by `JsonDiff.fingerprint()`.
+
+    Verdicts (the model's list of unimportant keys) live in the `verdicts`
+    table so they survive restarts; a bounded in-memory LRU sits in front of
+    it so repeated diffs within a process don't touch SQLite at all.
+    """
+
+    def __init__(self, pool: SQLitePool, capacity: int = 4096):
+        self._pool = pool
+        self._capacity = capacity
+        self._lru: "OrderedDict[str, List[str]]" = OrderedDict()
+        # Misses currently being computed, so concurrent identical diffs
+        # share one model call.
+        self._pending: Dict[str, "asyncio.Future[List[str]]"] = {}
+
+    def _remember(self, fingerprint: str, keys: List[str]) -> None:
+        self._lru[fingerprint] = keys
+        self._lru.move_to_end(fingerprint)
+        while len(self._lru) > self._capacity:
+            self._lru.popitem(last=False)
+
+    async def get(self, fingerprint: str) -> Optional[List[str]]:
+        keys = self._lru.get(fingerprint)
+        if keys is not None:
+            self._lru.move_to_end(fingerprint)
+            return list(keys)
+
+        def _get(conn):
+            cur = conn.execute("SELECT unimportant_keys FROM verdicts WHERE fingerprint = ?", (fingerprint,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+        stored = await self._pool.read(_get)
+        if stored is None:
+            return None
+        keys = json.loads(stored)
+        self._remember(fingerprint, keys)
+        return list(keys)
+
+    async def put(self, fingerprint: str, keys: List[str]) -> None:
+        self._remember(fingerprint, list(keys))
+
+        def _set(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts(fingerprint, unimportant_keys, created_at) VALUES(?, ?, ?)",
+                (fingerprint, json.dumps(keys), time.time()),
+            )
+
+        await self._pool.write(_set)
+
+    async def get_or_compute(self, fingerprint: str, compute: Callable[[], Awaitable[List[str]]]) -> List[str]:
+        """Return the cached verdict, or run `compute` once (even for
+        concurrent callers with the same fingerprint) and cache its result.
+        """
+        keys = await self.get(fingerprint)
+        if keys is not None:
+            VERDICT_CACHE.inc(result="hit")
+            return keys
+
+        pending = self._pending.get(fingerprint)
+        if pending is not None:
+            VERDICT_CACHE.inc(result="joined")
+            return list(await asyncio.shield(pending))
+
+        VERDICT_CACHE.inc(result="miss")
+
+        future = self._pending[fingerprint] = asyncio.get_running_loop().create_future()
+        try:
+            keys = await compute()
+            await self.put(fingerprint, keys)
+            future.set_result(keys)
+            return list(keys)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._pending[fingerprint]
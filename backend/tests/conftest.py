@@ -0,0 +1,72 @@
+import asyncio
+import json
+import random
+
+import httpx
+import pytest
+
+from upguardian_backend.db import UpGuardianSQLiteDB, migrate
+from upguardian_backend.pool import PoolConfig, SQLitePool
+from upguardian_backend.replay import ReplayEngine
+
+
+class FakeTargets:
+    """httpx MockTransport handler standing in for a service's old and new
+    endpoint.
+
+    Every call answers `{"path": ..., "status": "ok"}` after a random delay
+    of up to `delay` seconds, except that paths in `removed` lose `status` on the new endpoint
+    (a breaking change). Records the calls made and the peak number in flight per host.
+    """
+
+    def __init__(self):
+        self.removed: set[str] = set()
+        self.delay = 0.005
+        self.calls: list[tuple[str, str, str]] = []
+        self.peak: dict[str, int] = {}
+        self._in_flight: dict[str, int] = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        host, path = request.url.host, request.url.path
+        self.calls.append((host, request.method, path))
+        self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self._in_flight[host])
+        try:
+            await asyncio.sleep(random.uniform(0, self.delay))
+            body = {"path": path}
+            if host == "old.test" or path not in self.removed:
+                body["status"] = "ok"
+            # streamed like a real response, so it can be read only once
+            return httpx.Response(200, headers={"content-type": "application/json"}, content=_chunks(body))
+        finally:
+            self._in_flight[host] -= 1
+
+
+async def _chunks(body: dict):
+    yield json.dumps(body).encode()
+
+
+@pytest.fixture
+def targets() -> FakeTargets:
+    return FakeTargets()
+
+
+@pytest.fixture
+def make_engine(targets):
+    """ReplayEngine factory whose calls all go to `targets`."""
+
+    def _make(**limits) -> ReplayEngine:
+        engine = ReplayEngine(**limits)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(targets))
+        engine.transports.client = lambda url: client
+        return engine
+
+    return _make
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = SQLitePool(PoolConfig(path=str(tmp_path / "test.db"), readers=2))
+    pool.write_sync(migrate)
+    yield UpGuardianSQLiteDB(pool)
+    pool.close()
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from upguardian_backend import bulk
+from upguardian_backend.bulk import HarDecoder, NdjsonDecoder, har_row, ndjson_row
+from upguardian_backend.service import ServiceRow
+
+SERVICE = ServiceRow(id=1, profile=None, name="svc", old_endpoint="http://old.test/api", new_endpoint="http://new.test")
+
+
+def _entry(i: int) -> dict:
+    return {"request": {"method": "post", "url": f"http://old.test/api/items/{i}", "postData": {"text": '{"a": "[}"}'}}}
+
+
+def _har(entries: list) -> str:
+    return json.dumps({"log": {"version": "1.2", "creator": {"name": "x"}, "entries": entries}}, indent=2)
+
+
+def _feed(decoder, text: str, size: int) -> list:
+    items = []
+    for start in range(0, len(text), size):
+        items += decoder.feed(text[start:start + size])
+    return items + decoder.close()
+
+
+@pytest.mark.parametrize("size", [1, 5, 64, 1_000_000])
+def test_har_entries_decode_for_any_chunking(size):
+    entries = [_entry(i) for i in range(10)]
+    assert _feed(HarDecoder(), _har(entries), size) == list(enumerate(entries, 1))
+
+
+def test_har_malformed_entry_is_skipped():
+    text = _har([_entry(0)]).replace("]\n  }", ', {"request": tru}, ' + json.dumps(_entry(1)) + "]\n  }")
+    items = _feed(HarDecoder(), text, 7)
+
+    assert [n for n, _ in items] == [1, 2, 3]
+    assert isinstance(items[1][1], ValueError)
+    assert items[2][1] == _entry(1)
+
+
+def test_har_entry_too_large_stops_decoding(monkeypatch):
+    monkeypatch.setattr(bulk, "HAR_MAX_ENTRY_CHARS", 300)
+    big = {"request": {"method": "GET", "url": "http://old.test/" + "x" * 1000}}
+    items = _feed(HarDecoder(), _har([_entry(0), big, _entry(1)]), 16)
+
+    assert items[0] == (1, _entry(0))
+    assert len(items) == 2
+    assert "exceeds 300 characters" in str(items[1][1])
+
+
+def test_har_without_entries_is_reported():
+    items = _feed(HarDecoder(), '{"log": {}}', 4)
+    assert len(items) == 1 and isinstance(items[0][1], ValueError)
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_ndjson_lines_keep_their_numbers(size):
+    text = '{"a": 1}\n\n  \n[2]\nnot json\n"last"'
+    items = _feed(NdjsonDecoder(), text, size)
+
+    assert [n for n, _ in items] == [1, 4, 5, 6]
+    assert items[0][1] == {"a": 1} and items[1][1] == [2] and items[3][1] == "last"
+    assert isinstance(items[2][1], ValueError)
+
+
+def test_ndjson_line_too_long_is_dropped(monkeypatch):
+    monkeypatch.setattr(bulk, "NDJSON_MAX_LINE_CHARS", 20)
+    text = '{"a": 1}\n"' + "x" * 100 + '"\n{"b": 2}\n'
+    items = _feed(NdjsonDecoder(), text, 8)
+
+    assert items[0] == (1, {"a": 1})
+    assert isinstance(items[1][1], ValueError) and items[1][0] == 2
+    assert items[2] == (3, {"b": 2})
+    assert len(items) == 3
+
+
+def test_ndjson_row():
+    assert ndjson_row({"endpoint": "/a", "method": "post", "body": {"x": 1}}) == ("/a", "POST", '{"x": 1}')
+    assert ndjson_row({"endpoint": "/a", "method": "GET"}) == ("/a", "GET", None)
+    for item in ([], {"endpoint": "/a"}, {"endpoint": 1, "method": "GET"}):
+        with pytest.raises(ValueError):
+            ndjson_row(item)
+
+
+def test_har_row():
+    assert har_row(_entry(3), SERVICE) == ("/items/3", "POST", '{"a": "[}"}')
+    assert har_row({"request": {"method": "GET", "url": "http://other.test/x?q=1"}}, SERVICE) == ("/x?q=1", "GET", None)
+    for entry in (
+        None,
+        {"request": []},
+        {"request": {"method": "GET", "url": 5}},
+        {"request": {"method": "GET", "url": "http://x", "postData": "text"}},
+        {"request": {"method": "GET", "url": "http://x", "postData": {"text": 5}}},
+    ):
+        with pytest.raises(ValueError):
+            har_row(entry, SERVICE)
@@ -0,0 +1,58 @@
+from upguardian_backend.diff import DiffRules, diff_json, json_equal
+
+
+def test_equal_values_have_no_diff():
+    value = {"a": [1, {"b": None}], "c": "x"}
+    assert diff_json(value, {"c": "x", "a": [1, {"b": None}]}).equal
+
+
+def test_changes_are_grouped_by_kind():
+    old = {"id": 1, "name": "a", "tags": ["x"], "gone": True}
+    new = {"id": "1", "name": "b", "tags": ["x"], "extra": 2}
+    diff = diff_json(old, new)
+
+    assert diff.type_changed == {"$.id": ["number", "string"]}
+    assert diff.value_changed == ["$.name"]
+    assert diff.removed == ["$.gone"]
+    assert diff.added == ["$.extra"]
+    assert diff.breaking
+
+
+def test_booleans_never_equal_numbers():
+    assert not json_equal(1, True)
+    assert not json_equal({"a": [0]}, {"a": [False]})
+    assert json_equal(1, 1.0)
+    assert diff_json({"a": 1}, {"a": True}).type_changed == {"$.a": ["number", "boolean"]}
+
+
+def test_array_length_change_is_a_value_change():
+    diff = diff_json({"items": [1, 2]}, {"items": [1, 3, 4]})
+    assert diff.value_changed == ["$.items[1]", "$.items"]
+    assert not diff.breaking
+
+
+def test_ignored_paths_and_volatile_values():
+    rules = DiffRules(ignore_paths=["*.created_at"])
+    old = {"user": {"created_at": 1}, "id": "0b9e6a2c-59c1-4c1e-9f8e-6f1b2a3c4d5e", "at": "2024-01-01T00:00:00Z"}
+    new = {"user": {"created_at": 2}, "id": "5f0c1d2e-3a4b-4c5d-8e9f-0a1b2c3d4e5f", "at": "2024-06-01T12:30:00Z"}
+    diff = diff_json(old, new, rules)
+
+    assert diff.equal
+    assert sorted(diff.ignored) == ["$.at", "$.id", "$.user.created_at"]
+
+
+def test_verdict():
+    allow, strict = DiffRules(), DiffRules(allow_added=False)
+
+    assert diff_json({"a": 1}, {"a": 1, "b": 2}).verdict(allow) is True
+    assert diff_json({"a": 1}, {"a": 1, "b": 2}, strict).verdict(strict) is False
+    assert diff_json({"a": 1, "b": 2}, {"a": 1}).verdict(allow) is False
+    # only the model can tell whether a changed value matters
+    assert diff_json({"a": 1}, {"a": 2}).verdict(allow) is None
+
+
+def test_fingerprint_ignores_values_and_indices():
+    first = diff_json({"items": [{"n": 1}]}, {"items": [{"n": 2}]})
+    second = diff_json({"items": [{"n": 5}, {"n": 1}]}, {"items": [{"n": 5}, {"n": 9}]})
+    assert first.fingerprint() == second.fingerprint()
+    assert first.fingerprint() != diff_json({"n": 1}, {"n": 2}).fingerprint()
@@ -0,0 +1,43 @@
+import asyncio
+
+from upguardian_backend.request import RequestRow
+from upguardian_backend.runner import changed_requests, run_service
+
+
+def test_changed_requests_keeps_new_edited_and_failing():
+    rows = [RequestRow(id=i, service=1, endpoint=f"/{i}", method="GET", body=None) for i in range(1, 5)]
+    last = {
+        1: (rows[0].content_hash(), True),
+        2: (rows[1].content_hash(), False),
+        3: ("stale", True),
+    }
+    assert [r.id for r in changed_requests(rows, last)] == [2, 3, 4]
+
+
+def test_incremental_runs_replay_only_what_changed(db, make_engine, targets):
+    targets.removed.add("/items/2")
+    engine = make_engine()
+
+    async def _runs():
+        created = await db.createService("p", "svc", "http://old.test", "http://new.test")
+        await db.insert_requests(created.id, [(f"/items/{i}", "GET", None) for i in range(5)])
+        service = await db.load_service(created.id)
+        ids = [r.id for r in await db.load_requests(service.id)]
+
+        first = await run_service(db, engine, service, incremental=True)
+        assert first.total == 5 and not first.unchanged_requests
+        assert [o.request.id for o in first.outcomes if not o.passed] == [ids[2]]
+
+        second = await run_service(db, engine, service, incremental=True)
+        assert [o.request.id for o in second.outcomes] == [ids[2]]
+        assert sorted(r.id for r in second.unchanged_requests) == [i for i in ids if i != ids[2]]
+
+        request = await db.get_request(ids[0])
+        await request.set_body('{"edited": true}')
+        third = await run_service(db, engine, service, incremental=True)
+        assert sorted(o.request.id for o in third.outcomes) == [ids[0], ids[2]]
+
+        full = await run_service(db, engine, service)
+        assert full.total == 5 and not full.unchanged_requests
+
+    asyncio.run(_runs())
@@ -0,0 +1,51 @@
+import asyncio
+
+from upguardian_backend.jobs import CANCELLED, COMPLETED, RUNNING, JobScheduler
+
+
+async def _service(db, count: int) -> int:
+    service = await db.createService("p", "svc", "http://old.test", "http://new.test")
+    await db.insert_requests(service.id, [(f"/items/{i}", "GET", None) for i in range(count)])
+    return service.id
+
+
+async def _wait(job, status: str) -> None:
+    for _ in range(500):
+        if job.status == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job stayed {job.status}")
+
+
+def test_job_runs_to_completion(db, make_engine):
+    async def _run():
+        scheduler = JobScheduler(db, make_engine(), workers=1)
+        job = scheduler.submit(await _service(db, 5))
+        await _wait(job, COMPLETED)
+        await scheduler.aclose()
+        return job
+
+    job = asyncio.run(_run())
+    assert (job.done, job.passed, job.total) == (5, 5, 5)
+
+
+def test_cancel_running_and_queued_jobs(db, make_engine, targets):
+    targets.delay = 0.5
+
+    async def _run():
+        scheduler = JobScheduler(db, make_engine(), workers=1)
+        service_id = await _service(db, 20)
+        running, queued = scheduler.submit(service_id), scheduler.submit(service_id)
+        await _wait(running, RUNNING)
+
+        assert scheduler.cancel(queued.id)
+        assert scheduler.cancel(running.id)
+        await _wait(running, CANCELLED)
+        assert not scheduler.cancel(running.id)
+        await scheduler.aclose()
+        return running, queued
+
+    running, queued = asyncio.run(_run())
+    assert running.status == queued.status == CANCELLED
+    assert queued.started_at is None
+    assert running.done < 20
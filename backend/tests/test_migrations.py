@@ -0,0 +1,71 @@
+import sqlite3
+
+from upguardian_backend.db import SCHEMA_VERSION, migrate
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def _names(conn: sqlite3.Connection, kind: str) -> set[str]:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def _version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_migrate_from_empty_to_latest():
+    conn = _connect()
+    with conn:
+        assert migrate(conn) == SCHEMA_VERSION
+
+    assert _version(conn) == SCHEMA_VERSION
+    assert {"services", "requests", "verdicts", "runs", "run_results", "bodies", "request_verdicts", "schemas"} <= (
+        _names(conn, "table")
+    )
+    assert {"idx_requests_listing", "idx_requests_method", "idx_requests_endpoint"} <= _names(conn, "index")
+
+
+def test_migrate_again_does_nothing():
+    conn = _connect()
+    with conn:
+        migrate(conn)
+    schema = conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    with conn:
+        assert migrate(conn) == SCHEMA_VERSION
+
+    assert conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+def test_migrate_keeps_data_of_an_old_schema():
+    conn = _connect()
+    with conn:
+        assert migrate(conn, target=1) == 1
+        conn.execute("INSERT INTO services(id, profile, name, old_endpoint, new_endpoint) VALUES(1, 'p', 's', '', '')")
+        conn.execute("INSERT INTO requests(service, endpoint, method, body) VALUES(1, '/a', 'GET', NULL)")
+    with conn:
+        migrate(conn)
+
+    assert _version(conn) == SCHEMA_VERSION
+    assert conn.execute("SELECT service, endpoint, method, skipped FROM requests").fetchall() == [(1, "/a", "GET", 0)]
+
+
+def test_deleting_a_service_cascades():
+    conn = _connect()
+    with conn:
+        migrate(conn)
+        conn.execute("INSERT INTO services(id, profile, name, old_endpoint, new_endpoint) VALUES(1, 'p', 's', '', '')")
+        conn.execute("INSERT INTO requests(id, service, endpoint, method) VALUES(1, 1, '/a', 'GET')")
+        conn.execute("INSERT INTO runs(id, service, status, started_at, total) VALUES(1, 1, 'completed', 0, 1)")
+        conn.execute("INSERT INTO run_results(run, idx, request, passed) VALUES(1, 0, 1, 1)")
+        conn.execute(
+            "INSERT INTO request_verdicts(request, pair, content_hash, passed, run) VALUES(1, 'pair', 'hash', 1, 1)"
+        )
+    with conn:
+        conn.execute("DELETE FROM services WHERE id = 1")
+
+    for table in ("requests", "runs", "run_results", "request_verdicts"):
+        assert conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] == 0, table
@@ -0,0 +1,44 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from upguardian_backend.pool import PoolConfig, SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(PoolConfig(path=str(tmp_path / "pool.db"), readers=3))
+    pool.write_sync(lambda conn: conn.execute("CREATE TABLE items(id INTEGER PRIMARY KEY, name TEXT UNIQUE)"))
+    yield pool
+    pool.close()
+
+
+def _count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT count(*) FROM items").fetchone()[0]
+
+
+def test_database_is_in_wal_mode(pool):
+    assert pool.read_sync(lambda conn: conn.execute("PRAGMA journal_mode").fetchone()[0]) == "wal"
+
+
+def test_failing_write_does_not_roll_back_its_batch(pool):
+    def _insert(name):
+        return lambda conn: conn.execute("INSERT INTO items(name) VALUES(?)", (name,)).lastrowid
+
+    futures = [pool.submit_write(_insert(name)) for name in ("a", "b", "a", "c")]
+
+    assert isinstance(futures[2].exception(), sqlite3.IntegrityError)
+    assert [f.result() for f in (futures[0], futures[1], futures[3])] == [1, 2, 3]
+    assert pool.read_sync(_count) == 3
+
+
+def test_reads_run_concurrently_and_see_committed_writes(pool):
+    async def _run():
+        await asyncio.gather(*(
+            pool.write(lambda conn, i=i: conn.execute("INSERT INTO items(name) VALUES(?)", (f"n{i}",)))
+            for i in range(20)
+        ))
+        return await asyncio.gather(*(pool.read(_count) for _ in range(10)))
+
+    assert asyncio.run(_run()) == [20] * 10
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from upguardian_backend.request import RequestRow
+
+
+def _requests(count: int, method: str = "GET") -> list[RequestRow]:
+    return [RequestRow(id=i + 1, service=1, endpoint=f"/items/{i}", method=method, body=None) for i in range(count)]
+
+
+def _replay(engine, requests, **kwargs) -> list:
+    async def _collect():
+        return [result async for result in engine.stream(1, "http://old.test", "http://new.test", requests, **kwargs)]
+
+    return asyncio.run(_collect())
+
+
+def test_stream_yields_every_request_once(make_engine):
+    requests = _requests(25)
+    results = _replay(make_engine(), requests)
+
+    assert sorted(r.index for r in results) == list(range(25))
+    for result in results:
+        request = requests[result.index]
+        assert result.request_id == request.id
+        assert result.error is None
+        assert result.response1 == {"path": request.endpoint, "status": "ok"}
+        assert result.identical
+
+
+def test_service_limit_bounds_requests_in_flight(make_engine, targets):
+    _replay(make_engine(service_concurrency=3), _requests(30))
+
+    assert targets.peak == {"old.test": 3, "new.test": 3}
+
+
+def test_concurrency_override_applies_to_one_call_only(make_engine, targets):
+    engine = make_engine(service_concurrency=4)
+    _replay(engine, _requests(30), concurrency=2)
+    assert targets.peak == {"old.test": 2, "new.test": 2}
+
+    targets.peak.clear()
+    _replay(engine, _requests(30))
+    assert targets.peak == {"old.test": 4, "new.test": 4}
+
+
+def test_host_limit_bounds_calls_per_origin(make_engine, targets):
+    _replay(make_engine(host_concurrency=2, service_concurrency=10), _requests(30))
+
+    assert targets.peak == {"old.test": 2, "new.test": 2}
+
+
+def test_concurrency_below_one_is_rejected(make_engine):
+    with pytest.raises(ValueError):
+        _replay(make_engine(), _requests(3), concurrency=0)
+
+
+def test_samples_repeat_only_safe_methods(make_engine, targets):
+    requests = _requests(2) + [RequestRow(id=3, service=1, endpoint="/items", method="POST", body="{}")]
+    results = {r.index: r for r in _replay(make_engine(), requests, samples=3)}
+
+    assert [len(results[i].samples1) for i in range(3)] == [3, 3, 1]
+    assert sum(1 for host, method, _ in targets.calls if method == "POST") == 2
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+from upguardian_backend.diff import DiffRules, diff_json
+from upguardian_backend.streamdiff import JsonArrayDecoder, compare_arrays
+
+ITEMS = [{"id": i, "name": f"item {i}", "price": 1.5e3 + i, "tags": ["a", "b"] * (i % 3)} for i in range(40)] + [
+    -12345678901234,
+    "tail",
+]
+
+
+def _decode(text: str, size: int) -> list:
+    decoder, items = JsonArrayDecoder(), []
+    for start in range(0, len(text), size):
+        items += decoder.feed(text[start:start + size])
+    return items + decoder.close()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100_000])
+def test_decoder_matches_json_loads_for_any_chunking(size):
+    text = json.dumps(ITEMS, indent=1)
+    assert _decode(text, size) == json.loads(text)
+
+
+def test_number_split_across_chunks_is_not_cut_short():
+    decoder = JsonArrayDecoder()
+    assert decoder.feed("[12") == []
+    assert decoder.feed("34, 5") == [1234]
+    assert decoder.feed("6]") == [56]
+    assert decoder.close() == []
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', "[1 2]", "[1, 2", "[1] [2]", '[{"a": }]'])
+def test_decoder_rejects_anything_but_one_array(text):
+    with pytest.raises(ValueError):
+        _decode(text, 2)
+
+
+async def _body(value, size: int = 5):
+    data = json.dumps(value).encode()
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _compare(old, new, rules=None, **kwargs):
+    return asyncio.run(compare_arrays(_body(old), _body(new), rules or DiffRules(), **kwargs))
+
+
+def test_compare_arrays_reports_the_paths_diff_json_does():
+    old = [{"id": 1, "name": "a"}, {"id": 2, "gone": True}, {"id": 3}]
+    new = [{"id": 1, "name": "b"}, {"id": "2"}, {"id": 3, "extra": None}, {"id": 4}]
+    result = _compare(old, new)
+    whole = diff_json(old, new)
+
+    assert result.items == 3
+    assert not result.truncated
+    assert result.diff.value_changed == whole.value_changed
+    assert result.diff.type_changed == whole.type_changed
+    assert result.diff.removed == whole.removed
+    assert result.diff.added == whole.added
+    assert result.size1 == len(json.dumps(old))
+
+
+def test_compare_arrays_stops_after_max_diffs():
+    old = [{"id": i, "status": "ok"} for i in range(50)]
+    new = [{"id": i} for i in range(50)]
+    result = _compare(old, new, max_diffs=3)
+
+    assert result.truncated
+    assert result.items == 3
+    assert result.diff.removed == ["$[0].status", "$[1].status", "$[2].status"]
+
+
+def test_compare_arrays_rejects_a_non_array_body():
+    with pytest.raises(ValueError):
+        _compare([1], {"not": "an array"})